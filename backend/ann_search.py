@@ -0,0 +1,228 @@
+# backend/ann_search.py
+import os
+import numpy as np
+
+ASSIGN_CHUNK = 65536
+
+
+def top_k_rows(scores, k):
+    """
+    Return the indices of the k highest scores, best first.
+    Ties keep index order so results are deterministic.
+    """
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.zeros(0, dtype=np.int64)
+    if k >= scores.shape[0]:
+        return np.argsort(-scores, kind="stable")
+    rows = np.argpartition(-scores, k - 1)[:k]
+    return rows[np.lexsort((rows, -scores[rows]))]
+
+
+class ExactSearch:
+    """Brute-force search: every indexed book is a candidate."""
+
+    name = "exact"
+
+    def fit(self, embeddings, has_embedding):
+        pass
+
+    def update(self, row, vector):
+        pass
+
+    def remove(self, row, last):
+        pass
+
+    def needs_refit(self, embedded_count):
+        return False
+
+    def candidates(self, embeddings, query, exclude_rows):
+        """Return (rows, similarities) for every row that is not excluded."""
+        sims = embeddings @ query
+        keep = np.ones(sims.shape[0], dtype=bool)
+        keep[exclude_rows] = False
+        rows = np.flatnonzero(keep)
+        return rows, sims[rows]
+
+
+class IVFSearch:
+    name = "ivf"
+
+    def __init__(
+        self,
+        nlist=None,
+        nprobe=8,
+        candidate_pool=1000,
+        kmeans_iters=8,
+        train_size=65536,
+        min_size=5000,
+        refit_growth=2.0,
+        seed=0,
+    ):
+        """
+        Inverted-file approximate search over unit-length embeddings.
+
+        Books are clustered with spherical k-means; a query only scans the
+        books in its `nprobe` closest clusters and re-ranks them exactly,
+        keeping the best `candidate_pool`. Raising `nprobe` trades latency for
+        recall. Catalogs smaller than `min_size` fall back to exact search.
+
+        Books added later join their closest existing cluster, so the
+        centroids drift from the data as the catalog grows. Once the embedded
+        books reach `refit_growth` times the number the centroids were fit
+        on, the owning BookIndex refits them, which costs one k-means run
+        under the index lock. A catalog that started below `min_size` is
+        clustered once it reaches it. refit_growth=0 disables both.
+        """
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.candidate_pool = candidate_pool
+        self.kmeans_iters = kmeans_iters
+        self.train_size = train_size
+        self.min_size = min_size
+        self.refit_growth = refit_growth
+        self.fit_size = 0
+        self.rng = np.random.default_rng(seed)
+        self.exact = ExactSearch()
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self.members = []
+        self._lists = []
+
+    def _assign(self, vectors, rows=None):
+        """Index of the closest centroid for each vector, computed in chunks."""
+        rows = np.arange(vectors.shape[0]) if rows is None else rows
+        out = np.empty(rows.shape[0], dtype=np.int32)
+        for start in range(0, rows.shape[0], ASSIGN_CHUNK):
+            chunk = vectors[rows[start : start + ASSIGN_CHUNK]]
+            out[start : start + ASSIGN_CHUNK] = np.argmax(chunk @ self.centroids.T, 1)
+        return out
+
+    def _train(self, vectors, nlist):
+        """Spherical k-means on a sample of the embedded books."""
+        init = self.rng.choice(vectors.shape[0], nlist, replace=False)
+        self.centroids = np.array(vectors[init], dtype=np.float32)
+
+        for _ in range(self.kmeans_iters):
+            labels = self._assign(vectors)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, labels, vectors)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            if empty.any():
+                refill = self.rng.choice(vectors.shape[0], int(empty.sum()))
+                sums[empty] = vectors[refill]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            self.centroids = (sums / norms).astype(np.float32)
+
+    def fit(self, embeddings, has_embedding):
+        embedded_rows = np.flatnonzero(has_embedding)
+        self.centroids = None
+        self.assignments = np.full(embeddings.shape[0], -1, dtype=np.int32)
+        self.fit_size = embedded_rows.size
+        if embedded_rows.size < self.min_size:
+            return
+
+        nlist = self.nlist or int(4 * np.sqrt(embedded_rows.size))
+        nlist = max(1, min(nlist, embedded_rows.size))
+        sample = embedded_rows
+        if sample.size > self.train_size:
+            sample = self.rng.choice(embedded_rows, self.train_size, replace=False)
+        self._train(embeddings[sample], nlist)
+        self.assignments[embedded_rows] = self._assign(embeddings, embedded_rows)
+        self.members = [set() for _ in range(nlist)]
+        for row, cluster in zip(embedded_rows, self.assignments[embedded_rows]):
+            self.members[cluster].add(int(row))
+        self._lists = [None] * nlist
+
+    def _set_assignment(self, row, cluster):
+        if row >= self.assignments.shape[0]:
+            grown = np.full(max(16, 2 * (row + 1)), -1, dtype=np.int32)
+            grown[: self.assignments.shape[0]] = self.assignments
+            self.assignments = grown
+        previous = self.assignments[row]
+        if previous >= 0:
+            self.members[previous].discard(row)
+            self._lists[previous] = None
+        self.assignments[row] = cluster
+        if cluster >= 0:
+            self.members[cluster].add(row)
+            self._lists[cluster] = None
+
+    def update(self, row, vector):
+        """Place a new or changed row into its closest cluster."""
+        if self.centroids is None:
+            return
+        cluster = -1 if vector is None else int(np.argmax(self.centroids @ vector))
+        self._set_assignment(row, cluster)
+
+    def remove(self, row, last):
+        """Mirror BookIndex.remove, which moves the last row into `row`."""
+        if self.centroids is None:
+            return
+        moved = self.assignments[last]
+        self._set_assignment(last, -1)
+        if row != last:
+            self._set_assignment(row, moved)
+
+    def needs_refit(self, embedded_count):
+        """
+        True once the catalog has grown past what the centroids were fit
+        on, or has reached min_size after starting too small to cluster.
+        """
+        if not self.refit_growth or embedded_count < self.min_size:
+            return False
+        if self.centroids is None:
+            return True
+        return embedded_count >= self.refit_growth * self.fit_size
+
+    def _cluster_rows(self, cluster):
+        if self._lists[cluster] is None:
+            self._lists[cluster] = np.fromiter(
+                self.members[cluster], dtype=np.int64, count=len(self.members[cluster])
+            )
+        return self._lists[cluster]
+
+    def candidates(self, embeddings, query, exclude_rows):
+        """Return (rows, similarities) for the best candidates of the probed lists."""
+        if self.centroids is None:
+            return self.exact.candidates(embeddings, query, exclude_rows)
+
+        nprobe = min(self.nprobe, self.centroids.shape[0])
+        probes = top_k_rows(self.centroids @ query, nprobe)
+        rows = np.concatenate([self._cluster_rows(c) for c in probes])
+        if exclude_rows.size:
+            rows = rows[~np.isin(rows, exclude_rows)]
+        if rows.size == 0:
+            return self.exact.candidates(embeddings, query, exclude_rows)
+
+        sims = embeddings[rows] @ query
+        best = top_k_rows(sims, self.candidate_pool)
+        return rows[best], sims[best]
+
+
+SEARCH_ENGINES = {"exact": ExactSearch, "ivf": IVFSearch}
+
+
+def make_search_engine(name=None):
+    """
+    Build the recommender search engine from configuration.
+
+    REC_SEARCH_ENGINE picks "exact" (default) or "ivf". The IVF knobs are
+    REC_IVF_NLIST, REC_IVF_NPROBE, REC_IVF_CANDIDATES, and
+    REC_IVF_REFIT_GROWTH.
+    """
+    name = (name or os.getenv("REC_SEARCH_ENGINE", "exact")).lower()
+    if name not in SEARCH_ENGINES:
+        print(f"Unknown search engine '{name}', falling back to exact search.")
+        name = "exact"
+    if name == "ivf":
+        nlist = os.getenv("REC_IVF_NLIST")
+        return IVFSearch(
+            nlist=int(nlist) if nlist else None,
+            nprobe=int(os.getenv("REC_IVF_NPROBE", 8)),
+            candidate_pool=int(os.getenv("REC_IVF_CANDIDATES", 1000)),
+            refit_growth=float(os.getenv("REC_IVF_REFIT_GROWTH", 2)),
+        )
+    return ExactSearch()
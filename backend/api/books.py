@@ -1,9 +1,23 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
 from database import collections
+from models.books import BOOK_PROJECTIONS, read_books_by_ids
+from search_index import get_search_index, ranked_search
 
 books_bp = Blueprint("books", __name__)
-CORS(books_bp)
+CORS(books_bp, expose_headers=["X-Total-Count"])
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+def _books_by_ids(book_ids):
+    """Detail documents for ranked ids, in rank order, missing ones skipped."""
+    return [
+        {**book, "_id": str(book["_id"])}
+        for book in read_books_by_ids(book_ids, "detail")
+        if book is not None
+    ]
 
 
 @books_bp.route("/books", methods=["GET"])
@@ -12,13 +26,44 @@ def search_books():
     Search for books in the database.
 
     - `query`: The search term (Required).
-    - `type`: Search by "title", "author", "isbn", or "any" (Optional, default: "any").
+    - `type`: Search by "title", "author", "isbn", or "any" (Optional, default: "any"),
+      or by meaning with "semantic", or "hybrid" to blend both rankings.
+    - `page`, `per_page`: 1-based page and page size (Optional, default: 1 and 50).
+
+    Results are ranked by the in-process search index when the catalog cache
+    is running, otherwise matched with a regex in MongoDB. Semantic results
+    come from the book embedding index. Either way the body is a list of
+    books; X-Total-Count holds the number of matches when known.
     """
     query = request.args.get("query", "").strip()
     search_type = request.args.get("type", "any").lower()
+    page = request.args.get("page", default=1, type=int)
+    per_page = request.args.get("per_page", default=DEFAULT_PAGE_SIZE, type=int)
 
     if not query:
         return jsonify({"error": "Query parameter is required"}), 400
+    if page < 1 or not 1 <= per_page <= MAX_PAGE_SIZE:
+        return (
+            jsonify({"error": f"page must be >= 1 and per_page 1-{MAX_PAGE_SIZE}"}),
+            400,
+        )
+
+    offset = (page - 1) * per_page
+    search_index = get_search_index()
+    ranked = None
+    if search_type in ["semantic", "hybrid"]:
+        ranked = ranked_search(query, search_type, search_index, offset, per_page)
+        if ranked is None:
+            return jsonify({"error": "Semantic search is unavailable"}), 503
+    elif search_index is not None:
+        ranked = search_index.search(query, search_type, offset, per_page)
+
+    if ranked is not None:
+        total, book_ids = ranked
+        books = _books_by_ids(book_ids)
+        if not books:
+            return jsonify({"error": "No books found"}), 404
+        return jsonify(books), 200, {"X-Total-Count": str(total)}
 
     filters = []
     search_term = query.lower()
@@ -32,7 +77,12 @@ def search_books():
 
     query_filter = {"$or": filters} if filters else {}
 
-    books_cursor = collections["Books"].find(query_filter).limit(50)
+    books_cursor = (
+        collections["Books"]
+        .find(query_filter, BOOK_PROJECTIONS["detail"])
+        .skip(offset)
+        .limit(per_page)
+    )
     books = [{**book, "_id": str(book["_id"])} for book in books_cursor]
 
     if not books:
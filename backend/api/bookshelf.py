@@ -1,5 +1,6 @@
 from datetime import datetime
-from models.books import read_book_by_bookId
+from models.books import read_books_by_ids
+from shelf_events import publish_shelf_event
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
 from bson import ObjectId
@@ -9,6 +10,7 @@ from models.user_bookshelf import (
     create_user_bookshelf,
     delete_user_bookshelf,
     get_bookshelf_status,
+    get_bookshelf_with_books,
     get_currently_reading_books,
     get_page_number,
     get_read_books,
@@ -29,6 +31,38 @@ def objectid_to_str(obj):
     raise TypeError(f"Object of type {type(obj).__name__} is not ObjectId")
 
 
+def book_response(book):
+    """A book document with its ObjectIds turned into strings for jsonify."""
+    return {
+        key: objectid_to_str(value) if isinstance(value, ObjectId) else value
+        for key, value in book.items()
+    }
+
+
+def read_shelf_books(entries, projection="card"):
+    """The book behind each bookshelf entry (None if missing), in one read."""
+    return read_books_by_ids([entry["book_id"] for entry in entries], projection)
+
+
+def record_shelf_change(user_id, book_id, old_entry, new_entry):
+    """Queue a successful bookshelf write for the profile worker."""
+    try:
+        publish_shelf_event(user_id, book_id, old_entry, new_entry)
+    except Exception as e:
+        print("Error publishing shelf event:", e)
+
+
+def shelf_change_recorder(user_id, book_id):
+    """
+    An on_change callback for the bookshelf writes. They pass the entry as
+    the write replaced it, so the profile delta is never computed against a
+    stale read.
+    """
+    return lambda old_entry, new_entry: record_shelf_change(
+        user_id, book_id, old_entry, new_entry
+    )
+
+
 def parse_date(date_val):
     central = pytz.timezone("US/Central")
     if isinstance(date_val, datetime):
@@ -78,14 +112,11 @@ def get_last_read_book(user_id):
                 rating = books_with_finish_date[0].get("rating", "mid")
 
                 # Fetch the full book details
-                b = read_book_by_bookId(last_read_book["book_id"])
+                b = read_shelf_books([last_read_book], "detail")[0]
+                if b is None:
+                    return jsonify({"error": "Book not found."}), 404
                 b["rating"] = rating
-                b = {
-                    key: (
-                        objectid_to_str(value) if isinstance(value, ObjectId) else value
-                    )
-                    for key, value in b.items()
-                }
+                b = book_response(b)
 
                 print("book rating:", b["rating"])
 
@@ -108,20 +139,13 @@ def get_read_books_api(user_id):
         books = get_read_books(user_id)
         if isinstance(books, list):
             books_read = list()
-            for book in books:
-                b = read_book_by_bookId(book["book_id"])
-                if isinstance(b, str):
-                    print("Error with retrieving book: ", b)
+            for book, b in zip(books, read_shelf_books(books)):
+                if b is None:
+                    print("Error with retrieving book: ", book["book_id"])
                     continue
                 rating = book.get("rating", "mid")
                 b["rating"] = rating
-                b = {
-                    key: (
-                        objectid_to_str(value) if isinstance(value, ObjectId) else value
-                    )
-                    for key, value in b.items()
-                }
-                books_read.append(b)
+                books_read.append(book_response(b))
             # print(len(books_read))
             return jsonify(books_read), 200
         else:
@@ -139,16 +163,9 @@ def get_unread_books_api(user_id):
     try:
         books = get_unread_books(user_id)
         if isinstance(books, list):
-            books_to_read = list()
-            for book in books:
-                b = read_book_by_bookId(book["book_id"])
-                b = {
-                    key: (
-                        objectid_to_str(value) if isinstance(value, ObjectId) else value
-                    )
-                    for key, value in b.items()
-                }
-                books_to_read.append(b)
+            books_to_read = [
+                book_response(b) for b in read_shelf_books(books) if b is not None
+            ]
             return jsonify(books_to_read), 200
         else:
             return jsonify({"error": books}), 400
@@ -165,12 +182,10 @@ def get_currently_reading_books_api(user_id):
     try:
         books = get_currently_reading_books(user_id)
         if books:
-            book = read_book_by_bookId(books[0]["book_id"])
-            book = {
-                key: objectid_to_str(value) if isinstance(value, ObjectId) else value
-                for key, value in book.items()
-            }
-            return jsonify(book), 200
+            book = read_shelf_books(books[:1], "detail")[0]
+            if book is None:
+                return jsonify({"error": "Book not found."}), 404
+            return jsonify(book_response(book)), 200
 
         else:
             print(books)
@@ -180,6 +195,33 @@ def get_currently_reading_books_api(user_id):
         return jsonify({"error": str(e)}), 500
 
 
+@shelf_bp.route("/api/user/<user_id>/bookshelf", methods=["GET"])
+def get_bookshelf_api(user_id):
+    """
+    Get the "read", "to-read" and "currently-reading" shelves with their books
+    in one call. Book summaries are left out unless `include=summary`.
+    """
+    try:
+        include = request.args.get("include", "").split(",")
+        shelves = get_bookshelf_with_books(
+            user_id, include_summary="summary" in include
+        )
+        if isinstance(shelves, str):
+            return jsonify({"error": shelves}), 400
+        return (
+            jsonify(
+                {
+                    status: [book_response(book) for book in books]
+                    for status, books in shelves.items()
+                }
+            ),
+            200,
+        )
+    except Exception as e:
+        print(e)
+        return jsonify({"error": str(e)}), 500
+
+
 @shelf_bp.route("/api/user/<user_id>/bookshelf", methods=["POST"])
 def add_book_to_bookshelf(user_id):
     """
@@ -219,6 +261,9 @@ def add_book_to_bookshelf(user_id):
 
         if "Error" not in result:
             print("result:", result)
+            record_shelf_change(
+                user_id, book_id, None, {"status": status, "rating": rating}
+            )
             return jsonify({"message": "Book added to bookshelf", "id": result}), 201
         else:
             print(result)
@@ -295,6 +340,7 @@ def update_bookshelf_status(user_id, book_id):
             book_id,
             new_status,
             date_finished=date_finished,
+            on_change=shelf_change_recorder(user_id, book_id),
         )
 
         if "Error" not in result:
@@ -317,7 +363,12 @@ def rate_book_api(user_id, book_id):
         data = request.get_json()
         new_rating = data.get("rating")
 
-        result = rate_book(user_id, book_id, new_rating)
+        result = rate_book(
+            user_id,
+            book_id,
+            new_rating,
+            on_change=shelf_change_recorder(user_id, book_id),
+        )
 
         if "Error" not in result:
             return jsonify({"message": "Book rating updated."}), 200
@@ -334,7 +385,9 @@ def delete_book_from_bookshelf(user_id, book_id):
     Delete a book from the user's bookshelf.
     """
     try:
-        result = delete_user_bookshelf(user_id, book_id)
+        result = delete_user_bookshelf(
+            user_id, book_id, on_change=shelf_change_recorder(user_id, book_id)
+        )
 
         if "Error" not in result:
             return jsonify({"message": "Book deleted from bookshelf."}), 200
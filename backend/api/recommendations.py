@@ -2,7 +2,8 @@ from flask import Blueprint, jsonify, request
 from flask_cors import CORS
 from recmodel import onboarding_recommendations, recommend_books
 from bson import ObjectId
-import requests
+from auth import verify_google_token
+from models.books import project_book
 from models.users import read_user_by_email
 
 
@@ -16,6 +17,16 @@ def objectid_to_str(obj):
         return str(obj)
 
 
+def recommendations_json(user_id, recommendations):
+    """The response body for a user's recommended books."""
+    if recommendations:
+        # Only the fields a client is shown; never the embedding
+        recommendations = [project_book(book, "detail") for book in recommendations]
+        for book in recommendations:
+            book["_id"] = objectid_to_str(book["_id"])
+    return {"user_id": user_id, "recommendations": recommendations}
+
+
 @recommendation_bp.route("/api/user/<user_id>/recommendations", methods=["GET"])
 def get_book_recommendations(user_id):
     """
@@ -29,10 +40,7 @@ def get_book_recommendations(user_id):
             refresh_count = 0
         # print(refresh_count);
         recommendations = recommend_books(user_id=user_id, count=refresh_count)
-        if recommendations:
-            for book in recommendations:
-                book["_id"] = objectid_to_str(book["_id"])
-        return jsonify({"user_id": user_id, "recommendations": recommendations}), 200
+        return jsonify(recommendations_json(user_id, recommendations)), 200
     except Exception as e:
         print("Error:", e)
         return jsonify({"error": str(e)}), 500
@@ -50,13 +58,8 @@ def get_onboarding_recommendations():
 
         access_token = auth_header.split(" ")[1]
 
-        token_info_url = (
-            f"https://oauth2.googleapis.com/tokeninfo?id_token={access_token}"
-        )
-        token_info_response = requests.get(token_info_url)
-        token_info = token_info_response.json()
-
-        if "email" not in token_info:
+        token_info = verify_google_token(access_token)
+        if not token_info or "email" not in token_info:
             return jsonify({"error": "Invalid token"}), 401
 
         user = read_user_by_email(token_info["email"])
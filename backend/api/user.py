@@ -3,7 +3,7 @@ from flask_cors import CORS
 
 # from database import collections
 # from bson import ObjectId
-import requests
+from auth import verify_google_token
 
 from models.users import (
     create_user,
@@ -17,6 +17,46 @@ user_bp = Blueprint("user", __name__)
 CORS(user_bp)
 
 
+def new_user_data(token_info, access_token):
+    """create_user arguments for a first sign-in, from Google profile data."""
+    return {
+        "first_name": token_info.get("given_name", ""),
+        "last_name": token_info.get("family_name", ""),
+        "username": token_info["email"].split("@")[
+            0
+        ],  # You can use the email or generate a unique username
+        "email_address": token_info["email"],
+        "oauth": {
+            "access_token": access_token,
+            # Add additional OAuth details if necessary
+        },
+        "profile_image": token_info.get("picture", ""),
+        "interests": [],  # You can add default interests or leave it empty
+        "demographics": {},  # You can fill in demographics data or leave it empty
+    }
+
+
+def profile_json(user):
+    """The signed-in user's profile as returned by GET /profile."""
+    return {
+        "id": str(user["_id"]),  # Ensure _id is converted to string
+        "name": f"{user.get('first_name', '')} {user.get('last_name', '')}",  # Combine first and last name
+        "email": user.get("email_address", ""),
+        "profile_picture": user.get("profile_image", ""),
+        "created_at": user.get("created_at", ""),
+        "username": user.get("username", ""),
+    }
+
+
+def public_profile_json(user):
+    """What other users see of a profile."""
+    return {
+        "id": str(user["_id"]),
+        "name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
+        "profile_picture": user.get("profile_image", ""),
+    }
+
+
 @user_bp.route("/profile", methods=["GET"])
 def get_user_profile():
     """
@@ -30,14 +70,10 @@ def get_user_profile():
 
     access_token = auth_header.split(" ")[1]
 
-    # Verify token with Google OAuth
-    token_info_url = f"https://oauth2.googleapis.com/tokeninfo?id_token={access_token}"
-    token_info_response = requests.get(token_info_url)
-    token_info = token_info_response.json()
-    print("Token Info:", token_info)
-
-    if "email" not in token_info:
-        return token_info_response.json()
+    # Verify the Google ID token locally
+    token_info = verify_google_token(access_token)
+    if not token_info or "email" not in token_info:
+        return jsonify({"error": "Invalid token"}), 401
 
     # Fetch user data from database
     user = read_user_by_email(email=token_info["email"])
@@ -45,25 +81,8 @@ def get_user_profile():
         return jsonify({f'"error": "{token_info}"'}), 404
 
     if isinstance(user, str):  # User not found, create a new user
-        # Create user from Google profile data
-        new_user_data = {
-            "first_name": token_info.get("given_name", ""),
-            "last_name": token_info.get("family_name", ""),
-            "username": token_info["email"].split("@")[
-                0
-            ],  # You can use the email or generate a unique username
-            "email_address": token_info["email"],
-            "oauth": {
-                "access_token": access_token,
-                # Add additional OAuth details if necessary
-            },
-            "profile_image": token_info.get("picture", ""),
-            "interests": [],  # You can add default interests or leave it empty
-            "demographics": {},  # You can fill in demographics data or leave it empty
-        }
-
         # Create new user in the database
-        new_user_id = create_user(**new_user_data)
+        new_user_id = create_user(**new_user_data(token_info, access_token))
         if new_user_id.startswith("Error"):
             print("error:", new_user_id)
             return jsonify({"error": new_user_id}), 500
@@ -78,17 +97,7 @@ def get_user_profile():
             404,
         )  # If user creation failed or user not found
 
-    # Access user attributes properly
-    user_profile = {
-        "id": str(user["_id"]),  # Ensure _id is converted to string
-        "name": f"{user.get('first_name', '')} {user.get('last_name', '')}",  # Combine first and last name
-        "email": user.get("email_address", ""),
-        "profile_picture": user.get("profile_image", ""),
-        "created_at": user.get("created_at", ""),
-        "username": user.get("username", ""),
-    }
-
-    return jsonify(user_profile), 200
+    return jsonify(profile_json(user)), 200
 
 
 @user_bp.route("/profile/<user_id>", methods=["GET"])
@@ -100,16 +109,7 @@ def get_user_by_id(user_id):
         if not isinstance(user, dict):
             return jsonify({"error": user}), 404
 
-        return (
-            jsonify(
-                {
-                    "id": str(user["_id"]),
-                    "name": f"{user.get('first_name', '')} {user.get('last_name', '')}".strip(),
-                    "profile_picture": user.get("profile_image", ""),
-                }
-            ),
-            200,
-        )
+        return jsonify(public_profile_json(user)), 200
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -178,11 +178,8 @@ def save_genres():
 
     access_token = auth_header.split(" ")[1]
 
-    token_info_url = f"https://oauth2.googleapis.com/tokeninfo?id_token={access_token}"
-    token_info_response = requests.get(token_info_url)
-    token_info = token_info_response.json()
-
-    if "email" not in token_info:
+    token_info = verify_google_token(access_token)
+    if not token_info or "email" not in token_info:
         return jsonify({"error": "Invalid token"}), 401
 
     user = read_user_by_email(token_info["email"])
@@ -0,0 +1,301 @@
+# backend/asgi.py
+"""
+ASGI entry point: the same API, with async handlers where requests wait on
+Mongo, Redis or Google.
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT --workers 4
+
+FastAPI serves the profile and recommendation endpoints below. They read
+Redis through redis.asyncio and Mongo through PyMongo's AsyncMongoClient,
+so a worker keeps serving other requests while one waits. Every other route
+is the Flask app from main.py, mounted through a2wsgi, which runs it in a
+thread pool as gunicorn would.
+
+Google ID tokens are verified locally (auth.py). The signing keys are
+fetched with httpx when the app starts. Verification still runs in the
+thread pool, since a rotated key is refetched synchronously. The book index
+is built at startup too, off the event loop. CPU work, anything that takes
+the book index lock and writes through the sync models run in the thread
+pool. That covers ranking on a cache miss, picking books from a cached
+ranking, creating a user on first sign-in, and onboarding. The event loop
+itself only does async I/O.
+
+loadtest.py compares this against `gunicorn main:app`.
+"""
+import os
+from contextlib import asynccontextmanager
+import bson
+import httpx
+import redis.asyncio as aioredis
+from a2wsgi import WSGIMiddleware
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
+from pymongo import AsyncMongoClient
+from pymongo.server_api import ServerApi
+import auth
+from api.recommendations import recommendations_json
+from api.user import new_user_data, profile_json, public_profile_json
+from book_index import get_book_index
+from cache import (
+    CACHE_USER_SCRIPT,
+    USER_CACHE_TTL,
+    cache_user_args,
+    parse_ranked_recs,
+    ranked_recs_keys,
+    user_email_key,
+    user_generation_key,
+    user_key,
+)
+from database import DB_NAME, uri as MONGO_URI
+from main import CORS_ORIGINS, app as flask_app
+from models.users import create_user
+from mongo_id_utils import canonical_id
+from recmodel import onboarding_recommendations, recommend_books, select_recs
+from schemas import UserSchema
+
+mongo_client = AsyncMongoClient(MONGO_URI, server_api=ServerApi("1"))
+users_collection = mongo_client[DB_NAME]["Users"]
+
+redis_url = os.getenv("REDIS_URL")
+redis_client = (
+    aioredis.from_url(redis_url)
+    if redis_url
+    else aioredis.Redis(host="localhost", port=6379)
+)
+
+
+async def prefetch_google_keys():
+    try:
+        async with httpx.AsyncClient(timeout=auth.KEYS_FETCH_TIMEOUT) as client:
+            response = await client.get(auth.GOOGLE_CERTS_URL)
+            response.raise_for_status()
+        auth.load_google_keys(response.json(), response.headers)
+    except Exception as e:
+        # The first token verified fetches them instead
+        print(f"Error prefetching Google signing keys: {e}")
+
+
+async def prebuild_book_index():
+    try:
+        await run_in_threadpool(get_book_index)
+    except Exception as e:
+        # The first recommendation request builds it instead
+        print(f"Error building the book index: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await prefetch_google_keys()
+    await prebuild_book_index()
+    yield
+    await redis_client.aclose()
+    await mongo_client.close()
+
+
+# -----------------------------------------------
+# USERS (async counterpart of models.users.load_user, same Redis entries)
+# -----------------------------------------------
+async def read_cached_user(user_id):
+    try:
+        payload = await redis_client.get(user_key(user_id))
+    except Exception as e:
+        print(f"Error reading cached user: {e}")
+        return None
+    return bson.decode(payload) if payload else None
+
+
+async def user_generation(user_id):
+    try:
+        generation = await redis_client.get(user_generation_key(user_id))
+    except Exception as e:
+        print(f"Error reading user generation: {e}")
+        return None
+    return int(generation or 0)
+
+
+async def cache_user(user, generation):
+    if generation is None:
+        return
+    keys, args = cache_user_args(user, generation)
+    try:
+        await redis_client.eval(CACHE_USER_SCRIPT, len(keys), *keys, *args)
+    except Exception as e:
+        print(f"Error caching user: {e}")
+
+
+async def cache_user_id(email, user_id):
+    try:
+        await redis_client.set(user_email_key(email), str(user_id), ex=USER_CACHE_TTL)
+    except Exception as e:
+        print(f"Error caching user: {e}")
+
+
+async def load_user(user_id=None, email=None):
+    """The raw user document for an id or email address, or None."""
+    cached_id = None
+    if user_id is not None:
+        user = await read_cached_user(user_id)
+    else:
+        try:
+            cached_id = await redis_client.get(user_email_key(email))
+        except Exception as e:
+            print(f"Error reading cached user: {e}")
+        cached_id = cached_id.decode() if cached_id else None
+        user = await read_cached_user(cached_id) if cached_id else None
+        if user and user.get("email_address") != email:
+            user = None
+
+    if user is None:
+        known_id = str(user_id) if user_id is not None else cached_id
+        generation = await user_generation(known_id) if known_id else None
+        if user_id is not None:
+            user_oid = canonical_id(user_id)
+            user = (
+                await users_collection.find_one({"_id": user_oid}) if user_oid else None
+            )
+        else:
+            user = await users_collection.find_one({"email_address": email})
+        if user and str(user["_id"]) == known_id:
+            await cache_user(user, generation)
+        elif user and user_id is None:
+            await cache_user_id(email, user["_id"])
+    return user
+
+
+async def read_user(user_id=None, email=None):
+    """load_user validated like models.users.read_user, or None."""
+    user = await load_user(user_id=user_id, email=email)
+    return UserSchema(**user).model_dump(by_alias=True) if user else None
+
+
+def bearer_token(request):
+    """(token, None), or (None, error response) without a Bearer header."""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        error = {"error": "Missing or invalid Authorization header"}
+        return None, JSONResponse(error, status_code=401)
+    return auth_header.split(" ")[1], None
+
+
+def invalid_token():
+    return JSONResponse({"error": "Invalid token"}, status_code=401)
+
+
+def flask_json(data):
+    """
+    A 200 response encoded by the Flask app's JSON provider, as jsonify does,
+    so dates come out in the same (RFC 822) format from either server.
+    """
+    return Response(flask_app.json.dumps(data), media_type="application/json")
+
+
+# -----------------------------------------------
+# ROUTES (same paths and responses as the Flask blueprints)
+# -----------------------------------------------
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=CORS_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.get("/user/profile")
+async def get_user_profile(request: Request):
+    access_token, error = bearer_token(request)
+    if error:
+        return error
+    token_info = await run_in_threadpool(auth.verify_google_token, access_token)
+    if not token_info or "email" not in token_info:
+        return invalid_token()
+
+    user = await read_user(email=token_info["email"])
+    if user is None:
+        new_user_id = await run_in_threadpool(
+            create_user, **new_user_data(token_info, access_token)
+        )
+        if new_user_id.startswith("Error"):
+            print("error:", new_user_id)
+            return JSONResponse({"error": new_user_id}, status_code=500)
+        user = await read_user(email=token_info["email"])
+        if user is None:
+            return JSONResponse({"error": "User not found."}, status_code=404)
+    return flask_json(profile_json(user))
+
+
+@app.get("/user/profile/{user_id}")
+async def get_user_by_id(user_id: str):
+    try:
+        if canonical_id(user_id) is None:
+            error = "Error: Invalid ObjectId format."
+            return JSONResponse({"error": error}, status_code=404)
+        user = await read_user(user_id=user_id)
+        if user is None:
+            return JSONResponse({"error": "User not found."}, status_code=404)
+        return flask_json(public_profile_json(user))
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.get("/recs/api/user/{user_id}/recommendations")
+async def get_book_recommendations(user_id: str, request: Request):
+    try:
+        try:
+            refresh_count = int(request.query_params.get("refresh_count", 0))
+        except ValueError:
+            refresh_count = 0
+
+        try:
+            values = await redis_client.mget(*ranked_recs_keys(user_id))
+            _, ranked = parse_ranked_recs(*values)
+        except Exception as e:
+            print(f"Error reading cached recommendations: {e}")
+            ranked = None
+
+        # A cached ranking was computed after recommend_books made sure the
+        # profile exists, so only a miss needs the full sync path. Picking
+        # from it still waits on the book index lock, so not on the loop.
+        if ranked is not None:
+            recommendations = await run_in_threadpool(
+                select_recs, ranked, count=max(refresh_count, 1)
+            )
+        else:
+            recommendations = await run_in_threadpool(
+                recommend_books, user_id=user_id, count=refresh_count
+            )
+        return flask_json(recommendations_json(user_id, recommendations))
+    except Exception as e:
+        print("Error:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+@app.post("/recs/api/user/onboarding/recommendations")
+async def get_onboarding_recommendations(request: Request):
+    try:
+        access_token, error = bearer_token(request)
+        if error:
+            return error
+        token_info = await run_in_threadpool(auth.verify_google_token, access_token)
+        if not token_info or "email" not in token_info:
+            return invalid_token()
+
+        user = await read_user(email=token_info["email"])
+        if user is None:
+            return JSONResponse({"error": "User not found"}, status_code=404)
+
+        data = await request.json()
+        result = await run_in_threadpool(
+            onboarding_recommendations, user["_id"], data["genres"]
+        )
+        return flask_json({"genres_updated": result})
+    except Exception as e:
+        print("Error:", e)
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# Everything else is served by the Flask app
+app.mount("/", WSGIMiddleware(flask_app))
@@ -0,0 +1,228 @@
+# backend/auth.py
+"""
+Local verification of Google ID tokens.
+
+Endpoints used to send every bearer token to Google's tokeninfo endpoint,
+a blocking HTTP round trip per request. Tokens are now checked here:
+
+  * the RS256 signature is verified with PyJWT against Google's published
+    signing keys (JWKS), fetched once and refreshed in a background thread
+    before the Cache-Control max-age Google sends runs out;
+  * the issuer, expiry, issue time and audience claims are checked. The
+    audience must be GOOGLE_CLIENT_ID; without it no token verifies, since
+    any app's Google token would otherwise be accepted;
+  * verified claims are kept in a bounded LRU until the token expires, so a
+    token seen before costs one hash and one dict lookup.
+
+Tests swap the key source for a StaticKeys built from a local key pair with
+use_key_source().
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import jwt
+import requests
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
+
+CLOCK_SKEW = 60  # seconds of leeway on exp / iat
+KEYS_DEFAULT_MAX_AGE = 3600  # if Google sends no max-age
+KEYS_REFRESH_AHEAD = 300  # refresh this long before the keys expire
+KEYS_MIN_REFETCH = 60  # at most one refetch per minute for unknown kids
+KEYS_FETCH_TIMEOUT = 5
+TOKEN_CACHE_SIZE = 10000
+
+# PyJWT errors in the order they are checked, and what they are reported as
+_CLAIM_ERRORS = (
+    (jwt.ExpiredSignatureError, "Token expired"),
+    (jwt.ImmatureSignatureError, "Token issued in the future"),
+    (jwt.InvalidIssuerError, "Invalid issuer"),
+    (jwt.InvalidAudienceError, "Invalid audience"),
+    (jwt.InvalidSignatureError, "Invalid signature"),
+    (jwt.DecodeError, "Malformed token"),
+)
+
+
+class TokenError(Exception):
+    """A token that failed verification."""
+
+
+def public_keys(jwks):
+    """RSA public keys of a JWKS by kid. Keys that do not parse are skipped."""
+    keys = {}
+    for jwk in jwks.get("keys", []):
+        if jwk.get("kty") != "RSA" or "kid" not in jwk:
+            continue
+        try:
+            keys[jwk["kid"]] = jwt.PyJWK(jwk, "RS256").key
+        except jwt.PyJWTError as e:
+            print(f"Skipping signing key {jwk['kid']}: {e}")
+    return keys
+
+
+def _max_age(headers):
+    match = re.search(r"max-age=(\d+)", headers.get("Cache-Control", ""))
+    return int(match.group(1)) if match else KEYS_DEFAULT_MAX_AGE
+
+
+class GoogleKeys:
+    """
+    Google's signing keys by kid. The first lookup fetches them; after that
+    a lookup close to expiry starts a background refresh and keeps answering
+    from the current keys. A kid that is not known triggers a synchronous
+    refetch (keys rotate), rate limited by KEYS_MIN_REFETCH.
+    """
+
+    def __init__(self, url=GOOGLE_CERTS_URL):
+        self.url = url
+        self.keys = {}
+        self.expires = 0.0
+        self.fetched = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def fetch(self):
+        response = requests.get(self.url, timeout=KEYS_FETCH_TIMEOUT)
+        response.raise_for_status()
+        self.load(response.json(), response.headers)
+
+    def load(self, jwks, headers):
+        """Install a JWKS response, however it was fetched."""
+        keys = public_keys(jwks)
+        now = time.monotonic()
+        with self._lock:
+            self.keys = keys
+            self.expires = now + _max_age(headers)
+            self.fetched = now
+
+    def _refresh_in_background(self):
+        try:
+            self.fetch()
+        except Exception as e:
+            # The current keys stay in use; Google overlaps old and new keys
+            print(f"Error refreshing Google signing keys: {e}")
+        finally:
+            self._refreshing = False
+
+    def get(self, kid):
+        now = time.monotonic()
+        if not self.keys or now >= self.expires:
+            self.fetch()
+        elif now >= self.expires - KEYS_REFRESH_AHEAD and not self._refreshing:
+            self._refreshing = True
+            threading.Thread(target=self._refresh_in_background, daemon=True).start()
+
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self.fetched >= KEYS_MIN_REFETCH:
+            self.fetch()
+            key = self.keys.get(kid)
+        return key
+
+
+class StaticKeys:
+    """A fixed key set, for tests and local development."""
+
+    def __init__(self, jwks):
+        self.keys = public_keys(jwks)
+
+    def get(self, kid):
+        return self.keys.get(kid)
+
+
+_key_source = GoogleKeys()
+_claims_cache = OrderedDict()  # sha256(token) -> claims
+_claims_lock = threading.Lock()
+
+
+def use_key_source(source):
+    """Verify tokens against `source` (anything with get(kid) -> public key)."""
+    global _key_source
+    _key_source = source
+    clear_token_cache()
+
+
+def load_google_keys(jwks, headers):
+    """
+    Install Google's keys fetched elsewhere (asgi.py fetches them with an
+    async client at startup). Ignored when tests use another key source.
+    """
+    if isinstance(_key_source, GoogleKeys):
+        _key_source.load(jwks, headers)
+
+
+def clear_token_cache():
+    with _claims_lock:
+        _claims_cache.clear()
+
+
+def decode_token(token):
+    """Verify a Google ID token and return its claims. Raises TokenError."""
+    if not GOOGLE_CLIENT_ID:
+        raise TokenError("GOOGLE_CLIENT_ID is not set; refusing to verify")
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as e:
+        raise TokenError(f"Malformed token: {e}")
+
+    if header.get("alg") != "RS256":
+        raise TokenError(f"Unsupported algorithm: {header.get('alg')}")
+    key = _key_source.get(header.get("kid"))
+    if key is None:
+        raise TokenError("Unknown signing key")
+    try:
+        return jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience=GOOGLE_CLIENT_ID,
+            issuer=GOOGLE_ISSUERS,
+            leeway=CLOCK_SKEW,
+            options={"require": ["exp", "iat", "iss", "aud"]},
+        )
+    except jwt.PyJWTError as e:
+        for error, message in _CLAIM_ERRORS:
+            if isinstance(e, error):
+                raise TokenError(message)
+        raise TokenError(f"Invalid token: {e}")
+
+
+def verify_google_token(token):
+    """
+    Claims of a valid Google ID token (email, given_name, picture, ...), or
+    None if it does not verify. Repeat tokens are answered from the cache.
+    """
+    if not token:
+        return None
+    cache_key = hashlib.sha256(token.encode("utf-8", "replace")).digest()
+    now = time.time()
+    with _claims_lock:
+        claims = _claims_cache.get(cache_key)
+        if claims is not None:
+            if claims["exp"] >= now - CLOCK_SKEW:
+                _claims_cache.move_to_end(cache_key)
+                return claims
+            del _claims_cache[cache_key]
+
+    try:
+        claims = decode_token(token)
+    except TokenError as e:
+        print(f"Rejected token: {e}")
+        return None
+    except Exception as e:
+        # e.g. the signing keys could not be fetched
+        print(f"Error verifying token: {e}")
+        return None
+
+    with _claims_lock:
+        _claims_cache[cache_key] = claims
+        while len(_claims_cache) > TOKEN_CACHE_SIZE:
+            _claims_cache.popitem(last=False)
+    return claims
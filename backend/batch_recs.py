@@ -0,0 +1,282 @@
+# backend/batch_recs.py
+"""
+Offline job that precomputes every user's ranked recommendation list.
+
+    python batch_recs.py --workers 4
+
+Users are scored in blocks spread over a process pool. Each block is
+multiplied against the book embeddings one chunk of books at a time, plus
+the genre-weight term, keeping a running top-k per user, so a worker holds
+block_size x BOOK_CHUNK_SIZE scores rather than a score for every book.
+The lists land in the same Redis cache that recmodel.get_ranked_books
+reads, so the endpoint becomes a lookup for every user whose shelf has not
+changed since the job ran.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy import sparse
+from ann_search import ExactSearch
+from book_index import BookIndex, normalize_embedding
+from cache import (
+    CATALOG_VERSION_KEY,
+    RANKED_LIST_SIZE,
+    RANKED_RECS_TTL,
+    recs_version,
+    redis_client,
+)
+from database import collections
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+books_collection = collections["Books"]
+users_collection = collections["Users"]
+user_bookshelf_collection = collections["User_Bookshelf"]
+
+GENRE_SCORE_WEIGHT = 0.1  # Same weighting as recmodel.rank_books
+DEFAULT_BLOCK_SIZE = 1024
+# Books scored per matrix multiply: 1024 users x 8192 books is 32 MB of
+# float32 scores per worker, whatever the catalog size
+BOOK_CHUNK_SIZE = 8192
+VERSION_SCAN = 1000
+
+# Book matrices loaded once per worker process by _init_worker
+_worker_state = {}
+
+
+def load_users(book_index):
+    """
+    Read every user with a usable embedding. Returns (user_ids, unit-length
+    embeddings, dense genre weights over the index's genre vocabulary, number
+    of users skipped). Users without an embedding are left to the online
+    genre-only path.
+    """
+    user_ids, vectors, weights = [], [], []
+    skipped = 0
+    for user in users_collection.find({}, {"embedding": 1, "genre_weights": 1}):
+        vector = normalize_embedding(user.get("embedding"), book_index.dim)
+        if vector is None:
+            skipped += 1
+            continue
+        user_weights = user.get("genre_weights")
+        if not isinstance(user_weights, dict):
+            user_weights = {}
+        user_ids.append(str(user["_id"]))
+        vectors.append(vector)
+        weights.append(book_index.genre_weight_vector(user_weights))
+
+    if not user_ids:
+        vocab_size = max(len(book_index.genre_names), 1)
+        vectors = np.zeros((0, book_index.dim), dtype=np.float32)
+        return [], vectors, np.zeros((0, vocab_size), dtype=np.float32), skipped
+    return user_ids, np.vstack(vectors), np.vstack(weights).astype(np.float32), skipped
+
+
+def load_exclusions(positions):
+    """Map user_id -> row numbers of the books already on their shelf."""
+    exclusions = {}
+    for entry in user_bookshelf_collection.find({}, {"user_id": 1, "book_id": 1}):
+        row = positions.get(entry.get("book_id"))
+        if row is not None:
+            exclusions.setdefault(str(entry["user_id"]), []).append(row)
+    return exclusions
+
+
+def _top_k(rows, scores, k):
+    """The k best (rows, scores) in each row of the inputs, unordered."""
+    if scores.shape[1] <= k:
+        return rows, scores
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(rows, top, 1), np.take_along_axis(scores, top, 1)
+
+
+def score_block(
+    embeddings,
+    genres,
+    user_vectors,
+    genre_weights,
+    exclude_rows,
+    k,
+    book_chunk=BOOK_CHUNK_SIZE,
+):
+    """
+    Top-k (rows, scores) for a block of users, best first.
+
+    embeddings is books x dim, genres the sparse books x genres matrix, and
+    exclude_rows one list of shelved book rows per user. Books are scored
+    book_chunk at a time and each chunk's top k merged into a running top k.
+    Excluded books are dropped from the result, so a row of the output can
+    hold fewer than k finite scores; those slots are -inf.
+    """
+    n_users, n_books = user_vectors.shape[0], embeddings.shape[0]
+    k = min(k, n_books)
+    best_rows = np.zeros((n_users, 0), dtype=np.int64)
+    best_scores = np.zeros((n_users, 0), dtype=np.float32)
+    if k <= 0:
+        return best_rows, best_scores
+    exclude_rows = [np.asarray(rows, dtype=np.int64) for rows in exclude_rows]
+
+    for start in range(0, n_books, book_chunk):
+        stop = min(start + book_chunk, n_books)
+        scores = user_vectors @ embeddings[start:stop].T
+        scores += (
+            GENRE_SCORE_WEIGHT * np.asarray(genres[start:stop] @ genre_weights.T).T
+        )
+        for i, rows in enumerate(exclude_rows):
+            rows = rows[(rows >= start) & (rows < stop)]
+            if len(rows):
+                scores[i, rows - start] = -np.inf
+        chunk_rows = np.broadcast_to(np.arange(start, stop), scores.shape)
+        chunk_rows, scores = _top_k(chunk_rows, scores, k)
+        best_rows, best_scores = _top_k(
+            np.hstack([best_rows, chunk_rows]), np.hstack([best_scores, scores]), k
+        )
+
+    order = np.argsort(-best_scores, axis=1, kind="stable")
+    return (
+        np.take_along_axis(best_rows, order, 1),
+        np.take_along_axis(best_scores, order, 1),
+    )
+
+
+def _init_worker(embeddings_path, genres_path):
+    _worker_state["embeddings"] = np.load(embeddings_path, mmap_mode="r")
+    _worker_state["genres"] = sparse.load_npz(genres_path).tocsr()
+
+
+def _score_block_task(args):
+    user_vectors, genre_weights, exclude_rows, k = args
+    return score_block(
+        _worker_state["embeddings"],
+        _worker_state["genres"],
+        user_vectors,
+        genre_weights,
+        exclude_rows,
+        k,
+    )
+
+
+class RedisSink:
+    """Writes ranked lists into the online recommendation cache."""
+
+    def __init__(self):
+        # Versions are read before any data is loaded so that a shelf write
+        # or catalog change during the run leaves its lists stale rather than
+        # hiding it.
+        self.catalog_version = redis_client.get(CATALOG_VERSION_KEY)
+        self.user_versions = {}
+        keys = list(redis_client.scan_iter(match="recs_version:*", count=VERSION_SCAN))
+        for start in range(0, len(keys), VERSION_SCAN):
+            chunk = keys[start : start + VERSION_SCAN]
+            for key, counter in zip(chunk, redis_client.mget(chunk)):
+                key = key.decode() if isinstance(key, bytes) else key
+                self.user_versions[key.split(":", 1)[1]] = counter
+
+    def write(self, results):
+        pipe = redis_client.pipeline(transaction=False)
+        for user_id, ranked in results:
+            version = recs_version(
+                self.user_versions.get(user_id), self.catalog_version
+            )
+            payload = {"version": version, "ranked": ranked}
+            pipe.set(f"recs:{user_id}", json.dumps(payload), ex=RANKED_RECS_TTL)
+        pipe.execute()
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process and of its finished workers."""
+    if resource is None:
+        return None, None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return own, children
+
+
+def run(top_k=RANKED_LIST_SIZE, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """Precompute every user's ranked list and return throughput stats."""
+    started = time.perf_counter()
+    writer = RedisSink()
+
+    book_index = BookIndex(search_engine=ExactSearch())
+    book_index.build(books_collection.find({}))
+    genres = book_index.genre_matrix
+    user_ids, user_vectors, genre_weights, skipped = load_users(book_index)
+    exclusions = load_exclusions(book_index.positions)
+    loaded = time.perf_counter()
+    print(
+        f"Loaded {book_index.size} books and {len(user_ids)} users "
+        f"({skipped} without embeddings) in {loaded - started:.1f}s"
+    )
+
+    blocks = [
+        (
+            user_vectors[start : start + block_size],
+            genre_weights[start : start + block_size],
+            [exclusions.get(uid, []) for uid in user_ids[start : start + block_size]],
+            top_k,
+        )
+        for start in range(0, len(user_ids), block_size)
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        embeddings_path = os.path.join(tmp, "embeddings.npy")
+        genres_path = os.path.join(tmp, "genres.npz")
+        np.save(embeddings_path, book_index.embeddings)
+        sparse.save_npz(genres_path, genres)
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(embeddings_path, genres_path),
+        ) as pool:
+            start = 0
+            for rows, scores in pool.map(_score_block_task, blocks):
+                results = []
+                for i in range(rows.shape[0]):
+                    keep = np.isfinite(scores[i])
+                    ranked = [
+                        [str(book_index.book_ids[row]), float(score)]
+                        for row, score in zip(rows[i][keep], scores[i][keep])
+                    ]
+                    results.append((user_ids[start + i], ranked))
+                writer.write(results)
+                start += rows.shape[0]
+
+    elapsed = time.perf_counter() - started
+    scoring = time.perf_counter() - loaded
+    own_mb, workers_mb = peak_memory_mb()
+    stats = {
+        "users": len(user_ids),
+        "skipped": skipped,
+        "books": book_index.size,
+        "seconds": elapsed,
+        "users_per_sec": len(user_ids) / scoring if scoring > 0 else 0.0,
+        "peak_rss_mb": own_mb,
+        "peak_worker_rss_mb": workers_mb,
+    }
+    print(
+        f"Wrote {len(user_ids)} ranked lists to Redis in {elapsed:.1f}s "
+        f"({stats['users_per_sec']:.1f} users/sec after loading)"
+    )
+    if own_mb is not None:
+        print(f"Peak RSS: {own_mb:.0f} MB main, {workers_mb:.0f} MB largest worker")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--top-k", type=int, default=RANKED_LIST_SIZE)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    run(args.top_k, args.block_size, args.workers)
@@ -0,0 +1,524 @@
+# backend/book_index.py
+import threading
+import time
+import numpy as np
+from scipy import sparse
+from bson import ObjectId
+from bson.errors import InvalidId
+from database import collections
+from ann_search import make_search_engine, top_k_rows
+from cache import bump_catalog_version
+from diversity import MAX_AUTHORS, NUM_PERM, author_names, title_signature
+from embedding_store import decode_embedding, load_snapshot, snapshot_directory
+
+books_collection = collections["Books"]
+
+EMBEDDING_DIM = 384
+# Seconds before a book still without an embedding is queued again
+EMBEDDING_REQUEST_RETRY = 600
+
+
+def normalize_embedding(raw_embedding, dim=EMBEDDING_DIM):
+    """
+    Convert a stored embedding (float32 bytes, BSON Binary, or a legacy list)
+    into a unit-length float32 vector. Returns None if the embedding is
+    missing, the wrong size, or not numeric.
+    """
+    if isinstance(raw_embedding, dict):
+        return None
+    vector = decode_embedding(raw_embedding)
+    if vector is None or vector.shape[0] != dim or not np.all(np.isfinite(vector)):
+        return None
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        return None
+    return vector / norm
+
+
+class BookIndex:
+    def __init__(self, dim=EMBEDDING_DIM, search_engine=None):
+        """
+        Resident index of book embeddings used by the recommender.
+
+        Rows of the embedding matrix are unit-length float32 vectors, so cosine
+        similarity against every book is one matrix-vector product. `book_ids`
+        and `books` (metadata without the embedding) are parallel to the rows.
+        Books without a usable embedding keep a zero row so they can still be
+        scored by genre. Nearest-neighbour candidates come from a pluggable
+        search engine (see ann_search.make_search_engine).
+
+        Genre tags are kept as a sparse (size x genres) count matrix over
+        `genre_vocab`, so scoring a user's genre weights is one sparse
+        matrix-vector product instead of a Python loop over every book.
+
+        For diversity re-ranking each row also has a MinHash title signature
+        and up to MAX_AUTHORS author ids (see diversity.py), computed once
+        when the book is indexed.
+        """
+        self.dim = dim
+        self.search_engine = search_engine or make_search_engine()
+        self.lock = threading.RLock()
+        self.size = 0
+        self.embedded_count = 0
+        self.book_ids = []
+        self.books = []
+        self.positions = {}
+        self.missing_embeddings = set()
+        self.embedding_requests = {}  # book id -> when it was last queued
+        self.embeddings_version = None  # catalog version missing books were read at
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        self._has_embedding = np.zeros(0, dtype=bool)
+        self._title_signatures = np.zeros((0, NUM_PERM), dtype=np.uint32)
+        self._author_ids = np.full((0, MAX_AUTHORS), -1, dtype=np.int32)
+        self.author_vocab = {}
+        self.genre_vocab = {}
+        self.genre_names = []
+        self._genre_rows = []
+        self._genre_matrix = None
+        self._containing = {}
+
+    @property
+    def embeddings(self):
+        """The live (size x dim) view of the embedding matrix."""
+        return self._matrix[: self.size]
+
+    @property
+    def has_embedding(self):
+        """The live boolean mask of rows that have a usable embedding."""
+        return self._has_embedding[: self.size]
+
+    @property
+    def title_signatures(self):
+        """The live (size x NUM_PERM) view of the title MinHash signatures."""
+        return self._title_signatures[: self.size]
+
+    @property
+    def author_ids(self):
+        """The live (size x MAX_AUTHORS) view of author ids, padded with -1."""
+        return self._author_ids[: self.size]
+
+    def _author_row(self, book):
+        row = np.full(MAX_AUTHORS, -1, dtype=np.int32)
+        for i, name in enumerate(author_names(book.get("author"))[:MAX_AUTHORS]):
+            row[i] = self.author_vocab.setdefault(name, len(self.author_vocab))
+        return row
+
+    def _genre_columns(self, book):
+        """Vocabulary columns and tag counts for a book, growing the vocabulary."""
+        columns = []
+        for genre in book.get("genre_tags") or []:
+            if genre not in self.genre_vocab:
+                self.genre_vocab[genre] = len(self.genre_names)
+                self.genre_names.append(genre)
+                self._containing = {}
+            columns.append(self.genre_vocab[genre])
+        return np.unique(np.asarray(columns, dtype=np.int32), return_counts=True)
+
+    @property
+    def genre_matrix(self):
+        """CSR (size x genres) tag-count matrix, rebuilt lazily after writes."""
+        with self.lock:
+            if self._genre_matrix is None:
+                lengths = [len(columns) for columns, _ in self._genre_rows]
+                indptr = np.zeros(self.size + 1, dtype=np.int64)
+                np.cumsum(lengths, out=indptr[1:])
+                if self._genre_rows:
+                    indices = np.concatenate([c for c, _ in self._genre_rows])
+                    counts = np.concatenate([n for _, n in self._genre_rows])
+                else:
+                    indices = np.zeros(0, dtype=np.int32)
+                    counts = np.zeros(0, dtype=np.int64)
+                self._genre_matrix = sparse.csr_matrix(
+                    (counts.astype(np.float64), indices, indptr),
+                    shape=(self.size, max(len(self.genre_names), 1)),
+                )
+            return self._genre_matrix
+
+    def genre_weight_vector(self, genre_weights):
+        """A user's genre weights as a dense vector over the vocabulary."""
+        vector = np.zeros(max(len(self.genre_names), 1))
+        for genre, weight in genre_weights.items():
+            column = self.genre_vocab.get(genre)
+            if column is not None:
+                vector[column] = weight
+        return vector
+
+    def genre_scores(self, genre_weights):
+        """
+        Per-book sum of the user's weights over the book's genre tags, i.e.
+        sum(genre_weights.get(g, 0) for g in book["genre_tags"]) for every row.
+        """
+        if not genre_weights:
+            return np.zeros(self.size)
+        with self.lock:
+            return self.genre_matrix @ self.genre_weight_vector(genre_weights)
+
+    def _containing_columns(self, genre):
+        """Vocabulary columns whose lowercased name contains `genre` (memoized)."""
+        genre = genre.lower()
+        columns = self._containing.get(genre)
+        if columns is None:
+            columns = np.fromiter(
+                (c for c, name in enumerate(self.genre_names) if genre in name.lower()),
+                dtype=np.int32,
+            )
+            self._containing[genre] = columns
+        return columns
+
+    def genre_match_scores(self, genre_weights):
+        """
+        Per-book sum of the weights of user genres that appear as a
+        case-insensitive substring of any of the book's genre tags. Each user
+        genre counts at most once per book.
+        """
+        if not genre_weights:
+            return np.zeros(self.size)
+        with self.lock:
+            genres = list(genre_weights)
+            columns = [self._containing_columns(genre) for genre in genres]
+            containment = sparse.csc_matrix(
+                (
+                    np.ones(sum(len(c) for c in columns)),
+                    np.concatenate(columns) if columns else np.zeros(0, np.int32),
+                    np.cumsum([0] + [len(c) for c in columns]),
+                ),
+                shape=(max(len(self.genre_names), 1), len(genres)),
+            )
+            matches = (self.genre_matrix @ containment).sign()
+            return matches @ np.array([genre_weights[g] for g in genres], dtype=float)
+
+    def build(self, books, snapshot=None):
+        """
+        Replace the index contents with the given iterable of book documents.
+
+        With a snapshot from embedding_store.load_snapshot, the memory-mapped
+        matrix is used as-is and `books` only supplies metadata. Snapshot rows
+        whose book is gone are dropped. Returns the ids of books that are not
+        in the snapshot, which the caller should upsert with their embeddings.
+        """
+        if snapshot is not None:
+            return self._build_from_snapshot(books, snapshot)
+
+        book_ids, metadata, vectors = [], [], []
+        for book in books:
+            book_ids.append(book["_id"])
+            metadata.append({k: v for k, v in book.items() if k != "embedding"})
+            vectors.append(normalize_embedding(book.get("embedding"), self.dim))
+
+        matrix = np.zeros((len(book_ids), self.dim), dtype=np.float32)
+        has_embedding = np.zeros(len(book_ids), dtype=bool)
+        for row, vector in enumerate(vectors):
+            if vector is not None:
+                matrix[row] = vector
+                has_embedding[row] = True
+        self._install(book_ids, metadata, matrix, has_embedding)
+        return []
+
+    def _build_from_snapshot(self, books, snapshot):
+        snapshot_ids, matrix, snapshot_has_embedding = snapshot
+        by_id = {
+            book["_id"]: {k: v for k, v in book.items() if k != "embedding"}
+            for book in books
+        }
+        stale = [book_id for book_id in snapshot_ids if book_id not in by_id]
+        metadata = [by_id.pop(book_id, {"_id": book_id}) for book_id in snapshot_ids]
+
+        has_embedding = np.zeros(matrix.shape[0], dtype=bool)
+        has_embedding[: len(snapshot_ids)] = snapshot_has_embedding
+        with self.lock:
+            self._install(list(snapshot_ids), metadata, matrix, has_embedding)
+            for book_id in stale:
+                self.remove(book_id)
+        return list(by_id)
+
+    def _install(self, book_ids, metadata, matrix, has_embedding):
+        """Swap in new rows. matrix/has_embedding may have spare capacity."""
+        size = len(book_ids)
+        signatures = np.zeros((matrix.shape[0], NUM_PERM), dtype=np.uint32)
+        for row, book in enumerate(metadata):
+            signatures[row] = title_signature(book.get("title"))
+
+        with self.lock:
+            self.genre_vocab, self.genre_names, self._containing = {}, [], {}
+            genre_rows = [self._genre_columns(book) for book in metadata]
+            self.author_vocab = {}
+            author_ids = np.full((matrix.shape[0], MAX_AUTHORS), -1, dtype=np.int32)
+            for row, book in enumerate(metadata):
+                author_ids[row] = self._author_row(book)
+            self._matrix = matrix
+            self._has_embedding = has_embedding
+            self._title_signatures = signatures
+            self._author_ids = author_ids
+            self.size = size
+            self.embedded_count = int(has_embedding[:size].sum())
+            self.book_ids = book_ids
+            self.books = metadata
+            self._genre_rows = genre_rows
+            self._genre_matrix = None
+            self.positions = {book_id: row for row, book_id in enumerate(book_ids)}
+            self.missing_embeddings = {
+                book_id for book_id, ok in zip(book_ids, has_embedding) if not ok
+            }
+            self.search_engine.fit(self.embeddings, self.has_embedding)
+
+    def _grow(self):
+        """Double the matrix capacity so appends stay amortized O(dim)."""
+        capacity = max(16, 2 * self._matrix.shape[0])
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[: self.size] = self._matrix[: self.size]
+        has_embedding = np.zeros(capacity, dtype=bool)
+        has_embedding[: self.size] = self._has_embedding[: self.size]
+        signatures = np.zeros((capacity, NUM_PERM), dtype=np.uint32)
+        signatures[: self.size] = self._title_signatures[: self.size]
+        author_ids = np.full((capacity, MAX_AUTHORS), -1, dtype=np.int32)
+        author_ids[: self.size] = self._author_ids[: self.size]
+        self._matrix = matrix
+        self._has_embedding = has_embedding
+        self._title_signatures = signatures
+        self._author_ids = author_ids
+
+    def upsert(self, book):
+        """Insert a new book or replace the row of an existing one."""
+        vector = normalize_embedding(book.get("embedding"), self.dim)
+        metadata = {k: v for k, v in book.items() if k != "embedding"}
+        signature = title_signature(metadata.get("title"))
+        book_id = book["_id"]
+
+        with self.lock:
+            genre_columns = self._genre_columns(metadata)
+            row = self.positions.get(book_id)
+            if row is None:
+                if self.size == self._matrix.shape[0]:
+                    self._grow()
+                row = self.size
+                self.size += 1
+                self.book_ids.append(book_id)
+                self.books.append(metadata)
+                self._genre_rows.append(genre_columns)
+                self.positions[book_id] = row
+            else:
+                self.books[row] = metadata
+                self._genre_rows[row] = genre_columns
+                self.embedded_count -= int(self._has_embedding[row])
+            self._genre_matrix = None
+            self._title_signatures[row] = signature
+            self._author_ids[row] = self._author_row(metadata)
+
+            if vector is not None:
+                self._matrix[row] = vector
+                self._has_embedding[row] = True
+                self.embedded_count += 1
+                self.missing_embeddings.discard(book_id)
+                self.embedding_requests.pop(book_id, None)
+            else:
+                self._matrix[row] = 0
+                self._has_embedding[row] = False
+                self.missing_embeddings.add(book_id)
+            if self.search_engine.needs_refit(self.embedded_count):
+                # Grown well past the catalog the clusters were fit on
+                self.search_engine.fit(self.embeddings, self.has_embedding)
+            else:
+                self.search_engine.update(row, vector)
+
+    def remove(self, book_id):
+        """Remove a book by swapping the last row into its slot."""
+        with self.lock:
+            row = self.positions.pop(book_id, None)
+            if row is None:
+                return False
+            self.embedded_count -= int(self._has_embedding[row])
+            self.missing_embeddings.discard(book_id)
+            self.embedding_requests.pop(book_id, None)
+
+            last = self.size - 1
+            self.search_engine.remove(row, last)
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._has_embedding[row] = self._has_embedding[last]
+                self._title_signatures[row] = self._title_signatures[last]
+                self._author_ids[row] = self._author_ids[last]
+                self.book_ids[row] = self.book_ids[last]
+                self.books[row] = self.books[last]
+                self._genre_rows[row] = self._genre_rows[last]
+                self.positions[self.book_ids[row]] = row
+            self._matrix[last] = 0
+            self._has_embedding[last] = False
+            self._author_ids[last] = -1
+            self.book_ids.pop()
+            self.books.pop()
+            self._genre_rows.pop()
+            self._genre_matrix = None
+            self.size = last
+            return True
+
+    def get_book(self, book_id):
+        """Return a copy of the indexed metadata for a book, or None."""
+        with self.lock:
+            row = self.positions.get(book_id)
+            return dict(self.books[row]) if row is not None else None
+
+    def embeddings_to_request(self, now=None):
+        """
+        Metadata of the books without an embedding that have a summary to
+        encode and were not queued in the last EMBEDDING_REQUEST_RETRY
+        seconds. They stay in missing_embeddings until a vector arrives, so a
+        request the worker lost is made again.
+        """
+        now = time.monotonic() if now is None else now
+        books = []
+        with self.lock:
+            for book_id in self.missing_embeddings:
+                requested = self.embedding_requests.get(book_id)
+                if requested is not None and now - requested < EMBEDDING_REQUEST_RETRY:
+                    continue
+                book = self.books[self.positions[book_id]]
+                if not str(book.get("summary") or "").strip():
+                    continue
+                self.embedding_requests[book_id] = now
+                books.append(dict(book))
+        return books
+
+    def rows_for(self, book_ids):
+        """Map book ids to row numbers, skipping ids that are not indexed."""
+        with self.lock:
+            rows = [self.positions[b] for b in book_ids if b in self.positions]
+        return np.asarray(rows, dtype=np.int64)
+
+    def similarities(self, query):
+        """Cosine similarity of the query vector against every indexed book."""
+        query = np.asarray(query, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(self.size, dtype=np.float32)
+        with self.lock:
+            return self.embeddings @ (query / norm)
+
+    def candidates(self, query, exclude_ids=()):
+        """
+        Nearest-neighbour candidates for a query vector as (rows, similarities).
+        The exact engine returns every book that is not excluded.
+        """
+        query = np.asarray(query, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        with self.lock:
+            exclude_rows = self.rows_for(exclude_ids)
+            return self.search_engine.candidates(self.embeddings, query, exclude_rows)
+
+    def top_k(self, scores, k, exclude_ids=()):
+        """Return the rows of the k highest scores, best first."""
+        scores = np.array(scores, dtype=np.float64, copy=True)
+        exclude_rows = self.rows_for(exclude_ids)
+        if exclude_rows.size:
+            scores[exclude_rows] = -np.inf
+        k = min(k, scores.shape[0] - exclude_rows.size)
+        return top_k_rows(scores, k)
+
+
+_book_index = None
+_book_index_lock = threading.Lock()
+
+
+def get_book_index():
+    """
+    Return the process-wide BookIndex, building it on first use from the
+    catalog cache if one is running, otherwise from Mongo.
+    If BOOK_EMBEDDING_SNAPSHOT points at a snapshot, embeddings are memory
+    mapped from it and only books added since are read with their embedding.
+    """
+    global _book_index
+    if _book_index is None:
+        with _book_index_lock:
+            if _book_index is None:
+                from load_books import get_catalog
+
+                catalog = get_catalog()
+                books = catalog.get_books() if catalog and catalog.documents else None
+                book_index = BookIndex()
+                directory = snapshot_directory()
+                snapshot = load_snapshot(directory) if directory else None
+                if snapshot is None:
+                    book_index.build(books or books_collection.find({}))
+                else:
+                    new_ids = book_index.build(
+                        books or books_collection.find({}, {"embedding": 0}), snapshot
+                    )
+                    for book in books_collection.find({"_id": {"$in": new_ids}}):
+                        book_index.upsert(book)
+                print(f"Book index built with {book_index.size} books.")
+                _book_index = book_index
+    return _book_index
+
+
+def refresh_indexed_book(book_id):
+    """
+    Re-read one book into the index after a write. Cached recommendations are
+    invalidated either way; the index itself is left alone until it is built.
+    """
+    bump_catalog_version()
+    if _book_index is None:
+        return
+    try:
+        book_id = ObjectId(book_id)
+    except (InvalidId, TypeError):
+        return
+    book = books_collection.find_one({"_id": book_id})
+    if book:
+        _book_index.upsert(book)
+    else:
+        _book_index.remove(book_id)
+
+
+def refresh_missing_embeddings(book_index, catalog_version):
+    """
+    Re-read the books still missing an embedding once the catalog version
+    has moved on; the embedding worker bumps it after writing vectors. This
+    picks them up in processes that do not follow catalog changes. Returns
+    the number of books that now have one.
+    """
+    with book_index.lock:
+        if catalog_version is None or catalog_version == book_index.embeddings_version:
+            return 0
+        book_index.embeddings_version = catalog_version
+        book_ids = list(book_index.missing_embeddings)
+    if not book_ids:
+        return 0
+    count = 0
+    for book in books_collection.find(
+        {"_id": {"$in": book_ids}, "embedding": {"$exists": True, "$nin": [None, []]}}
+    ):
+        book_index.upsert(book)
+        count += 1
+    return count
+
+
+def upsert_indexed_book(book):
+    """Write an already-loaded book document into the index, if it is built."""
+    bump_catalog_version()
+    if _book_index is not None:
+        _book_index.upsert(book)
+
+
+def drop_indexed_book(book_id):
+    """Remove a deleted book from the index. No-op until it is built."""
+    bump_catalog_version()
+    if _book_index is None:
+        return
+    try:
+        _book_index.remove(ObjectId(book_id))
+    except (InvalidId, TypeError):
+        return
+
+
+def sync_indexed_book(book, deleted=False):
+    """
+    Apply a change another process already made (and already counted in the
+    catalog version), e.g. one seen on the catalog change stream.
+    """
+    if _book_index is None:
+        return
+    if deleted:
+        _book_index.remove(book["_id"])
+    else:
+        _book_index.upsert(book)
@@ -0,0 +1,209 @@
+# backend/cache.py
+import json
+import os
+import bson
+import redis
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+redis_url = os.getenv("REDIS_URL")
+redis_client = (
+    redis.from_url(redis_url)  # , decode_responses=True)
+    if redis_url
+    else redis.Redis(host="localhost", port=6379)  # , decode_responses=True)
+)
+
+# Ranked recommendation lists are cached per user under a version made of a
+# per-user counter (bumped on shelf writes and profile updates) and a global
+# catalog counter (bumped on book writes). A bump makes old entries miss.
+CATALOG_VERSION_KEY = "catalog_version"
+# How many ranked books are cached per user; refreshes page through these
+RANKED_LIST_SIZE = 300
+RANKED_RECS_TTL = 24 * 3600
+
+
+def bump_recs_version(user_id):
+    """Invalidate a user's cached recommendations."""
+    try:
+        redis_client.incr(f"recs_version:{user_id}")
+    except Exception as e:
+        print(f"Error bumping recommendation version: {e}")
+
+
+def bump_catalog_version():
+    """Invalidate every user's cached recommendations after a catalog change."""
+    try:
+        redis_client.incr(CATALOG_VERSION_KEY)
+    except Exception as e:
+        print(f"Error bumping catalog version: {e}")
+
+
+def read_catalog_version():
+    """The catalog counter, or None if Redis is down."""
+    try:
+        return int(redis_client.get(CATALOG_VERSION_KEY) or 0)
+    except Exception as e:
+        print(f"Error reading catalog version: {e}")
+        return None
+
+
+def recs_version(user_version, catalog_version):
+    return f"{int(user_version or 0)}:{int(catalog_version or 0)}"
+
+
+def read_ranked_recs(user_id):
+    """
+    Return (version, ranked) for a user with one Redis round trip. ranked is
+    the cached list of [book_id, score] pairs, or None on a miss. version is
+    None if Redis is unavailable, in which case nothing should be cached.
+    """
+    try:
+        values = redis_client.mget(*ranked_recs_keys(user_id))
+    except Exception as e:
+        print(f"Error reading cached recommendations: {e}")
+        return None, None
+    return parse_ranked_recs(*values)
+
+
+def ranked_recs_keys(user_id):
+    """The keys read_ranked_recs reads, in the order parse_ranked_recs takes."""
+    return [f"recs_version:{user_id}", CATALOG_VERSION_KEY, f"recs:{user_id}"]
+
+
+def parse_ranked_recs(user_version, catalog_version, payload):
+    """(version, ranked) from the values stored under ranked_recs_keys."""
+    version = recs_version(user_version, catalog_version)
+    if payload:
+        cached = json.loads(payload)
+        if cached.get("version") == version:
+            return version, cached["ranked"]
+    return version, None
+
+
+def write_ranked_recs(user_id, version, ranked):
+    """Cache a user's ranked list under the version it was computed for."""
+    if version is None:
+        return
+    try:
+        redis_client.set(
+            f"recs:{user_id}",
+            json.dumps({"version": version, "ranked": ranked}),
+            ex=RANKED_RECS_TTL,
+        )
+    except Exception as e:
+        print(f"Error caching recommendations: {e}")
+
+
+# User documents are cached as BSON under their id, with an email -> id
+# pointer, so resolving a request's user usually skips Mongo. Every write in
+# models/users.py drops the entry and bumps the user's generation; a reader
+# notes the generation before reading Mongo and only fills the cache if it
+# is unchanged, so a write racing the read cannot be overwritten by the
+# document read before it. The TTL bounds staleness from writers that
+# bypass models/users.py.
+USER_CACHE_TTL = 300
+USER_GENERATION_TTL = 24 * 3600
+
+# KEYS: generation, user[, email pointer]
+# ARGV: generation read before Mongo, document, TTL, user id
+CACHE_USER_SCRIPT = """
+if tonumber(redis.call('GET', KEYS[1]) or '0') ~= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+if KEYS[3] then
+    redis.call('SET', KEYS[3], ARGV[4], 'EX', ARGV[3])
+end
+return 1
+"""
+
+
+def user_key(user_id):
+    return f"user:{user_id}"
+
+
+def user_email_key(email):
+    return f"user_email:{email}"
+
+
+def user_generation_key(user_id):
+    return f"user_generation:{user_id}"
+
+
+def read_cached_user(user_id):
+    """A cached user document, or None on a miss or if Redis is down."""
+    try:
+        payload = redis_client.get(user_key(user_id))
+    except Exception as e:
+        print(f"Error reading cached user: {e}")
+        return None
+    return bson.decode(payload) if payload else None
+
+
+def read_cached_user_id(email):
+    try:
+        user_id = redis_client.get(user_email_key(email))
+    except Exception as e:
+        print(f"Error reading cached user: {e}")
+        return None
+    return user_id.decode() if isinstance(user_id, bytes) else user_id
+
+
+def user_generation(user_id):
+    """
+    The user's cache generation, read before the user is read from Mongo and
+    passed to cache_user. None if Redis is down.
+    """
+    try:
+        generation = redis_client.get(user_generation_key(user_id))
+    except Exception as e:
+        print(f"Error reading user generation: {e}")
+        return None
+    return int(generation or 0)
+
+
+def cache_user_args(user, generation):
+    """(keys, args) of CACHE_USER_SCRIPT for a user document."""
+    user_id = str(user["_id"])
+    keys = [user_generation_key(user_id), user_key(user_id)]
+    if user.get("email_address"):
+        keys.append(user_email_key(user["email_address"]))
+    return keys, [generation, bson.encode(user), USER_CACHE_TTL, user_id]
+
+
+def cache_user(user, generation):
+    """
+    Cache a user document under its id and email address, unless the user's
+    generation moved on from `generation` since it was read. Nothing is
+    cached when generation is None.
+    """
+    if generation is None:
+        return
+    keys, args = cache_user_args(user, generation)
+    try:
+        redis_client.eval(CACHE_USER_SCRIPT, len(keys), *keys, *args)
+    except Exception as e:
+        print(f"Error caching user: {e}")
+
+
+def cache_user_id(email, user_id):
+    """
+    Cache only the email -> id pointer, for a user read by email whose
+    generation could not be read first. Readers check the document's email.
+    """
+    try:
+        redis_client.set(user_email_key(email), str(user_id), ex=USER_CACHE_TTL)
+    except Exception as e:
+        print(f"Error caching user: {e}")
+
+
+def drop_cached_user(user_id):
+    """Drop a cached user after a write, and stop reads from before it caching."""
+    try:
+        pipe = redis_client.pipeline()
+        pipe.incr(user_generation_key(user_id))
+        pipe.expire(user_generation_key(user_id), USER_GENERATION_TTL)
+        pipe.delete(user_key(user_id))
+        pipe.execute()
+    except Exception as e:
+        print(f"Error dropping cached user: {e}")
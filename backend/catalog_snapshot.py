@@ -0,0 +1,267 @@
+# backend/catalog_snapshot.py
+"""
+Versioned, memory-mapped columnar snapshot of the book catalog.
+
+gunicorn forks one process per worker, and every worker holding its own
+list of book dicts and its own embedding matrix multiplies memory by the
+worker count. A snapshot stores the catalog as flat columns on disk instead:
+
+    <root>/CURRENT           name of the live version, replaced atomically
+    <root>/.build.lock       flock held by the one process that is building
+    <root>/v000042/
+        manifest.json        version, book count, genre vocabulary
+        book_ids.npy         12-byte ObjectIds
+        titles.bin/.idx.npy  UTF-8 strings and their offsets
+        authors.bin/.idx.npy one "; "-joined author string per book
+        genre_ptr.npy        CSR row pointers into genre_ids
+        genre_ids.npy        indices into the manifest's genre vocabulary
+        embeddings.npy       float32 matrix (embedding_store layout)
+        has_embedding.npy
+
+Workers map the columns read-only, so the pages are shared through the page
+cache. A builder writes each new version to a temporary directory, renames
+it into place and then flips CURRENT; readers notice the new pointer and swap
+their mapping, while mappings of the old version stay valid until dropped.
+
+    python catalog_snapshot.py build <root>
+"""
+import json
+import os
+import shutil
+import sys
+import time
+from collections.abc import Sequence
+import numpy as np
+from bson import ObjectId
+from embedding_store import CURRENT_FILE, write_embedding_files
+from book_index import EMBEDDING_DIM, normalize_embedding
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SNAPSHOT_ENV = "BOOK_CATALOG_SNAPSHOT"
+LOCK_FILE = ".build.lock"
+MANIFEST_FILE = "manifest.json"
+AUTHOR_SEPARATOR = "; "
+# Older versions kept around for workers that have not swapped yet
+KEEP_VERSIONS = 2
+CATALOG_FIELDS = {"title": 1, "author": 1, "genre_tags": 1, "embedding": 1}
+
+
+def _version_name(version):
+    return f"v{version:06d}"
+
+
+def current_version(root):
+    """The name of the live version directory, or None if there is none."""
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _write_strings(directory, name, values):
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+    np.save(os.path.join(directory, f"{name}.idx.npy"), offsets)
+
+
+def _read_strings(directory, name):
+    offsets = np.load(os.path.join(directory, f"{name}.idx.npy"), mmap_mode="r")
+    path = os.path.join(directory, f"{name}.bin")
+    if os.path.getsize(path) == 0:  # mmap cannot map an empty file
+        return offsets, np.zeros(0, dtype=np.uint8)
+    return offsets, np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def write_version(directory, books, dim=EMBEDDING_DIM):
+    """Write the columns for an iterable of book documents into `directory`."""
+    book_ids, titles, authors = [], [], []
+    genre_vocab, genre_ptr, genre_ids = {}, [0], []
+    embeddings, has_embedding = [], []
+    for book in books:
+        book_ids.append(book["_id"])
+        titles.append(book.get("title") or "")
+        author = book.get("author") or []
+        authors.append(
+            AUTHOR_SEPARATOR.join([author] if isinstance(author, str) else author)
+        )
+        for genre in book.get("genre_tags") or []:
+            genre_ids.append(genre_vocab.setdefault(genre, len(genre_vocab)))
+        genre_ptr.append(len(genre_ids))
+        vector = normalize_embedding(book.get("embedding"), dim)
+        has_embedding.append(vector is not None)
+        embeddings.append(vector if vector is not None else np.zeros(dim, np.float32))
+
+    matrix = np.vstack(embeddings) if embeddings else np.zeros((0, dim), np.float32)
+    write_embedding_files(directory, book_ids, matrix, np.array(has_embedding, bool))
+    _write_strings(directory, "titles", titles)
+    _write_strings(directory, "authors", authors)
+    np.save(os.path.join(directory, "genre_ptr.npy"), np.array(genre_ptr, np.int64))
+    np.save(os.path.join(directory, "genre_ids.npy"), np.array(genre_ids, np.int32))
+    return len(book_ids), list(genre_vocab)
+
+
+def build_snapshot(root, books=None):
+    """
+    Build a new snapshot version under `root` and make it current.
+
+    Only one process builds at a time: the others return None at once rather
+    than waiting, since the version being built will serve them too. Returns
+    the new version name otherwise. `books` defaults to the whole Books
+    collection.
+    """
+    os.makedirs(root, exist_ok=True)
+    lock = open(os.path.join(root, LOCK_FILE), "a+")
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+
+        started = time.time()
+        previous = current_version(root)
+        version = int(previous[1:]) + 1 if previous else 1
+        name = _version_name(version)
+        tmp = os.path.join(root, f".{name}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        if books is None:
+            from models.books import books_collection
+
+            books = books_collection.find({}, CATALOG_FIELDS)
+        count, genres = write_version(tmp, books)
+        with open(os.path.join(tmp, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": version,
+                    "count": count,
+                    "genres": genres,
+                    "built_at": time.time(),
+                },
+                f,
+            )
+        os.rename(tmp, os.path.join(root, name))
+
+        pointer = os.path.join(root, f".{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(pointer, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(root, CURRENT_FILE))
+        _prune_versions(root, version)
+        print(
+            f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Catalog snapshot {name} "
+            f"({count} books) built in {time.time() - started:.2f} seconds."
+        )
+        return name
+    finally:
+        lock.close()  # also releases the flock
+
+
+def _prune_versions(root, version):
+    for entry in os.listdir(root):
+        if entry.startswith("v") and entry[1:].isdigit():
+            if int(entry[1:]) <= version - KEEP_VERSIONS:
+                # Open mappings of a deleted version stay readable until unmapped
+                shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+
+
+class CatalogSnapshot(Sequence):
+    """
+    Read-only view of one snapshot version. Indexing returns a small book
+    dict built from the mapped columns; the embedding is a (unit-length) view
+    into the shared matrix, not a copy.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        self.version = manifest["version"]
+        self.genre_names = manifest["genres"]
+        self.book_ids = np.load(os.path.join(directory, "book_ids.npy"), mmap_mode="r")
+        self.embeddings = np.load(
+            os.path.join(directory, "embeddings.npy"), mmap_mode="r"
+        )
+        self.has_embedding = np.load(
+            os.path.join(directory, "has_embedding.npy"), mmap_mode="r"
+        )
+        self.genre_ptr = np.load(
+            os.path.join(directory, "genre_ptr.npy"), mmap_mode="r"
+        )
+        self.genre_ids = np.load(
+            os.path.join(directory, "genre_ids.npy"), mmap_mode="r"
+        )
+        self._titles = _read_strings(directory, "titles")
+        self._authors = _read_strings(directory, "authors")
+        if len(self.book_ids) != manifest["count"]:
+            raise ValueError(f"Snapshot {directory} is incomplete")
+
+    @classmethod
+    def attach(cls, root):
+        """Map the current version under `root`, or return None."""
+        name = current_version(root)
+        if name is None:
+            return None
+        try:
+            return cls(os.path.join(root, name))
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Could not attach catalog snapshot {name}: {e}")
+            return None
+
+    def __len__(self):
+        return len(self.book_ids)
+
+    @staticmethod
+    def _string(column, row):
+        offsets, data = column
+        return bytes(data[offsets[row] : offsets[row + 1]]).decode("utf-8")
+
+    def title(self, row):
+        return self._string(self._titles, row)
+
+    def authors(self, row):
+        joined = self._string(self._authors, row)
+        return joined.split(AUTHOR_SEPARATOR) if joined else []
+
+    def genre_tags(self, row):
+        ids = self.genre_ids[self.genre_ptr[row] : self.genre_ptr[row + 1]]
+        return [self.genre_names[i] for i in ids]
+
+    def __getitem__(self, row):
+        if isinstance(row, slice):
+            return [self[i] for i in range(*row.indices(len(self)))]
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("book row out of range")
+        return {
+            "_id": ObjectId(bytes(self.book_ids[row])),
+            "title": self.title(row),
+            "author": self.authors(row),
+            "genre_tags": self.genre_tags(row),
+            "embedding": self.embeddings[row] if self.has_embedding[row] else [],
+        }
+
+    def copy(self):
+        # The mapping is read-only, so the snapshot itself is a safe copy
+        return self
+
+
+def snapshot_root():
+    """The configured snapshot root directory, or None."""
+    return os.getenv(SNAPSHOT_ENV) or None
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "build":
+        print("Usage: python catalog_snapshot.py build <root>")
+        sys.exit(1)
+    build_snapshot(sys.argv[2])
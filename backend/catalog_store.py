@@ -0,0 +1,430 @@
+# backend/catalog_store.py
+"""
+Compact binary format for the catalog cache, replacing books_cache.json.
+
+A store is one file, laid out so it can be written in a single pass:
+
+    records      the book documents without embeddings, as consecutive BSON
+                 documents (each starts with its own int32 length)
+    embeddings   float32 rows, one per book that has one
+    index        per book: _id, isbn, isbn13, record offset and length, and
+                 the book's row in the embedding block (-1 if none)
+    metadata     JSON with the section offsets and counts
+    trailer      metadata length and a magic number
+
+Books are written one at a time from any iterable, so a cache of any size
+is written without holding it all in memory. The file is written under a
+temporary name and renamed into place, so a reader sees either the old
+store or the new one, never a mix; readers that have the old one mapped
+keep reading it. Several processes can rewrite the same path: the last
+rename wins. Reading maps the file. Records are decoded only when asked
+for, and embeddings are views into the mapped block rather than Python lists.
+
+    python catalog_store.py benchmark --books 100000
+
+compares load time and peak RSS against the old indent=4 JSON cache on
+synthetic books.
+"""
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import bson
+from bson import ObjectId
+from embedding_store import EMBEDDING_DTYPE, decode_embedding
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MAGIC = b"RRCATv2\0"
+TRAILER = struct.Struct("<Q8s")  # metadata length, magic
+ISBN_WIDTH = 20  # longer identifiers are stored but not indexed
+INDEX_DTYPE = np.dtype(
+    [
+        ("id", "S12"),
+        ("isbn", f"S{ISBN_WIDTH}"),
+        ("isbn13", f"S{ISBN_WIDTH}"),
+        ("offset", "<i8"),
+        ("length", "<i4"),
+        ("embedding_row", "<i4"),
+    ]
+)
+ALIGNMENT = 64
+WRITE_BUFFER = 1 << 20
+
+
+def is_store_path(path):
+    """Cache files ending in .bin use this format; anything else is JSON."""
+    return str(path).endswith(".bin")
+
+
+def _index_key(value):
+    """An isbn as stored in the index, or b"" if it cannot be indexed."""
+    if not value:
+        return b""
+    key = str(value).encode("utf-8")
+    return key if len(key) <= ISBN_WIDTH else b""
+
+
+def _pad(f, position):
+    padding = -position % ALIGNMENT
+    f.write(b"\0" * padding)
+    return position + padding
+
+
+def _write_temporary(path, books):
+    """Write a complete store beside `path`. Returns the temporary name."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(path)}.tmp-")
+    try:
+        index = []
+        offset, embedding_rows, dim, last_updated = 0, 0, None, None
+        with os.fdopen(fd, "wb", buffering=WRITE_BUFFER) as f, tempfile.TemporaryFile(
+            dir=directory, buffering=WRITE_BUFFER
+        ) as embeddings:
+            for book in books:
+                vector = decode_embedding(book.get("embedding"))
+                if vector is not None and dim is not None and vector.shape[0] != dim:
+                    vector = None  # the block holds one width only
+                row = -1
+                if vector is not None:
+                    dim = vector.shape[0]
+                    embeddings.write(
+                        vector.astype(EMBEDDING_DTYPE, copy=False).tobytes()
+                    )
+                    row, embedding_rows = embedding_rows, embedding_rows + 1
+                updated_at = book.get("updated_at")
+                if isinstance(updated_at, datetime) and (
+                    last_updated is None or updated_at > last_updated
+                ):
+                    last_updated = updated_at
+                data = bson.encode({k: v for k, v in book.items() if k != "embedding"})
+                f.write(data)
+                index.append(
+                    (
+                        ObjectId(book["_id"]).binary,
+                        _index_key(book.get("isbn")),
+                        _index_key(book.get("isbn13")),
+                        offset,
+                        len(data),
+                        row,
+                    )
+                )
+                offset += len(data)
+
+            records_size = offset
+            embeddings_offset = _pad(f, records_size)
+            embeddings.seek(0)
+            shutil.copyfileobj(embeddings, f, WRITE_BUFFER)
+            index_offset = _pad(
+                f,
+                embeddings_offset
+                + embedding_rows * (dim or 0) * EMBEDDING_DTYPE.itemsize,
+            )
+            f.write(np.array(index, dtype=INDEX_DTYPE).tobytes())
+            metadata = json.dumps(
+                {
+                    "count": len(index),
+                    "records_size": records_size,
+                    "embeddings_offset": embeddings_offset,
+                    "embedding_rows": embedding_rows,
+                    "dim": dim or 0,
+                    "index_offset": index_offset,
+                    "last_updated": last_updated.isoformat() if last_updated else None,
+                }
+            ).encode()
+            f.write(metadata)
+            f.write(TRAILER.pack(len(metadata), MAGIC))
+        return tmp
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def write_store(path, books):
+    """Stream an iterable of book documents into a store at `path`. Returns
+    the count."""
+    return len(CatalogStore.create(path, books))
+
+
+class CatalogStore:
+    """Read-only, memory-mapped view of a store written by write_store."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < TRAILER.size:
+                raise ValueError(f"{path} is not a catalog store")
+            # The mapping keeps the file readable after it is replaced
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        metadata_size, magic = TRAILER.unpack_from(self._map, size - TRAILER.size)
+        if magic != MAGIC or metadata_size > size - TRAILER.size:
+            raise ValueError(f"{path} is not a catalog store")
+        end = size - TRAILER.size
+        metadata = json.loads(self._map[end - metadata_size : end])
+
+        count = metadata["count"]
+        self.index = np.frombuffer(
+            self._map, INDEX_DTYPE, count=count, offset=metadata["index_offset"]
+        )
+        rows, dim = metadata["embedding_rows"], metadata["dim"]
+        # A plain ndarray over the mapping: row views of it are much lighter
+        # than np.memmap row objects
+        self.embeddings = (
+            np.frombuffer(
+                self._map,
+                EMBEDDING_DTYPE,
+                count=rows * dim,
+                offset=metadata["embeddings_offset"],
+            ).reshape(rows, dim)
+            if rows
+            else np.zeros((0, 0), dtype=EMBEDDING_DTYPE)
+        )
+        if count and (
+            int((self.index["offset"] + self.index["length"]).max())
+            > metadata["records_size"]
+            or int(self.index["embedding_row"].max()) >= rows
+        ):
+            raise ValueError(f"Index of {path} does not match its records")
+        self.last_updated = (
+            datetime.fromisoformat(metadata["last_updated"])
+            if metadata["last_updated"]
+            else None
+        )
+        self._sorted = {}
+
+    @classmethod
+    def open(cls, path):
+        """Open the store at `path`, or return None if there is no valid one."""
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Could not open catalog store {path}: {e}")
+            return None
+
+    @classmethod
+    def create(cls, path, books):
+        """
+        Write `books` to a store at `path` and return it opened. The result
+        is the store this call wrote, even if another process replaces the
+        file straight after.
+        """
+        tmp = _write_temporary(path, books)
+        try:
+            store = cls(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return store
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, row):
+        """
+        Decode one book. Its embedding is a view into the mapped block.
+        Raises bson.errors.InvalidBSON if the record is damaged.
+        """
+        entry = self.index[row]
+        start = int(entry["offset"])
+        book = bson.decode(self._map[start : start + int(entry["length"])])
+        if entry["embedding_row"] >= 0:
+            book["embedding"] = self.embeddings[int(entry["embedding_row"])]
+        return book
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def book_id(self, row):
+        # numpy drops trailing NUL bytes from fixed-width bytes values
+        return ObjectId(bytes(self.index["id"][row]).ljust(12, b"\0"))
+
+    @property
+    def last_id(self):
+        """The largest _id in the store, or None if it is empty."""
+        return self.book_id(int(np.argmax(self.index["id"]))) if len(self) else None
+
+    def find(self, column, key):
+        """
+        Row of a book whose index `column` ("id", "isbn" or "isbn13") equals
+        `key` (bytes), or None. Sorts the column on first use.
+        """
+        if not key or len(key) > self.index.dtype[column].itemsize:
+            return None
+        if column not in self._sorted:
+            order = np.argsort(self.index[column], kind="stable")
+            self._sorted[column] = (order, self.index[column][order])
+        order, values = self._sorted[column]
+        # Normalized like the stored values, which lose trailing NUL bytes
+        key = np.array(key, dtype=values.dtype)[()]
+        position = int(np.searchsorted(values, key))
+        if position < len(values) and values[position] == key:
+            return int(order[position])
+        return None
+
+    def row_of(self, book_id):
+        """Row number of a book id, or None."""
+        try:
+            return self.find("id", ObjectId(book_id).binary)
+        except (bson.errors.InvalidId, TypeError):
+            return None
+
+    def row_of_isbn(self, column, isbn):
+        """Row number of a book by "isbn" or "isbn13", or None."""
+        return self.find(column, _index_key(isbn))
+
+    def get(self, book_id):
+        row = self.row_of(book_id)
+        return self[row] if row is not None else None
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            pass  # views of it are still alive; unmapped once they are gone
+
+
+# Benchmark
+
+
+def synthetic_books(count, dim=384, seed=0):
+    """Book documents shaped like the real catalog, generated lazily."""
+    rng = np.random.default_rng(seed)
+    genres = ["Fantasy", "Mystery", "Romance", "Science Fiction", "History", "Poetry"]
+    published = datetime(1950, 1, 1)
+    for i in range(count):
+        yield {
+            "_id": ObjectId(),
+            "title": f"Synthetic Book {i}",
+            "author": [f"Author {i % 5000}"],
+            "page_count": int(rng.integers(50, 900)),
+            "genre": genres[i % len(genres)],
+            "tags": ["synthetic", genres[(i + 1) % len(genres)]],
+            "publication_date": published + timedelta(days=i % 25000),
+            "isbn": f"{i:010d}",
+            "isbn13": f"978{i:010d}",
+            "cover_image": f"https://covers.example.com/{i}.jpg",
+            "language": "eng",
+            "publisher": f"Publisher {i % 300}",
+            "summary": "A synthetic summary used to size the cache. " * 8,
+            "genre_tags": [genres[i % len(genres)], genres[(i + 2) % len(genres)]],
+            "embedding": rng.standard_normal(dim).astype(np.float32),
+        }
+
+
+def _json_entry(book):
+    return {
+        **book,
+        "_id": str(book["_id"]),
+        "publication_date": book["publication_date"].isoformat(),
+        "embedding": np.asarray(book["embedding"], dtype=float).tolist(),
+    }
+
+
+def _peak_rss_mb():
+    # VmHWM starts fresh at exec; ru_maxrss would include the benchmark
+    # process this one was forked from
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def _load(kind, path):
+    """Load a cache the way BookCollection does and report time and peak RSS."""
+    started = time.perf_counter()
+    if kind == "json":
+        with open(path, "r", encoding="utf-8") as f:
+            books = [
+                {
+                    **book,
+                    "_id": ObjectId(book["_id"]),
+                    "publication_date": datetime.fromisoformat(
+                        book["publication_date"]
+                    ),
+                }
+                for book in json.load(f)
+            ]
+    else:
+        # BookCollection maps the store and decodes books on demand; look up
+        # one book in a hundred by id, as requests would
+        books = CatalogStore(path)
+        for row in range(0, len(books), 100):
+            books.get(books.book_id(row))
+    return {
+        "books": len(books),
+        "seconds": time.perf_counter() - started,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def benchmark(count, directory):
+    """Write both formats for `count` synthetic books and load each in a
+    fresh process, so peak RSS is not shared between the two."""
+    json_path = os.path.join(directory, "books_cache.json")
+    store_path = os.path.join(directory, "books_cache.bin")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump([_json_entry(book) for book in synthetic_books(count)], f, indent=4)
+    write_store(store_path, synthetic_books(count))
+
+    results = {}
+    for kind, path in (("json", json_path), ("store", store_path)):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "load", kind, path],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        results[kind] = json.loads(output.strip().splitlines()[-1])
+        results[kind]["size_mb"] = os.path.getsize(path) / (1024 * 1024)
+
+    print(f"{count} synthetic books")
+    print(f"{'format':<8}{'size MB':>10}{'load s':>10}{'peak RSS MB':>14}")
+    for kind, result in results.items():
+        rss = result["peak_rss_mb"]
+        print(
+            f"{kind:<8}{result['size_mb']:>10.1f}{result['seconds']:>10.2f}"
+            f"{rss if rss is None else round(rss):>14}"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    bench = commands.add_parser("benchmark")
+    bench.add_argument("--books", type=int, default=100000)
+    bench.add_argument("--dir", default=None)
+    load = commands.add_parser("load")
+    load.add_argument("kind", choices=["json", "store"])
+    load.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        print(json.dumps(_load(args.kind, args.path)))
+    elif args.dir:
+        benchmark(args.books, args.dir)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            benchmark(args.books, tmp)
@@ -6,12 +6,13 @@ import os
 
 
 load_dotenv(override=True)
+DB_NAME = "Readers-Recs"
 uri = os.getenv("MONGO_URI")
 if not uri:
     raise ValueError("MONGO_URI is not set")
 
 client = MongoClient(uri, server_api=ServerApi("1"))
-db = client["Readers-Recs"]
+db = client[DB_NAME]
 
 collections = {
     "Books": db["Books"],
@@ -20,4 +21,5 @@ collections = {
     "Posts": db["Posts"],
     "User_Bookshelf": db["User_Bookshelf"],
     "Users": db["Users"],
+    "Migrations": db["Migrations"],
 }
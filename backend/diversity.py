@@ -0,0 +1,144 @@
+# backend/diversity.py
+import re
+import zlib
+import numpy as np
+
+# MinHash over character trigrams of the normalized title. Two titles are
+# treated as the same work when their estimated Jaccard similarity reaches
+# TITLE_SIMILARITY_THRESHOLD.
+NUM_PERM = 64
+SHINGLE_SIZE = 3
+TITLE_SIMILARITY_THRESHOLD = 0.4
+MAX_AUTHORS = 4
+
+# MMR trades relevance against similarity to the books already picked.
+# A little jitter keeps refreshes from always showing the same picks.
+MMR_DIVERSITY = 0.3
+MMR_JITTER = 0.1
+
+_PRIME = (1 << 31) - 1
+_EMPTY = np.uint32(_PRIME)
+_rng = np.random.default_rng(412)
+_HASH_A = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_HASH_B = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+
+
+# Function to normalize and clean up book titles
+def normalize_title(title):
+    # Remove common words like "Edition", "Tie-in", "Book X" etc.
+    title = re.sub(r"\(.*\)", "", title)  # Remove anything inside parentheses
+    title = re.sub(
+        r"(Anniversary|Movie Tie-in|Bestselling|Special Edition|Collector's Edition)",
+        "",
+        title,
+        flags=re.IGNORECASE,
+    )
+    title = (
+        title.strip().lower()
+    )  # Convert to lowercase and strip leading/trailing spaces
+    return title
+
+
+def author_key(author):
+    """Order-insensitive key for an author name: "Smith, John" == "john smith"."""
+    author = re.sub(r"[^\w\s]", "", author.lower())
+    return " ".join(sorted(author.split()))
+
+
+def author_names(author):
+    """Author keys for a book's author field, which may be a string or a list."""
+    if not author:
+        return []
+    if isinstance(author, str):
+        author = [author]
+    return [key for key in (author_key(a) for a in author if a) if key]
+
+
+def title_shingles(title):
+    """Character trigrams of the normalized title, padded at word boundaries."""
+    title = f" {' '.join(normalize_title(title or '').split())} "
+    if len(title.strip()) == 0:
+        return set()
+    return {title[i : i + SHINGLE_SIZE] for i in range(len(title) - SHINGLE_SIZE + 1)}
+
+
+def title_signature(title):
+    """MinHash signature (NUM_PERM uint32) of a title's trigrams."""
+    shingles = title_shingles(title)
+    if not shingles:
+        return np.full(NUM_PERM, _EMPTY, dtype=np.uint32)
+    hashes = np.fromiter(
+        (zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles)
+    )
+    permuted = (_HASH_A[:, None] * hashes[None, :] + _HASH_B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def title_similarity(signatures, signature):
+    """Estimated Jaccard similarity of each row of `signatures` to `signature`."""
+    if signature[0] == _EMPTY:
+        return np.zeros(signatures.shape[0])
+    return (signatures == signature).mean(axis=1)
+
+
+def duplicate_mask(signatures, author_ids, signature, authors):
+    """
+    Which candidates duplicate one book: they share an author, or their
+    titles are near-identical.
+    """
+    similar = title_similarity(signatures, signature) >= TITLE_SIMILARITY_THRESHOLD
+    authors = authors[authors >= 0]
+    if authors.size:
+        similar |= np.isin(author_ids, authors).any(axis=1)
+    return similar
+
+
+def mmr_select(
+    relevance,
+    embeddings,
+    signatures,
+    author_ids,
+    k,
+    seeds=(),
+    diversity=MMR_DIVERSITY,
+    jitter=MMR_JITTER,
+    rng=None,
+):
+    """
+    Pick k candidates by maximal marginal relevance.
+
+    relevance, embeddings, signatures and author_ids are parallel arrays for
+    the candidates. seeds is a list of (embedding, signature, author_ids) for
+    books already shown. Each step takes the candidate with the best
+    (1 - diversity) * relevance - diversity * max similarity to the picks so
+    far, after dropping duplicates (shared author or near-identical title)
+    of every pick. Returns candidate positions in pick order.
+    """
+    count = len(relevance)
+    if count == 0 or k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float64)
+    spread = relevance.max() - relevance.min()
+    relevance = (relevance - relevance.min()) / spread if spread > 0 else relevance * 0
+    if jitter:
+        rng = rng or np.random.default_rng()
+        relevance = relevance + jitter * rng.random(count)
+
+    available = np.ones(count, dtype=bool)
+    max_similarity = np.zeros(count)
+    for embedding, signature, authors in seeds:
+        available &= ~duplicate_mask(signatures, author_ids, signature, authors)
+        np.maximum(max_similarity, embeddings @ embedding, out=max_similarity)
+
+    picks = []
+    while len(picks) < k and available.any():
+        marginal = (1 - diversity) * relevance - diversity * max_similarity
+        marginal[~available] = -np.inf
+        pick = int(np.argmax(marginal))
+        picks.append(pick)
+        available[pick] = False
+        available &= ~duplicate_mask(
+            signatures, author_ids, signatures[pick], author_ids[pick]
+        )
+        np.maximum(max_similarity, embeddings @ embeddings[pick], out=max_similarity)
+    return picks
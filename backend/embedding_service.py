@@ -0,0 +1,242 @@
+# backend/embedding_service.py
+"""
+Text embeddings, computed by a separate worker process that owns the model.
+
+    python embedding_service.py      # run the worker (loads the model)
+
+Web processes never import sentence_transformers or torch. They hand
+encoding work to the worker through two Redis lists:
+
+  * QUERY_QUEUE: search queries waiting for a vector. encode_texts pushes
+    one job per text and waits up to QUERY_TIMEOUT for the reply on a
+    per-job result list. If no worker answers, it raises
+    EmbeddingUnavailable and search reports itself unavailable.
+  * BOOK_QUEUE: ids of books without an embedding. request_book_embeddings
+    pushes them and returns at once, so ranking never waits on the model.
+    The worker stores the embedding with a new updated_at and bumps the
+    catalog version. The web processes' catalog follower (load_books.py)
+    then updates their book index.
+
+The worker micro-batches. It waits for a first job, then keeps collecting
+jobs for up to MAX_WAIT seconds or until it has BATCH_SIZE, and encodes them
+in one model call. Query jobs are taken before book jobs. A query whose
+caller has already given up is dropped.
+
+Book jobs are not acknowledged. A book whose job is lost (Redis restarted,
+worker crashed) is requested again when a web process rebuilds its index.
+"""
+import json
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+from cache import bump_catalog_version, redis_client
+from database import collections
+from embedding_store import decode_embedding, encode_embedding, to_bson_embedding
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+QUERY_QUEUE = "embedding_queries"
+BOOK_QUEUE = "embedding_books"
+RESULT_PREFIX = "embedding_result:"
+RESULT_TTL = 60  # seconds an unread result is kept
+QUERY_TIMEOUT = 2.0  # seconds a caller waits for its vector
+BATCH_SIZE = 64
+MAX_WAIT = 0.01  # seconds spent filling a batch after its first job
+POLL_TIMEOUT = 1  # seconds the worker blocks waiting for a first job
+
+books_collection = collections["Books"]
+
+
+class EmbeddingUnavailable(RuntimeError):
+    """No worker answered in time, or Redis is unreachable."""
+
+
+def _blpop(keys, seconds):
+    """BLPOP for at most `seconds`. Redis reads a timeout under a millisecond
+    as 0, which blocks forever, so those return None without a call."""
+    if seconds < 0.001:
+        return None
+    return redis_client.blpop(keys, timeout=seconds)
+
+
+# -----------------------------------------------
+# WEB SIDE
+# -----------------------------------------------
+def encode_texts(texts, timeout=QUERY_TIMEOUT):
+    """
+    float32 embeddings of `texts`, in order, computed by the worker. Raises
+    EmbeddingUnavailable if they do not arrive within `timeout` seconds.
+    """
+    deadline = time.time() + timeout
+    job_ids = [uuid.uuid4().hex for _ in texts]
+    try:
+        redis_client.rpush(
+            QUERY_QUEUE,
+            *[
+                json.dumps({"id": job_id, "text": text, "deadline": deadline})
+                for job_id, text in zip(job_ids, texts)
+            ],
+        )
+        vectors = []
+        for job_id in job_ids:
+            reply = _blpop([RESULT_PREFIX + job_id], deadline - time.time())
+            if reply is None:
+                raise EmbeddingUnavailable("No embedding worker answered in time")
+            vectors.append(decode_embedding(reply[1]))
+        return vectors
+    except EmbeddingUnavailable:
+        raise
+    except Exception as e:
+        raise EmbeddingUnavailable(f"Error requesting embeddings: {e}")
+
+
+def request_book_embeddings(books):
+    """Queue books (documents with an _id) for embedding; returns at once."""
+    book_ids = [str(book["_id"]) for book in books]
+    if not book_ids:
+        return
+    try:
+        redis_client.rpush(BOOK_QUEUE, *book_ids)
+    except Exception as e:
+        print(f"Error queueing book embeddings: {e}")
+
+
+# -----------------------------------------------
+# WORKER
+# -----------------------------------------------
+def load_model(model_name=MODEL_NAME):
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name)
+    print(f"Loaded {model_name}.")
+    return model
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class EmbeddingWorker:
+    """
+    Consumes both queues, encoding each batch with a single model call.
+    `model` is anything with encode(texts, convert_to_numpy=True).
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def _pop(self, limit):
+        """Up to `limit` queued jobs without blocking, queries first."""
+        jobs = []
+        for queue_name in (QUERY_QUEUE, BOOK_QUEUE):
+            if len(jobs) >= limit:
+                break
+            values = redis_client.lpop(queue_name, limit - len(jobs)) or []
+            jobs.extend((queue_name, _decode(value)) for value in values)
+        return jobs
+
+    def next_batch(self, poll_timeout=POLL_TIMEOUT):
+        """
+        Block for a first job, then collect more until BATCH_SIZE jobs are
+        in hand or MAX_WAIT has passed. Returns [(queue name, payload)].
+        """
+        first = redis_client.blpop([QUERY_QUEUE, BOOK_QUEUE], timeout=poll_timeout)
+        if first is None:
+            return []
+        jobs = [(_decode(first[0]), _decode(first[1]))]
+        deadline = time.monotonic() + MAX_WAIT
+        while len(jobs) < BATCH_SIZE:
+            jobs.extend(self._pop(BATCH_SIZE - len(jobs)))
+            if len(jobs) >= BATCH_SIZE:
+                break
+            job = _blpop([QUERY_QUEUE, BOOK_QUEUE], deadline - time.monotonic())
+            if job is None:
+                break
+            jobs.append((_decode(job[0]), _decode(job[1])))
+        return jobs
+
+    def _books_to_embed(self, book_ids):
+        """
+        The queued books that still exist and still lack an embedding. Books
+        without a summary are skipped: encoding "" would store a vector that
+        says nothing about the book.
+        """
+        if not book_ids:
+            return []
+        object_ids = list({ObjectId(book_id) for book_id in book_ids})
+        return [
+            book
+            for book in books_collection.find(
+                {"_id": {"$in": object_ids}}, {"summary": 1, "embedding": 1}
+            )
+            if not book.get("embedding") and str(book.get("summary") or "").strip()
+        ]
+
+    def process(self, jobs):
+        """Encode a batch. Returns (queries answered, books embedded)."""
+        now = time.time()
+        queries = [json.loads(payload) for name, payload in jobs if name == QUERY_QUEUE]
+        queries = [query for query in queries if query["deadline"] > now]
+        books = self._books_to_embed(
+            [payload for name, payload in jobs if name == BOOK_QUEUE]
+        )
+        texts = [query["text"] for query in queries]
+        texts += [str(book["summary"]) for book in books]
+        if not texts:
+            return 0, 0
+
+        vectors = np.asarray(
+            self.model.encode(texts, convert_to_numpy=True), dtype=np.float32
+        )
+        if queries:
+            pipe = redis_client.pipeline()
+            for query, vector in zip(queries, vectors):
+                key = RESULT_PREFIX + query["id"]
+                pipe.rpush(key, encode_embedding(vector))
+                pipe.expire(key, RESULT_TTL)
+            pipe.execute()
+        if books:
+            books_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": book["_id"]},
+                        {
+                            "$set": {
+                                "embedding": to_bson_embedding(vector),
+                                "updated_at": datetime.now(),
+                            }
+                        },
+                    )
+                    for book, vector in zip(books, vectors[len(queries) :])
+                ]
+            )
+            bump_catalog_version()
+        return len(queries), len(books)
+
+    def run_once(self, poll_timeout=POLL_TIMEOUT):
+        """Collect and process one batch. Returns the number of jobs taken."""
+        try:
+            jobs = self.next_batch(poll_timeout)
+        except Exception as e:
+            print(f"Error reading embedding jobs: {e}")
+            time.sleep(poll_timeout)
+            return 0
+        if jobs:
+            try:
+                _, books = self.process(jobs)
+                if books:
+                    print(f"Embedded {books} books.")
+            except Exception as e:
+                print(f"Error processing embedding jobs: {e}")
+        return len(jobs)
+
+    def run(self):
+        while True:
+            self.run_once()
+
+
+if __name__ == "__main__":
+    print("Waiting for embedding jobs...")
+    EmbeddingWorker(load_model()).run()
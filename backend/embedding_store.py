@@ -0,0 +1,176 @@
+# backend/embedding_store.py
+"""
+Compact storage for embeddings.
+
+Embeddings are stored as little-endian float32 bytes: raw in Redis, and as
+BSON Binary in Mongo (1.5 KB per 384-dim vector instead of ~3.5 KB of
+doubles, and a single memcpy to decode). Readers still accept the legacy
+JSON/list formats so existing documents and cache entries keep working.
+
+The full book-embedding matrix can also be written as a snapshot directory
+of .npy files that every gunicorn worker memory-maps, so the matrix lives
+once in the page cache instead of once per process.
+
+    python embedding_store.py snapshot <directory>
+"""
+import json
+import os
+import shutil
+import sys
+import numpy as np
+from bson import Binary, ObjectId
+
+EMBEDDING_DTYPE = np.dtype("<f4")
+SNAPSHOT_ENV = "BOOK_EMBEDDING_SNAPSHOT"
+# Spare zero rows saved after the last book, so books added after the
+# snapshot was taken are appended in place instead of copying the matrix
+SNAPSHOT_HEADROOM = 0.1
+# Name of the pointer file in a versioned snapshot root
+CURRENT_FILE = "CURRENT"
+
+
+def encode_embedding(vector):
+    """float32 bytes for a vector, or b"" if it is missing or empty."""
+    if vector is None or len(vector) == 0:
+        return b""
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).ravel().tobytes()
+
+
+def to_bson_embedding(vector):
+    """The Mongo representation of an embedding: Binary, or [] when empty."""
+    raw = encode_embedding(vector)
+    return Binary(raw) if raw else []
+
+
+def decode_embedding(raw):
+    """
+    Decode an embedding from any stored format (float32 bytes, BSON Binary,
+    a JSON string, or a list) into a float32 array. Returns None if it is
+    missing, empty, or malformed.
+    """
+    if raw is None:
+        return None
+    if isinstance(raw, np.ndarray):
+        vector = raw.astype(EMBEDDING_DTYPE, copy=False).ravel()
+        return vector if vector.size else None
+    if isinstance(raw, (bytes, bytearray, memoryview)):
+        raw = bytes(raw)
+        if raw[:1] == b"[" and raw[-1:] == b"]":
+            try:
+                return decode_embedding(json.loads(raw))
+            except ValueError:
+                pass  # Binary data that happens to look like a JSON list
+        if not raw or len(raw) % EMBEDDING_DTYPE.itemsize:
+            return None
+        return np.frombuffer(raw, dtype=EMBEDDING_DTYPE)
+    if isinstance(raw, str):
+        try:
+            return decode_embedding(json.loads(raw))
+        except ValueError:
+            return None
+    try:
+        vector = np.asarray(raw, dtype=EMBEDDING_DTYPE).ravel()
+    except (TypeError, ValueError):
+        return None
+    return vector if vector.size else None
+
+
+def embedding_list(raw):
+    """An embedding as a plain list of floats ([] if missing), for callers
+    that still work with lists."""
+    vector = decode_embedding(raw)
+    return [] if vector is None else vector.astype(float).tolist()
+
+
+def write_embedding_files(directory, book_ids, embeddings, has_embedding):
+    """Write the snapshot .npy files into an existing directory."""
+    size = len(book_ids)
+    capacity = size + max(16, int(size * SNAPSHOT_HEADROOM))
+    matrix = np.lib.format.open_memmap(
+        os.path.join(directory, "embeddings.npy"),
+        mode="w+",
+        dtype=EMBEDDING_DTYPE,
+        shape=(capacity, embeddings.shape[1]),
+    )
+    matrix[:size] = embeddings[:size]
+    matrix.flush()
+    del matrix
+    ids = np.array([ObjectId(book_id).binary for book_id in book_ids], dtype="S12")
+    np.save(os.path.join(directory, "book_ids.npy"), ids)
+    np.save(
+        os.path.join(directory, "has_embedding.npy"), np.asarray(has_embedding[:size])
+    )
+
+
+def save_snapshot(directory, book_ids, embeddings, has_embedding):
+    """
+    Write a book-embedding snapshot. The files are written to a temporary
+    directory first and swapped in with renames, so readers never see a
+    half-written snapshot.
+    """
+    directory = os.path.abspath(directory)
+    tmp = f"{directory}.tmp-{os.getpid()}"
+    os.makedirs(tmp, exist_ok=True)
+    write_embedding_files(tmp, book_ids, embeddings, has_embedding)
+
+    old = f"{directory}.old-{os.getpid()}"
+    if os.path.exists(directory):
+        os.rename(directory, old)
+    os.rename(tmp, directory)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def load_snapshot(directory):
+    """
+    Memory-map a snapshot. Returns (book_ids, embeddings, has_embedding) or
+    None if there is no readable snapshot. The embedding matrix is mapped
+    copy-on-write: it is shared between processes until one of them writes
+    to a row, which then only copies the touched pages.
+
+    `directory` may also be a versioned catalog snapshot root (see
+    catalog_snapshot.py), in which case its current version is used.
+    """
+    current = os.path.join(directory, CURRENT_FILE)
+    if os.path.exists(current):
+        with open(current, encoding="utf-8") as f:
+            directory = os.path.join(directory, f.read().strip())
+    try:
+        ids = np.load(os.path.join(directory, "book_ids.npy"))
+        has_embedding = np.load(os.path.join(directory, "has_embedding.npy"))
+        embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="c")
+    except (OSError, ValueError) as e:
+        print(f"Could not load embedding snapshot from {directory}: {e}")
+        return None
+    if embeddings.shape[0] < len(ids) or len(has_embedding) != len(ids):
+        print(f"Ignoring inconsistent embedding snapshot in {directory}")
+        return None
+    return [ObjectId(bytes(i)) for i in ids], embeddings, has_embedding
+
+
+def snapshot_directory():
+    """The configured snapshot directory, or None."""
+    return os.getenv(SNAPSHOT_ENV) or None
+
+
+def write_catalog_snapshot(directory):
+    """Build the book index from Mongo and snapshot its embeddings."""
+    from book_index import BookIndex, books_collection
+    from ann_search import ExactSearch
+
+    book_index = BookIndex(search_engine=ExactSearch())
+    book_index.build(books_collection.find({}))
+    with book_index.lock:
+        save_snapshot(
+            directory,
+            book_index.book_ids,
+            book_index.embeddings,
+            book_index.has_embedding,
+        )
+    print(f"Wrote {book_index.size} book embeddings to {directory}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "snapshot":
+        print("Usage: python embedding_store.py snapshot <directory>")
+        sys.exit(1)
+    write_catalog_snapshot(sys.argv[2])
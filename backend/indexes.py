@@ -0,0 +1,200 @@
+# backend/indexes.py
+"""
+Index declarations for every collection, and a command to apply them.
+
+    python indexes.py create     # build missing indexes (safe to rerun)
+    python indexes.py explain    # show which index each hot query uses
+
+INDEXES lists what each collection should have. `create` compares it with
+the indexes that already exist and builds only the missing ones, so it runs
+on every deploy. An index that exists under the same name with different
+keys or options is reported rather than dropped.
+
+HOT_QUERIES are the filters the models and endpoints run on every request.
+`explain` runs each through the query planner and prints the index of the
+winning plan, or COLLSCAN when the query still reads the whole collection.
+"""
+import argparse
+import sys
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from database import collections
+
+# Only string values count towards uniqueness, so documents that never set
+# the field do not collide on null
+_STRING = {"$type": "string"}
+
+INDEXES = {
+    "Books": [
+        IndexModel([("isbn13", ASCENDING)], name="isbn13"),
+        IndexModel([("isbn", ASCENDING)], name="isbn"),
+        IndexModel([("title", ASCENDING)], name="title"),
+    ],
+    "Users": [
+        IndexModel(
+            [("username", ASCENDING)],
+            name="username_unique",
+            unique=True,
+            partialFilterExpression={"username": _STRING},
+        ),
+        IndexModel(
+            [("email_address", ASCENDING)],
+            name="email_address_unique",
+            unique=True,
+            partialFilterExpression={"email_address": _STRING},
+        ),
+        IndexModel([("oauth.access_token", ASCENDING)], name="oauth_access_token"),
+    ],
+    "User_Bookshelf": [
+        IndexModel(
+            [("user_id", ASCENDING), ("book_id", ASCENDING)],
+            name="user_book_unique",
+            unique=True,
+        ),
+        # Serves the per-status shelf reads and the bookshelf aggregation,
+        # which sorts each user's entries by date_finished
+        IndexModel(
+            [
+                ("user_id", ASCENDING),
+                ("status", ASCENDING),
+                ("date_finished", DESCENDING),
+            ],
+            name="user_status_finished",
+        ),
+    ],
+    "Posts": [IndexModel([("book_id", ASCENDING)], name="book_id")],
+    "Comments": [IndexModel([("post_id", ASCENDING)], name="post_id")],
+    "Chat_Messages": [IndexModel([("book_id", ASCENDING)], name="book_id")],
+}
+
+# (description, collection, filter, sort)
+HOT_QUERIES = [
+    ("book by isbn13", "Books", {"isbn13": "9780000000000"}, None),
+    ("book by isbn", "Books", {"isbn": "0000000000"}, None),
+    ("book by title", "Books", {"title": "Title"}, None),
+    ("user by username", "Users", {"username": "reader"}, None),
+    ("user by email", "Users", {"email_address": "reader@example.com"}, None),
+    (
+        "bookshelf entry",
+        "User_Bookshelf",
+        {"user_id": ObjectId(), "book_id": ObjectId()},
+        None,
+    ),
+    (
+        "shelf by status",
+        "User_Bookshelf",
+        {"user_id": ObjectId(), "status": "read"},
+        None,
+    ),
+    (
+        "whole bookshelf, newest first",
+        "User_Bookshelf",
+        {"user_id": ObjectId(), "status": {"$in": ["read", "to-read"]}},
+        [("date_finished", DESCENDING)],
+    ),
+    ("posts of a book", "Posts", {"book_id": ObjectId()}, None),
+    ("comments of a post", "Comments", {"post_id": ObjectId()}, None),
+    ("chat of a book", "Chat_Messages", {"book_id": ObjectId()}, None),
+]
+
+
+def _same_index(existing, model):
+    """Whether an index_information() entry matches an IndexModel."""
+    spec = model.document
+    options = {k: v for k, v in spec.items() if k not in ("key", "name")}
+    return list(existing["key"]) == list(spec["key"].items()) and all(
+        existing.get(k) == v for k, v in options.items()
+    )
+
+
+def ensure_indexes(collection_name, models=None):
+    """
+    Build the declared indexes a collection is missing. Returns a list of
+    (index name, outcome) where outcome is "exists", "created", "conflict"
+    or an error message.
+    """
+    collection = collections[collection_name]
+    models = INDEXES[collection_name] if models is None else models
+    existing = collection.index_information()
+    results = []
+    for model in models:
+        name = model.document["name"]
+        if name in existing:
+            outcome = "exists" if _same_index(existing[name], model) else "conflict"
+            results.append((name, outcome))
+            continue
+        try:
+            collection.create_indexes([model])
+            results.append((name, "created"))
+        except OperationFailure as e:
+            # e.g. duplicate values under a unique index
+            results.append((name, f"Error: {e}"))
+    return results
+
+
+def ensure_all_indexes():
+    """Apply INDEXES to every collection. Returns {collection: results}."""
+    return {name: ensure_indexes(name) for name in INDEXES}
+
+
+def winning_index(plan):
+    """
+    Name of the index a winning plan reads, COLLSCAN if it scans the
+    collection, or None if neither appears. $or plans list each branch under
+    inputStages; their index names are joined with "+".
+    """
+    if plan.get("stage") == "IXSCAN":
+        return plan.get("indexName")
+    if plan.get("stage") == "COLLSCAN":
+        return "COLLSCAN"
+    # Plans from the slot-based engine wrap the stage tree in queryPlan
+    for key in ("queryPlan", "inputStage"):
+        if key in plan:
+            return winning_index(plan[key])
+    names = [winning_index(stage) for stage in plan.get("inputStages", [])]
+    names = [name for name in names if name]
+    if "COLLSCAN" in names:
+        return "COLLSCAN"
+    return "+".join(dict.fromkeys(names)) or None
+
+
+def explain_query(collection_name, query, sort=None):
+    """Index used by the planner's winning plan for `query`."""
+    cursor = collections[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    planner = cursor.explain().get("queryPlanner", {})
+    return winning_index(planner.get("winningPlan", {}))
+
+
+def explain_hot_queries():
+    """(description, collection, index used) for every entry of HOT_QUERIES."""
+    return [
+        (description, name, explain_query(name, query, sort))
+        for description, name, query, sort in HOT_QUERIES
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("command", choices=["create", "explain"])
+    args = parser.parse_args(argv)
+
+    if args.command == "create":
+        failed = False
+        for collection_name, results in ensure_all_indexes().items():
+            for name, outcome in results:
+                print(f"{collection_name}.{name}: {outcome}")
+                failed = failed or outcome not in ("exists", "created")
+        return 1 if failed else 0
+
+    scans = 0
+    for description, collection_name, index in explain_hot_queries():
+        print(f"{collection_name:<16}{description:<32}{index}")
+        scans += index == "COLLSCAN"
+    return 1 if scans else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,53 +4,275 @@ import os
 import threading
 import time
 from bson import ObjectId
-from models.books import books_collection  # Import your MongoDB collection
+from bson.errors import InvalidBSON, InvalidId
+from pymongo.errors import OperationFailure, PyMongoError
+from book_index import sync_indexed_book
+from catalog_store import CatalogStore, is_store_path
+from catalog_snapshot import (
+    CatalogSnapshot,
+    build_snapshot,
+    current_version,
+    snapshot_root as configured_snapshot_root,
+)
+from database import collections
+from embedding_store import embedding_list
+from search_index import get_search_index, reset_search_index, sync_search_index
+
+books_collection = collections["Books"]
+
+# How often snapshot-mode workers check CURRENT for a new version, and how
+# long a worker waits for another process's first build before giving up
+SNAPSHOT_POLL_SECONDS = 30
+SNAPSHOT_WAIT_SECONDS = 300
+
+# Delta refreshes: change streams when Mongo supports them (replica sets),
+# otherwise polling for new _ids and newer updated_at values
+CATALOG_CACHE_ENV = "BOOK_CATALOG_CACHE"
+CHANGE_POLL_SECONDS = 60
+CACHE_SAVE_SECONDS = 300
+# Mongo's error code for $changeStream on a standalone server
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def _from_cache_entry(book):
+    return {
+        **book,
+        "_id": ObjectId(book["_id"]),
+        "publication_date": datetime.fromisoformat(book["publication_date"]),
+        **(
+            {"updated_at": datetime.fromisoformat(book["updated_at"])}
+            if book.get("updated_at")
+            else {}
+        ),
+    }
+
+
+def _to_cache_entry(book):
+    formatted_book = {
+        **book,
+        "_id": str(book["_id"]),
+        "publication_date": (
+            book["publication_date"]
+            if isinstance(book.get("publication_date"), str)
+            else (
+                book["publication_date"].isoformat()
+                if book.get("publication_date")
+                else "2000-01-01"
+            )
+        ),
+    }
+    if isinstance(book.get("updated_at"), datetime):
+        formatted_book["updated_at"] = book["updated_at"].isoformat()
+    if "embedding" in book:
+        # Stored as BSON Binary, which JSON cannot hold
+        formatted_book["embedding"] = embedding_list(book["embedding"])
+    return formatted_book
 
 
 class BookCollection:
-    def __init__(self, cache_file="books_cache.json"):
+    def __init__(self, cache_file="books_cache.json", snapshot_root=None):
         """
-        Initializes the BookCollection and starts a background thread to refresh books.
-        :param refresh_interval: Time in seconds before refreshing (default: 24 hours)
+        Initializes the BookCollection. Call start() to keep it up to date: it
+        follows the Books change stream when the server supports one, otherwise
+        it polls for new _id/updated_at values and re-reads the whole catalog
+        every refresh_interval seconds (24 hours). In snapshot mode the
+        snapshot is rebuilt on that interval instead of the cache.
+        :param cache_file: JSON cache file, or a binary catalog store if the name
+            ends in .bin (see catalog_store.py)
+        :param snapshot_root: Directory of a shared catalog snapshot (see
+            catalog_snapshot.py; defaults to BOOK_CATALOG_SNAPSHOT). When set, books
+            are read from the memory-mapped snapshot instead of the JSON cache, so
+            gunicorn workers share one copy. Lookups by id/isbn need full documents
+            and are only served without a snapshot.
         """
-        self.books = []
-        self.lock = threading.Lock()
+        self.by_id = {}
+        self.by_isbn = {}
+        self.by_isbn13 = {}
+        # Binary store mode: the mapped store backs the lookups, by_id and
+        # friends only hold books changed since it was written, and `removed`
+        # the ids deleted since
+        self.store = None
+        self.removed = set()
+        self.lock = threading.RLock()
         self.cache_file = cache_file
         self.refresh_interval = 86400  # 24 hours in seconds
+        self.snapshot_root = snapshot_root or configured_snapshot_root()
+        self.snapshot = None
+        # Delta refresh state: the newest _id and updated_at seen, and the
+        # change stream position to resume from
+        self.last_id = None
+        self.last_updated = None
+        self.resume_token = None
+        self.dirty = False
+        self.last_saved = time.time()
 
         # Load books from cache or database
         self.load_books()
 
         # Start background refresh thread
+        if self.snapshot is not None:
+            threading.Thread(target=self._snapshot_loop, daemon=True).start()
+
+    @property
+    def documents(self):
+        """True when full book documents are held (not snapshot mode)."""
+        return self.snapshot is None
+
+    @property
+    def books(self):
+        with self.lock:
+            if self.snapshot is not None:
+                return self.snapshot
+            if self.store is not None:
+                return list(self._store_books(self.store, self.by_id, self.removed))
+            return list(self.by_id.values())
 
     def load_books(self):
         """Loads books from JSON cache file if available, otherwise fetches from MongoDB."""
-        if os.path.exists(self.cache_file):
+        if self.snapshot_root:
+            self.load_snapshot()
+            if self.snapshot is not None:
+                return
+            print("Catalog snapshot unavailable, falling back to the JSON cache.")
+        if is_store_path(self.cache_file):
+            if not self.load_store():
+                self.refresh_books()
+        elif os.path.exists(self.cache_file):
             with open(self.cache_file, "r", encoding="utf-8") as f:
                 cached_books = json.load(f)
 
             # Convert _id from string back to ObjectId
-            self.books = [
-                {
-                    **book,
-                    "_id": ObjectId(book["_id"]),
-                    "publication_date": datetime.fromisoformat(
-                        book["publication_date"]
-                    ),
-                }
-                for book in cached_books
-            ]
+            self._replace_books([_from_cache_entry(book) for book in cached_books])
             print(
-                f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Loaded {len(self.books)} books from cache."
+                f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Loaded {len(self.by_id)} books from cache."
             )
         else:
             self.refresh_books()
 
+    def _replace_books(self, books):
+        with self.lock:
+            self.by_id, self.by_isbn, self.by_isbn13 = {}, {}, {}
+            self.store, self.removed = None, set()
+            self.last_id = self.last_updated = None
+            for book in books:
+                self._put(book)
+        # Rebuilt from the new documents on the next search
+        reset_search_index()
+
+    def _put(self, book):
+        """Insert or replace one book in the lookup tables (lock held)."""
+        old = self.by_id.get(book["_id"])
+        if old is not None:
+            self._unlink_identifiers(old)
+        self.by_id[book["_id"]] = book
+        self.removed.discard(book["_id"])
+        if book.get("isbn"):
+            self.by_isbn[book["isbn"]] = book
+        if book.get("isbn13"):
+            self.by_isbn13[book["isbn13"]] = book
+        if self.last_id is None or book["_id"] > self.last_id:
+            self.last_id = book["_id"]
+        updated_at = book.get("updated_at")
+        if isinstance(updated_at, datetime) and (
+            self.last_updated is None or updated_at > self.last_updated
+        ):
+            self.last_updated = updated_at
+
+    def _unlink_identifiers(self, book):
+        if self.by_isbn.get(book.get("isbn")) is book:
+            del self.by_isbn[book["isbn"]]
+        if self.by_isbn13.get(book.get("isbn13")) is book:
+            del self.by_isbn13[book["isbn13"]]
+
+    def load_store(self):
+        """
+        Map a binary catalog store (see catalog_store.py). Nothing is decoded
+        up front: lookups decode the one record they need, and embeddings are
+        views into the mapped block. Returns False if there is no valid store.
+        """
+        store = CatalogStore.open(self.cache_file)
+        if store is None:
+            return False
+        self._use_store(store)
+        # Rebuilt from the new documents on the next search
+        reset_search_index()
+        print(
+            f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Mapped {len(store)} books from {self.cache_file}."
+        )
+        return True
+
+    def _use_store(self, store, keep=None, keep_removed=()):
+        """Serve from `store`, keeping the deltas in `keep` and `keep_removed`
+        (books changed after it was written). The search index already holds
+        those books, so it is left alone."""
+        with self.lock:
+            self.store = store
+            self.by_id, self.by_isbn, self.by_isbn13 = {}, {}, {}
+            self.removed = set(keep_removed)
+            self.last_id, self.last_updated = store.last_id, store.last_updated
+            for book in (keep or {}).values():
+                self._put(book)
+
+    @staticmethod
+    def _decode(store, row):
+        try:
+            return store[row]
+        except InvalidBSON as e:
+            print(f"Skipping damaged record {row} of the catalog store: {e}")
+            return None
+
+    def _store_books(self, store, changed, removed):
+        """Every current book: the store's, minus changed or removed ones,
+        then the changed ones. Decodes the whole store as it goes."""
+        for row in range(len(store)):
+            book_id = store.book_id(row)
+            if book_id not in changed and book_id not in removed:
+                book = self._decode(store, row)
+                if book is not None:
+                    yield book
+        yield from changed.values()
+
+    def book_ids(self):
+        """The _ids of every current book, without decoding the store
+        (not snapshot mode)."""
+        with self.lock:
+            ids = set(self.by_id)
+            store, removed = self.store, set(self.removed)
+        if store is not None:
+            ids.update(store.book_id(row) for row in range(len(store)))
+            ids -= removed
+        return ids
+
     def refresh_books(self):
-        """Fetches all books from MongoDB and updates the cache file."""
+        """
+        Fetches all books from MongoDB and updates the cache file. Polling
+        cannot see deletions, so books missing from the new catalog are also
+        removed from the resident book index here.
+        """
+        old_ids = self.book_ids()
+        self._reload_books()
+        for book_id in old_ids - self.book_ids():
+            sync_indexed_book({"_id": book_id}, deleted=True)
+
+    def _reload_books(self):
         print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Refreshing book collection...")
 
         start_time = time.time()
+        if is_store_path(self.cache_file):
+            # Stream the cursor straight into the store, then serve from it
+            store = CatalogStore.create(self.cache_file, books_collection.find({}))
+            self._use_store(store)
+            reset_search_index()
+            self.dirty = False
+            self.last_saved = time.time()
+            print(
+                f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Book collection updated ({len(store)} books) in {time.time() - start_time:.4f} seconds."
+            )
+            return
+
         new_books = list(books_collection.find({}))
 
         books_to_cache = []
@@ -58,48 +280,276 @@ class BookCollection:
 
         for book in new_books:
             try:
-                formatted_book = {
-                    **book,
-                    "_id": str(book["_id"]),
-                    "publication_date": (
-                        book["publication_date"]
-                        if isinstance(book.get("publication_date"), str)
-                        else (
-                            book["publication_date"].isoformat()
-                            if book.get("publication_date")
-                            else "2000-01-01"
-                        )
-                    ),
-                }
-                books_to_cache.append(formatted_book)
+                books_to_cache.append(_to_cache_entry(book))
                 valid_books.append(book)
             except Exception as e:
                 print(
                     f"Error processing book with _id {book.get('_id', 'UNKNOWN')}: {e}"
                 )
 
-        with self.lock:
-            self.books = valid_books  # Only store successfully processed books
-
-        # Save to JSON cache file
-        with open(self.cache_file, "w", encoding="utf-8") as f:
-            json.dump(books_to_cache, f, indent=4)
+        # Only store successfully processed books
+        self._replace_books(valid_books)
+        self._write_cache(books_to_cache)
 
         elapsed_time = time.time() - start_time
         print(
             f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Book collection updated ({len(valid_books)} books) in {elapsed_time:.4f} seconds."
         )
 
-    def _refresh_loop(self):
-        """Runs a loop to refresh the book collection every 24 hours."""
+    def _write_cache(self, books_to_cache):
+        # Compact and written beside the old file, so a crash mid-write never
+        # leaves a truncated cache behind
+        tmp = f"{self.cache_file}.tmp-{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(books_to_cache, f, separators=(",", ":"))
+        os.replace(tmp, self.cache_file)
+        self.dirty = False
+        self.last_saved = time.time()
+
+    def save_cache(self):
+        """Write the cache file if deltas have been applied since the last save."""
+        if not self.dirty:
+            return
+        if is_store_path(self.cache_file) and self.store is not None:
+            # Merge the deltas into a new store without holding the lock, then
+            # keep only the deltas that arrived while it was being written
+            with self.lock:
+                store = self.store
+                changed, removed = dict(self.by_id), set(self.removed)
+                self.dirty = False
+            try:
+                new_store = CatalogStore.create(
+                    self.cache_file, self._store_books(store, changed, removed)
+                )
+            except Exception:
+                self.dirty = True
+                raise
+            with self.lock:
+                later = {
+                    book_id: book
+                    for book_id, book in self.by_id.items()
+                    if changed.get(book_id) is not book
+                }
+                self._use_store(new_store, later, self.removed - removed)
+            self.last_saved = time.time()
+            return
+        with self.lock:
+            books_to_cache = [_to_cache_entry(book) for book in self.by_id.values()]
+        self._write_cache(books_to_cache)
+
+    # Lookups
+
+    def get_book(self, book_id):
+        """The cached book with this _id (ObjectId or string), or None."""
+        try:
+            book_id = ObjectId(book_id)
+        except (InvalidId, TypeError):
+            return None
+        with self.lock:
+            book = self.by_id.get(book_id)
+            store = self.store if book_id not in self.removed else None
+        if book is None and store is not None:
+            row = store.row_of(book_id)
+            return self._decode(store, row) if row is not None else None
+        return dict(book) if book is not None else None
+
+    def _get_by_identifier(self, table, column, value):
+        with self.lock:
+            book = table.get(value)
+            store = self.store
+        if book is not None:
+            return dict(book)
+        if store is None:
+            return None
+        row = store.row_of_isbn(column, value)
+        if row is None:
+            return None
+        with self.lock:
+            # A changed book is only found through its new identifiers
+            book_id = store.book_id(row)
+            if book_id in self.by_id or book_id in self.removed:
+                return None
+        return self._decode(store, row)
+
+    def get_book_by_isbn(self, isbn):
+        return self._get_by_identifier(self.by_isbn, "isbn", isbn)
+
+    def get_book_by_isbn13(self, isbn13):
+        return self._get_by_identifier(self.by_isbn13, "isbn13", isbn13)
+
+    # Delta refreshes
+
+    def apply_upsert(self, book):
+        """Apply an inserted or updated book document."""
+        with self.lock:
+            self._put(book)
+            self.dirty = True
+        sync_indexed_book(book)
+        sync_search_index(book)
+
+    def apply_delete(self, book_id):
+        with self.lock:
+            book = self.by_id.pop(book_id, None)
+            if book is not None:
+                self._unlink_identifiers(book)
+            elif self.store is None or self.store.row_of(book_id) is None:
+                return
+            if self.store is not None:
+                self.removed.add(book_id)
+            self.dirty = True
+        sync_indexed_book({"_id": book_id}, deleted=True)
+        sync_search_index({"_id": book_id}, deleted=True)
+
+    def apply_change(self, change):
+        """Apply one change stream event."""
+        operation = change.get("operationType")
+        if operation in ("insert", "update", "replace"):
+            if change.get("fullDocument"):
+                self.apply_upsert(change["fullDocument"])
+            else:  # deleted again before the update could be looked up
+                self.apply_delete(change["documentKey"]["_id"])
+        elif operation == "delete":
+            self.apply_delete(change["documentKey"]["_id"])
+        self.resume_token = change.get("_id", self.resume_token)
+
+    def poll_changes(self):
+        """
+        Fetch books inserted (newer _id) or updated (newer updated_at) since the
+        last refresh. Deletions are not visible to polling; they are picked
+        up by the periodic full refresh. Returns the number of books applied.
+        """
+        clauses = []
+        if self.last_id is not None:
+            clauses.append({"_id": {"$gt": self.last_id}})
+        if self.last_updated is not None:
+            clauses.append({"updated_at": {"$gt": self.last_updated}})
+        query = {"$or": clauses} if clauses else {}
+        count = 0
+        for book in books_collection.find(query):
+            self.apply_upsert(book)
+            count += 1
+        return count
+
+    def watch_changes(self):
+        """Apply change stream events until the stream fails."""
+        with books_collection.watch(
+            full_document="updateLookup", resume_after=self.resume_token
+        ) as stream:
+            # Catch up on anything written while the stream was not open
+            self.poll_changes()
+            for change in stream:
+                self.apply_change(change)
+                if time.time() - self.last_saved > CACHE_SAVE_SECONDS:
+                    self.save_cache()
+
+    def _poll_loop(self):
+        next_full_refresh = time.time() + self.refresh_interval
         while True:
-            time.sleep(self.refresh_interval)
-            self.refresh_books()
+            time.sleep(CHANGE_POLL_SECONDS)
+            try:
+                if time.time() >= next_full_refresh:
+                    next_full_refresh = time.time() + self.refresh_interval
+                    self.refresh_books()
+                elif self.poll_changes() or self.dirty:
+                    if time.time() - self.last_saved > CACHE_SAVE_SECONDS:
+                        self.save_cache()
+            except Exception as e:
+                print(f"Error polling book changes: {e}")
+
+    def _change_loop(self):
+        """Follow the change stream, falling back to polling without one."""
+        while True:
+            try:
+                self.watch_changes()
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    print("Change streams unsupported, polling for book changes.")
+                    return self._poll_loop()
+                print(f"Book change stream failed: {e}")
+                self.resume_token = None
+            except PyMongoError as e:
+                print(f"Book change stream interrupted: {e}")
+            time.sleep(CHANGE_POLL_SECONDS)
+
+    def start(self):
+        """Keep the catalog up to date in the background."""
+        if self.snapshot is None:
+            threading.Thread(
+                target=self._change_loop, daemon=True, name="book-catalog"
+            ).start()
+        return self
+
+    # Shared snapshot mode
+
+    def load_snapshot(self):
+        """
+        Attach to the current snapshot version, building the first one if no
+        other worker is already doing so.
+        """
+        snapshot = CatalogSnapshot.attach(self.snapshot_root)
+        if snapshot is None and build_snapshot(self.snapshot_root) is None:
+            # Another process holds the build lock; wait for its version
+            deadline = time.time() + SNAPSHOT_WAIT_SECONDS
+            while current_version(self.snapshot_root) is None:
+                if time.time() > deadline:
+                    return
+                time.sleep(1)
+        snapshot = snapshot or CatalogSnapshot.attach(self.snapshot_root)
+        if snapshot is not None:
+            self._swap_snapshot(snapshot)
+
+    def _swap_snapshot(self, snapshot):
+        with self.lock:
+            self.snapshot = snapshot
+        print(
+            f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] Attached catalog snapshot "
+            f"v{snapshot.version} ({len(snapshot)} books)."
+        )
+
+    def check_snapshot(self):
+        """Swap to a newer snapshot version if one has been published."""
+        name = current_version(self.snapshot_root)
+        if name and name != os.path.basename(self.snapshot.directory):
+            snapshot = CatalogSnapshot.attach(self.snapshot_root)
+            if snapshot is not None:
+                # The old mapping is released once no reader holds it
+                self._swap_snapshot(snapshot)
+
+    def _snapshot_loop(self):
+        """Hot-swap new versions and rebuild once per refresh interval.
+        The build lock makes sure only one worker does the rebuilding."""
+        next_build = time.time() + self.refresh_interval
+        while True:
+            time.sleep(SNAPSHOT_POLL_SECONDS)
+            try:
+                if time.time() >= next_build:
+                    next_build = time.time() + self.refresh_interval
+                    build_snapshot(self.snapshot_root)
+                self.check_snapshot()
+            except Exception as e:
+                print(f"Error refreshing catalog snapshot: {e}")
 
     def get_books(self):
-        """Returns all books from memory."""
+        """Returns all books from memory (a read-only sequence in snapshot mode)."""
         with self.lock:
             return self.books.copy()  # Return a copy to prevent modifications
 
 
-# books = BookCollection()
+def get_catalog():
+    """The process-wide catalog cache, or None if it was not started."""
+    return _catalog
+
+
+def start_catalog(cache_file=None):
+    """
+    Load the catalog cache and start following book changes. Called by
+    main.py when BOOK_CATALOG_CACHE names the cache file.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            cache_file = cache_file or os.getenv(CATALOG_CACHE_ENV, "books_cache.json")
+            _catalog = BookCollection(cache_file=cache_file).start()
+            # Build the search index now rather than on the first search
+            threading.Thread(target=get_search_index, daemon=True).start()
+    return _catalog
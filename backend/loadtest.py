@@ -0,0 +1,118 @@
+# backend/loadtest.py
+"""
+Concurrency load test comparing the sync and async serving modes.
+
+Start each server against the same Mongo, Redis and catalog, one at a time:
+
+    gunicorn main:app --workers 4 --bind 0.0.0.0:8000     # sync (Flask)
+    uvicorn asgi:app --workers 4 --port 8000              # async (asgi.py)
+
+then run, for each:
+
+    python loadtest.py http://localhost:8000 --user-id <id> --token <id token>
+
+Every endpoint is driven by `concurrency` clients that send requests back to
+back for `duration` seconds. The script prints requests per second and
+latency percentiles for each endpoint and concurrency level. Requests that
+fail or return an error status are counted separately. A throughput that
+stops growing with concurrency shows that the server is saturated. Without
+--token, only the endpoints that need no sign-in are run.
+"""
+import argparse
+import asyncio
+import sys
+import time
+import httpx
+
+
+def endpoints(user_id, search="love"):
+    """(name, path, needs a token) for each endpoint exercised."""
+    return [
+        ("recommendations", f"/recs/api/user/{user_id}/recommendations", False),
+        ("profile by id", f"/user/profile/{user_id}", False),
+        ("own profile", "/user/profile", True),
+        ("shelves", f"/shelf/api/user/{user_id}/bookshelf", False),
+        ("book search", f"/api/books?query={search}", False),
+    ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float("nan")
+    index = min(int(fraction * len(sorted_values)), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (ms) of one run."""
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+    }
+
+
+async def run(client, path, headers, concurrency, duration):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.get(path, headers=headers)
+                ok = response.status_code < 400
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def main_async(args):
+    token_headers = {"Authorization": f"Bearer {args.token}"}
+    limits = httpx.Limits(max_connections=max(args.concurrency))
+    async with httpx.AsyncClient(
+        base_url=args.url, timeout=args.timeout, limits=limits
+    ) as client:
+        print(f"{'endpoint':<18}{'conc':>6}{'req/s':>10}{'p50 ms':>10}", end="")
+        print(f"{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for name, path, needs_token in endpoints(args.user_id, args.search):
+            if needs_token and not args.token:
+                continue
+            headers = token_headers if needs_token else {}
+            for concurrency in args.concurrency:
+                stats = await run(client, path, headers, concurrency, args.duration)
+                print(
+                    f"{name:<18}{concurrency:>6}{stats['rps']:>10.1f}"
+                    f"{stats['p50']:>10.1f}{stats['p95']:>10.1f}"
+                    f"{stats['p99']:>10.1f}{stats['errors']:>8}"
+                )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("url")
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--token", help="a Google ID token for /user/profile")
+    parser.add_argument("--search", default="love", help="the book search query")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args(argv)
+    asyncio.run(main_async(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
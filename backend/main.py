@@ -7,27 +7,25 @@ from api.recommendations import recommendation_bp
 from api.posts import discussion_bp
 from api.comments import comments_bp
 from api.chat_messages import chat_bp
+from load_books import CATALOG_CACHE_ENV, start_catalog
+from user_context import begin_request
 import os
 
 app = Flask(__name__)
 
 # Enable CORS for specific origins and handle OPTIONS requests
+CORS_ORIGINS = [
+    "http://localhost:3000",
+    "https://readers-recs-git-testing-dev-kaitlyngrifs-projects.vercel.app",
+    "https://readers-recs-one.vercel.app",
+    "https://readers-recs-git-testing-dev-kaitlyngrifs-projects.vercel.app",
+    "https://readers-recs-git-development-kaitlyngrifs-projects.vercel.app",
+    "https://csce412kgriffin.xyz",
+    "https://readers-recs-production.up.railway.app",
+]
 CORS(
     app,
-    resources={
-        r"/*": {
-            "origins": [
-                "http://localhost:3000",
-                "https://readers-recs-git-testing-dev-kaitlyngrifs-projects.vercel.app",
-                "https://readers-recs-one.vercel.app",
-                "https://readers-recs-git-testing-dev-kaitlyngrifs-projects.vercel.app",
-                "https://readers-recs-git-development-kaitlyngrifs-projects.vercel.app",
-                "https://csce412kgriffin.xyz",
-                "https://readers-recs-production.up.railway.app",
-            ],
-            "supports_credentials": True,
-        }
-    },
+    resources={r"/*": {"origins": CORS_ORIGINS, "supports_credentials": True}},
 )
 
 
@@ -40,12 +38,19 @@ app.register_blueprint(discussion_bp, url_prefix="/api/books")
 app.register_blueprint(comments_bp, url_prefix="/api/posts")
 app.register_blueprint(chat_bp, url_prefix="/api/chat")
 
+# Keep an in-memory catalog that follows book changes, for lookups by id/isbn
+# and for building the recommender's book index
+if os.getenv(CATALOG_CACHE_ENV):
+    start_catalog(os.getenv(CATALOG_CACHE_ENV))
+
 
 # Explicit handling for preflight OPTIONS requests
 @app.before_request
 def before_request():
     if request.method == "OPTIONS":
         return "", 200  # Respond with HTTP 200 for OPTIONS requests
+    # Users read while serving the request are loaded once (user_context.py)
+    begin_request()
 
 
 if __name__ == "__main__":
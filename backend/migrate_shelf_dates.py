@@ -0,0 +1,96 @@
+# backend/migrate_shelf_dates.py
+"""
+Convert shelf entries' date_finished from ISO strings to dates.
+
+    python migrate_shelf_dates.py              # convert (safe to rerun)
+    python migrate_shelf_dates.py --dry-run    # count the strings left
+
+Entries created through UserBookshelfSchema store date_finished as a BSON
+date, but update_user_bookshelf_status used to store an ISO string. The
+shelf aggregation sorts on date_finished, and Mongo orders every date ahead
+of every string, so the "read" shelf was not newest first. Strings without
+a UTC offset are read as US Central time, as api/bookshelf.parse_date does.
+Strings that do not parse are left alone and counted as invalid.
+"""
+import argparse
+import sys
+from datetime import datetime
+import pytz
+from pymongo import ASCENDING, UpdateOne
+from database import collections
+
+BATCH_SIZE = 1000
+
+_STRING = {"$type": "string"}
+
+
+def parse_finished(value):
+    """The datetime an ISO string names, or None."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed.tzinfo is None:
+        parsed = pytz.timezone("US/Central").localize(parsed)
+    return parsed
+
+
+def migrate_dates(batch_size=BATCH_SIZE):
+    """Convert every string date_finished. Returns counts by outcome."""
+    shelf = collections["User_Bookshelf"]
+    stats = {"converted": 0, "invalid": 0}
+    last_id = None
+    while True:
+        query = {"date_finished": _STRING}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(
+            shelf.find(query, {"date_finished": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not batch:
+            return stats
+        updates = []
+        for entry in batch:
+            finished = parse_finished(entry["date_finished"])
+            if finished is None:
+                stats["invalid"] += 1
+                continue
+            # Only if the entry was not rewritten since it was read
+            updates.append(
+                UpdateOne(
+                    {"_id": entry["_id"], "date_finished": entry["date_finished"]},
+                    {"$set": {"date_finished": finished}},
+                )
+            )
+        if updates:
+            stats["converted"] += shelf.bulk_write(
+                updates, ordered=False
+            ).modified_count
+        last_id = batch[-1]["_id"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.dry_run:
+            count = collections["User_Bookshelf"].count_documents(
+                {"date_finished": _STRING}
+            )
+            print(f"User_Bookshelf: {count} string dates")
+            return 0
+        stats = migrate_dates(args.batch_size)
+        print("User_Bookshelf: " + ", ".join(f"{n} {k}" for k, n in stats.items()))
+        return 0
+    except Exception as e:
+        print(f"Error migrating shelf dates: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
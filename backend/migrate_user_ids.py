@@ -0,0 +1,198 @@
+# backend/migrate_user_ids.py
+"""
+Convert every stored user id to an ObjectId.
+
+    python migrate_user_ids.py              # migrate (resumable, safe to rerun)
+    python migrate_user_ids.py --dry-run    # count the string ids left
+
+Users created through the API have ObjectId _ids, but the scraper gave its
+users string _ids, and shelf entries stored user_id as a string. Lookups
+therefore matched both forms. After this runs, every user id is the
+ObjectId of the same hex (mongo_id_utils.canonical_id), and each lookup is
+one equality query on an indexed field.
+
+The user_id of shelf entries, posts, comments and chat messages is updated
+in place with bulk_write, BATCH_SIZE documents at a time. After each batch
+the last _id written is checkpointed in the Migrations collection, so a rerun
+starts after it. A string user_id whose ObjectId form is already on the
+shelf (a duplicate under the unique (user_id, book_id) index) is deleted.
+
+A string _id cannot be changed in place, so those users are deleted and
+inserted again under the ObjectId. The old document has to go first because
+its username and email are unique. Each batch is therefore journaled in
+Migrations before it is deleted, and a run interrupted between the two
+steps replays the journal. A user that already exists under the ObjectId is
+kept as it is.
+
+Ids that are not ObjectId hex strings are left alone and counted as invalid.
+"""
+import argparse
+import sys
+from bson import ObjectId
+from pymongo import ASCENDING, DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from database import collections
+from mongo_id_utils import canonical_id
+
+MIGRATION_ID = "user_ids_to_object_id"
+REFERENCING_COLLECTIONS = ("User_Bookshelf", "Posts", "Comments", "Chat_Messages")
+BATCH_SIZE = 1000
+USER_BATCH_SIZE = 100  # whole user documents are journaled
+DUPLICATE_KEY = 11000
+
+_STRING = {"$type": "string"}
+
+
+def _state():
+    return collections["Migrations"].find_one({"_id": MIGRATION_ID}) or {}
+
+
+def _save_state(fields):
+    collections["Migrations"].update_one(
+        {"_id": MIGRATION_ID}, {"$set": fields}, upsert=True
+    )
+
+
+def count_string_ids():
+    """{collection: number of user ids still stored as strings}."""
+    counts = {"Users": collections["Users"].count_documents({"_id": _STRING})}
+    for name in REFERENCING_COLLECTIONS:
+        counts[name] = collections[name].count_documents({"user_id": _STRING})
+    return counts
+
+
+def _rekey_users(users):
+    """
+    Delete string-keyed users and insert them under their ObjectId. Safe to
+    replay. Returns how many were inserted; the rest already existed.
+    """
+    users_collection = collections["Users"]
+    users_collection.bulk_write([DeleteOne({"_id": user["_id"]}) for user in users])
+    result = users_collection.bulk_write(
+        [
+            UpdateOne(
+                {"_id": ObjectId(user["_id"])},
+                {"$setOnInsert": {k: v for k, v in user.items() if k != "_id"}},
+                upsert=True,
+            )
+            for user in users
+        ]
+    )
+    return result.upserted_count
+
+
+def migrate_users(batch_size=USER_BATCH_SIZE):
+    """Move users with a string _id to the ObjectId of the same hex."""
+    stats = {"converted": 0, "duplicates": 0, "invalid": 0}
+    pending = _state().get("pending_users")
+    if pending:
+        # An earlier run stopped after deleting these
+        inserted = _rekey_users(pending)
+        _save_state({"pending_users": []})
+        stats["converted"] += inserted
+        stats["duplicates"] += len(pending) - inserted
+
+    after = ""
+    while True:
+        batch = list(
+            collections["Users"]
+            .find({"_id": {**_STRING, "$gt": after}})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not batch:
+            return stats
+        after = batch[-1]["_id"]
+        users = [user for user in batch if canonical_id(user["_id"])]
+        stats["invalid"] += len(batch) - len(users)
+        if not users:
+            continue
+        _save_state({"pending_users": users})
+        inserted = _rekey_users(users)
+        _save_state({"pending_users": []})
+        stats["converted"] += inserted
+        stats["duplicates"] += len(users) - inserted
+
+
+def _write_references(collection, filters, requests):
+    """
+    bulk_write the conversions. Entries that collide with their ObjectId
+    twin under a unique index are deleted. Returns (converted, duplicates).
+    """
+    try:
+        return collection.bulk_write(requests, ordered=False).modified_count, 0
+    except BulkWriteError as e:
+        errors = e.details["writeErrors"]
+        if any(error["code"] != DUPLICATE_KEY for error in errors):
+            raise
+        collection.bulk_write(
+            [DeleteOne(filters[error["index"]]) for error in errors], ordered=False
+        )
+        return e.details["nModified"], len(errors)
+
+
+def migrate_references(collection_name, batch_size=BATCH_SIZE):
+    """Convert string user_id values of a collection, resuming at its checkpoint."""
+    collection = collections[collection_name]
+    stats = {"converted": 0, "duplicates": 0, "invalid": 0}
+    after = _state().get("checkpoints", {}).get(collection_name)
+    while True:
+        query = {"user_id": _STRING}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        batch = list(
+            collection.find(query, {"user_id": 1})
+            .sort("_id", ASCENDING)
+            .limit(batch_size)
+        )
+        if not batch:
+            return stats
+
+        filters, requests = [], []
+        for entry in batch:
+            user_id = canonical_id(entry["user_id"])
+            if user_id is None:
+                stats["invalid"] += 1
+                continue
+            # Matching the string too makes a replayed batch a no-op
+            filters.append({"_id": entry["_id"], "user_id": entry["user_id"]})
+            requests.append(UpdateOne(filters[-1], {"$set": {"user_id": user_id}}))
+        if requests:
+            converted, duplicates = _write_references(collection, filters, requests)
+            stats["converted"] += converted
+            stats["duplicates"] += duplicates
+
+        after = batch[-1]["_id"]
+        _save_state({f"checkpoints.{collection_name}": after})
+
+
+def migrate_all(batch_size=BATCH_SIZE):
+    """Run the whole migration. Returns {collection: stats}."""
+    results = {"Users": migrate_users(min(batch_size, USER_BATCH_SIZE))}
+    for name in REFERENCING_COLLECTIONS:
+        results[name] = migrate_references(name, batch_size)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.dry_run:
+            for name, count in count_string_ids().items():
+                print(f"{name}: {count} string ids")
+            return 0
+        for name, stats in migrate_all(args.batch_size).items():
+            print(f"{name}: " + ", ".join(f"{n} {k}" for k, n in stats.items()))
+        return 0
+    except Exception as e:
+        # Progress up to the last completed batch is kept; rerun to resume
+        print(f"Error migrating user ids: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,17 +2,71 @@
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
 from datetime import datetime, date
+from pymongo import ReturnDocument
 from pymongo.errors import DuplicateKeyError
 from pydantic import ValidationError
 from schemas import BookSchema
 from database import collections
+from book_index import drop_indexed_book, refresh_indexed_book, upsert_indexed_book
+from embedding_store import to_bson_embedding
+from load_books import get_catalog
+from mongo_id_utils import forget_object_id
 import numpy as np
 
 books_collection = collections["Books"]
 
-# isbn and isbn13 need to be unique
-# books_collection.create_index("isbn", unique=True)
-# books_collection.create_index("isbn13", unique=True)
+# Indexes for this collection are declared in indexes.py
+
+# Named projections for reading books; callers ask for what they need.
+#   card    a book tile in a list: cover, title, author, length, genres
+#   detail  everything shown to a client, i.e. all but the embedding
+#   ml      what the recommender reads: text, genres and the embedding
+BOOK_PROJECTIONS = {
+    "card": {
+        "title": 1,
+        "author": 1,
+        "cover_image": 1,
+        "page_count": 1,
+        "genre_tags": 1,
+    },
+    "detail": {"embedding": 0},
+    "ml": {"title": 1, "author": 1, "genre_tags": 1, "summary": 1, "embedding": 1},
+}
+
+
+def book_projection(projection):
+    """Resolve a BOOK_PROJECTIONS name; projection dicts (or None) pass through."""
+    if isinstance(projection, str):
+        return BOOK_PROJECTIONS[projection]
+    return projection
+
+
+def project_book(book, projection):
+    """Apply a named or Mongo-style projection to a book already in memory."""
+    projection = book_projection(projection)
+    if not projection:
+        return dict(book)
+    included = {field for field, keep in projection.items() if keep}
+    if included:
+        if projection.get("_id", 1):
+            included.add("_id")
+        return {k: v for k, v in book.items() if k in included}
+    return {k: v for k, v in book.items() if k not in projection}
+
+
+def _validated(book, projection):
+    """BookSchema-checked book, dumped with only the projected fields."""
+    projection = book_projection(projection)
+    dumped = BookSchema(**book)
+    if not projection:
+        return dumped.model_dump(by_alias=True)
+    # BookSchema names the _id field "id"
+    fields = {"id" if field == "_id" else field for field in projection}
+    if any(projection.values()):
+        if projection.get("_id", 1):
+            fields.add("id")
+        return dumped.model_dump(by_alias=True, include=fields)
+    return dumped.model_dump(by_alias=True, exclude=fields)
 
 
 def create_book(
@@ -67,7 +121,9 @@ def create_book(
 
         # Mongo can't handle date() directly, so convert it to datetime before insert
         data["publication_date"] = mongo_pub_date
+        data["updated_at"] = datetime.now()
         result = books_collection.insert_one(data)
+        refresh_indexed_book(result.inserted_id)
 
         return str(result.inserted_id)
 
@@ -85,7 +141,7 @@ def read_book_field(book_id, field):
     except Exception:
         return "Invalid book ID format"
 
-    book = books_collection.find_one({"_id": obj_id})
+    book = books_collection.find_one({"_id": obj_id}, {field: 1})
     if book:
         if field in book:
             return book[field]
@@ -95,35 +151,90 @@ def read_book_field(book_id, field):
         return "Book not found."
 
 
-def read_book_by_bookId(book_id):
+def read_book_by_bookId(book_id, projection="detail"):
     try:
         obj_id = ObjectId(book_id)
     except Exception:
         return f"Invalid book ID format: {book_id}"
 
-    book = books_collection.find_one({"_id": obj_id})
+    # Served from the catalog cache when it is running; a book it has not
+    # caught up with yet is read from Mongo
+    catalog = get_catalog()
+    book = catalog.get_book(obj_id) if catalog and catalog.documents else None
+    if book is not None:
+        book = project_book(book, projection)
+    else:
+        book = books_collection.find_one({"_id": obj_id}, book_projection(projection))
 
     if not book:
         return "Book not found."
 
     try:
-        return BookSchema(**book).model_dump(by_alias=True)
+        return _validated(book, projection)
     except ValidationError as e:
         return f"Schema Validation Error: {str(e)}"
 
 
-def read_book_by_identifier(value, identifier):
+def read_books_by_ids(book_ids, projection="detail"):
+    """
+    Read many books in one go for listing endpoints. Returns a list parallel
+    to book_ids, with None where an id is invalid or the book does not exist.
+
+    Books come from the catalog cache when it is running and the rest from
+    a single $in query. Documents are returned as stored, without another
+    BookSchema pass; the projection (a BOOK_PROJECTIONS name or a dict)
+    decides which fields are read.
+    """
+    projection = book_projection(projection)
+    obj_ids = []
+    for book_id in book_ids:
+        try:
+            obj_ids.append(ObjectId(book_id))
+        except (InvalidId, TypeError):
+            obj_ids.append(None)
+
+    found = {}
+    catalog = get_catalog()
+    if catalog and catalog.documents:
+        for obj_id in obj_ids:
+            if obj_id is not None and obj_id not in found:
+                book = catalog.get_book(obj_id)
+                if book is not None:
+                    found[obj_id] = project_book(book, projection)
+
+    missing = list({i for i in obj_ids if i is not None and i not in found})
+    if missing:
+        for book in books_collection.find({"_id": {"$in": missing}}, projection):
+            found[book["_id"]] = book
+
+    # Copies, so a book listed twice is not shared between the two entries
+    return [dict(found[i]) if i in found else None for i in obj_ids]
+
+
+def read_book_by_identifier(value, identifier, projection="detail"):
     # value can be isbn, isbn13, or title
     if identifier not in ["title", "isbn", "isbn13"]:
         return "Error: Invalid identifier. Use 'title', 'isbn', or 'isbn13'."
 
-    book = books_collection.find_one({identifier: value})
+    book = None
+    catalog = get_catalog()
+    if catalog and catalog.documents and identifier != "title":
+        if identifier == "isbn":
+            book = catalog.get_book_by_isbn(value)
+        else:
+            book = catalog.get_book_by_isbn13(value)
+    if book is not None:
+        book = project_book(book, projection)
+    else:
+        book = books_collection.find_one(
+            {identifier: value}, book_projection(projection)
+        )
 
     if not book:
         return "Book not found."
 
     try:
-        return BookSchema(**book).model_dump(by_alias=True)
+        return _validated(book, projection)
     except ValidationError as e:
         return f"Schema Validation Error: {str(e)}"
 
@@ -204,8 +315,13 @@ def update_book_details(book_id: str, **kwargs):
                     pub_date, datetime.min.time()
                 )
 
+        # Keep the embedding in its binary storage format
+        validated_data["embedding"] = to_bson_embedding(validated_data["embedding"])
+        validated_data["updated_at"] = datetime.now()
+
         # Update the book in MongoDB
         books_collection.update_one({"_id": book_id}, {"$set": validated_data})
+        refresh_indexed_book(book_id)
         return "Book updated successfully."
 
     except ValidationError as e:
@@ -214,6 +330,30 @@ def update_book_details(book_id: str, **kwargs):
         return "Error: Invalid ObjectId format."
 
 
+def update_book_if_changed(book_id, unchanged_unless, update):
+    """
+    Apply a partial update, stamping updated_at in the same write so catalog
+    caches that poll instead of using change streams pick it up.
+    `unchanged_unless` narrows the filter to books the update would change,
+    so a no-op matches nothing and leaves updated_at alone. The updated book
+    comes back from the same round trip and goes to the book index. Returns
+    True if the book changed.
+    """
+    update = {
+        **update,
+        "$set": {**update.get("$set", {}), "updated_at": datetime.now()},
+    }
+    book = books_collection.find_one_and_update(
+        {"_id": ObjectId(book_id), **unchanged_unless},
+        update,
+        return_document=ReturnDocument.AFTER,
+    )
+    if book is None:
+        return False
+    upsert_indexed_book(book)
+    return True
+
+
 # functions for adding and removing specific list elements
 def add_book_author(book_id, new_author):
     if not ObjectId.is_valid(book_id):
@@ -222,10 +362,9 @@ def add_book_author(book_id, new_author):
     if not new_author:
         return "Author name cannot be empty."
 
-    result = books_collection.update_one(
-        {"_id": ObjectId(book_id)}, {"$addToSet": {"author": new_author}}
-    )
-    if result.modified_count > 0:
+    if update_book_if_changed(
+        book_id, {"author": {"$ne": new_author}}, {"$addToSet": {"author": new_author}}
+    ):
         return "Author added successfully."
     else:
         return "Author was already in the list or book not found."
@@ -238,10 +377,9 @@ def add_book_tag(book_id, new_tag):
     if not new_tag:
         return "Tag cannot be empty."
 
-    result = books_collection.update_one(
-        {"_id": ObjectId(book_id)}, {"$addToSet": {"tags": new_tag}}
-    )
-    if result.modified_count > 0:
+    if update_book_if_changed(
+        book_id, {"tags": {"$ne": new_tag}}, {"$addToSet": {"tags": new_tag}}
+    ):
         return "Tag added successfully."
     else:
         return "Tag was already in the list or book not found."
@@ -256,15 +394,11 @@ def update_book_embedding(book_id, new_embedding):
     if not isinstance(new_embedding, (list, np.ndarray)):
         return "Embedding must be a list or NumPy array."
 
-    # Convert NumPy array to list if needed
-    if isinstance(new_embedding, np.ndarray):
-        new_embedding = new_embedding.tolist()
-
-    result = books_collection.update_one(
-        {"_id": ObjectId(book_id)}, {"$set": {"embedding": new_embedding}}
-    )
-
-    if result.modified_count > 0:
+    # Stored as float32 BSON Binary; an empty embedding stays an empty list
+    embedding = to_bson_embedding(new_embedding)
+    if update_book_if_changed(
+        book_id, {"embedding": {"$ne": embedding}}, {"$set": {"embedding": embedding}}
+    ):
         return "Embedding updated successfully."
     else:
         return "Book not found or embedding unchanged."
@@ -277,10 +411,9 @@ def remove_book_author(book_id, author_to_remove):
     if not author_to_remove:
         return "Author name cannot be empty."
 
-    result = books_collection.update_one(
-        {"_id": ObjectId(book_id)}, {"$pull": {"author": author_to_remove}}
-    )
-    if result.modified_count > 0:
+    if update_book_if_changed(
+        book_id, {"author": author_to_remove}, {"$pull": {"author": author_to_remove}}
+    ):
         return "Author removed successfully."
     else:
         return "Author not found in the list or book not found."
@@ -293,10 +426,9 @@ def remove_book_tag(book_id, tag_to_remove):
     if not tag_to_remove:
         return "Tag cannot be empty."
 
-    result = books_collection.update_one(
-        {"_id": ObjectId(book_id)}, {"$pull": {"tags": tag_to_remove}}
-    )
-    if result.modified_count > 0:
+    if update_book_if_changed(
+        book_id, {"tags": tag_to_remove}, {"$pull": {"tags": tag_to_remove}}
+    ):
         return "Tag removed successfully."
     else:
         return "Tag not found in the list or book not found."
@@ -328,6 +460,8 @@ def delete_book(book_id):
 
         # delete the book
         books_collection.delete_one({"_id": book_id})
+        forget_object_id("Books", book_id)
+        drop_indexed_book(book_id)
         return "Book and related records deleted successfully."
 
     except InvalidId:
@@ -1,7 +1,8 @@
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
 from datetime import datetime
 from schemas import ChatMessageSchema
-from mongo_id_utils import is_valid_object_id
+from mongo_id_utils import is_object_id, is_valid_object_id
 from database import collections
 from models.users import read_user
 import pytz
@@ -33,7 +34,7 @@ def create_chat_message(book_id, user_id, message_text):
 
 def read_chat_message(message_id):
     try:
-        if not is_valid_object_id("Chat_Messages", message_id):
+        if not is_object_id(message_id):
             return "Error: Invalid message_id."
 
         document = chat_messages_collection.find_one({"_id": ObjectId(message_id)})
@@ -48,10 +49,12 @@ def read_chat_message(message_id):
 
 def read_chat_message_text(message_id):
     try:
-        if not is_valid_object_id("Chat_Messages", message_id):
+        if not is_object_id(message_id):
             return "Error: Invalid message_id."
 
         document = chat_messages_collection.find_one({"_id": ObjectId(message_id)})
+        if not document:
+            return "Message not found."
         chat_message = ChatMessageSchema(**document)
         return chat_message.message_text
     except Exception as e:
@@ -60,7 +63,7 @@ def read_chat_message_text(message_id):
 
 def update_chat_message(message_id, message_text):
     try:
-        if not is_valid_object_id("Chat_Messages", message_id):
+        if not is_object_id(message_id):
             return "Error: Invalid message_id."
         if not message_text or not message_text.strip():
             return "Error: Chat message must contain text."
@@ -69,12 +72,13 @@ def update_chat_message(message_id, message_text):
             "message_text": message_text.strip(),
             "date_edited": datetime.now(pytz.timezone("America/Chicago")),
         }
-        chat_messages_collection.update_one(
-            {"_id": ObjectId(message_id)}, {"$set": update_data}
-        )
-        updated_document = chat_messages_collection.find_one(
-            {"_id": ObjectId(message_id)}
+        updated_document = chat_messages_collection.find_one_and_update(
+            {"_id": ObjectId(message_id)},
+            {"$set": update_data},
+            return_document=ReturnDocument.AFTER,
         )
+        if not updated_document:
+            return "Message not found."
         chat_message = ChatMessageSchema(**updated_document)
         return chat_message.model_dump(by_alias=True)
 
@@ -84,10 +88,12 @@ def update_chat_message(message_id, message_text):
 
 def delete_chat_message(message_id):
     try:
-        if not is_valid_object_id("Chat_Messages", message_id):
+        if not is_object_id(message_id):
             return "Error: Invalid message_id."
 
-        chat_messages_collection.delete_one({"_id": ObjectId(message_id)})
+        result = chat_messages_collection.delete_one({"_id": ObjectId(message_id)})
+        if not result.deleted_count:
+            return "Message not found."
         return "Message deleted successfully."
     except Exception as e:
         return f"Error: {str(e)}"
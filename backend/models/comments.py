@@ -4,7 +4,7 @@ from bson.objectid import ObjectId
 from bson.errors import InvalidId
 from pydantic import ValidationError
 from schemas import CommentSchema
-from mongo_id_utils import is_valid_object_id
+from mongo_id_utils import is_object_id, is_valid_object_id
 from database import collections
 import pytz
 
@@ -16,6 +16,8 @@ comments_collection = collections["Comments"]
 # user_id and book_id need to be verified
 # post_id needs to be verified
 # parent_comment_id only needs to be verified if not None
+# Reads, updates and deletes by comment_id report a miss from the query
+# itself, so they only check that the id is well formed
 
 
 def create_comment(post_id, user_id, comment_text, parent_comment_id=None):
@@ -75,7 +77,7 @@ def reply_to_comment(post_id, user_id, comment_text, parent_comment_id):
 def read_comment(comment_id):
     try:
         # Validate comment_id
-        if not is_valid_object_id("Comments", comment_id):
+        if not is_object_id(comment_id):
             return "Error: Invalid comment_id."
 
         comment = comments_collection.find_one({"_id": ObjectId(comment_id)})
@@ -95,13 +97,15 @@ def read_comment(comment_id):
 def read_comment_field(comment_id, field):
     try:
         # Validate comment_id
-        if not is_valid_object_id("Comments", comment_id):
+        if not is_object_id(comment_id):
             return "Error: Invalid comment_id."
 
         comment = comments_collection.find_one(
             {"_id": ObjectId(comment_id)}, {field: 1, "_id": 0}
         )
 
+        if comment is None:
+            return "Comment not found."
         if field in comment:
             return comment[field]
         else:
@@ -116,7 +120,7 @@ def read_comment_field(comment_id, field):
 def update_comment(comment_id, comment_text):
     try:
         # Validate comment_id
-        if not is_valid_object_id("Comments", comment_id):
+        if not is_object_id(comment_id):
             return "Error: Invalid comment_id."
 
         if not comment_text or comment_text.strip() == "":
@@ -146,7 +150,7 @@ def update_comment(comment_id, comment_text):
 def delete_comment(comment_id):
     try:
         # Validate comment_id
-        if not is_valid_object_id("Comments", comment_id):
+        if not is_object_id(comment_id):
             return "Error: Invalid comment_id."
 
         result = comments_collection.delete_one({"_id": ObjectId(comment_id)})
@@ -164,7 +168,7 @@ def delete_comment(comment_id):
 def delete_comments_by_post(post_id):
     try:
         # Validate post_id
-        if not is_valid_object_id("Posts", post_id):
+        if not is_object_id(post_id):
             return "Error: Invalid post_id."
 
         result = comments_collection.delete_many({"post_id": ObjectId(post_id)})
@@ -4,12 +4,16 @@ from pydantic import ValidationError
 from schemas import PostSchema
 from database import collections
 from models.comments import delete_comments_by_post
-from mongo_id_utils import is_valid_object_id
+from mongo_id_utils import is_object_id, is_valid_object_id
 import pytz
 
 posts_collection = collections["Posts"]
 
 
+# Functions that look a post up by _id report a miss from the lookup itself,
+# so they only check that post_id is well formed.
+
+
 # user_id and book_id need to be verified
 def create_post(user_id, book_id, title, post_text, tags):
     try:
@@ -43,7 +47,7 @@ def create_post(user_id, book_id, title, post_text, tags):
 def read_post(post_id):
     try:
         # Validate post_id
-        if not is_valid_object_id("Posts", post_id):
+        if not is_object_id(post_id):
             return "Error: Invalid post_id."
 
         post = posts_collection.find_one({"_id": ObjectId(post_id)})
@@ -61,7 +65,7 @@ def read_post(post_id):
 def read_post_field(post_id, field):
     try:
         # Validate post_id
-        if not is_valid_object_id("Posts", post_id):
+        if not is_object_id(post_id):
             return "Error: Invalid post_id."
 
         post = posts_collection.find_one(
@@ -76,7 +80,7 @@ def read_post_field(post_id, field):
 def update_post(post_id, title="", post_text="", tags=None):
     try:
         # Validate post_id
-        if not is_valid_object_id("Posts", post_id):
+        if not is_object_id(post_id):
             return "Error: Invalid post_id."
 
         # Prepare update data
@@ -107,12 +111,12 @@ def update_post(post_id, title="", post_text="", tags=None):
 
 def delete_post(post_id):
     try:
-        if not is_valid_object_id("Posts", post_id):
+        if not is_object_id(post_id):
             return "Error: Invalid post_id."
 
-        delete_comments_by_post(post_id)
         result = posts_collection.delete_one({"_id": ObjectId(post_id)})
         if result.deleted_count:
+            delete_comments_by_post(post_id)
             return "Post deleted successfully."
         else:
             return "Error: Post not found."
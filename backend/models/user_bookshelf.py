@@ -1,11 +1,12 @@
 # database/models/user_bookshelf.py
 from datetime import datetime, date
+from pymongo import ReturnDocument
 from pymongo.errors import DuplicateKeyError
 from pydantic import ValidationError
 from database import collections
 from schemas import UserBookshelfSchema
 from bson import ObjectId
-from mongo_id_utils import is_valid_object_id
+from mongo_id_utils import canonical_id, is_object_id, is_valid_object_id
 from bson.errors import InvalidId
 import pytz
 
@@ -13,7 +14,18 @@ books_collection = collections["Books"]
 users_collection = collections["Users"]
 user_bookshelf_collection = collections["User_Bookshelf"]
 
-# user_bookshelf_collection.create_index([("user_id", 1), ("book_id", 1)], unique=True)
+# Indexes, including the unique (user_id, book_id) pair, are declared in
+# indexes.py
+
+# Writes to an existing entry filter on (user_id, book_id) and report a miss
+# through matched_count / deleted_count, so they only check that the ids are
+# well formed; an entry cannot exist for an unknown user or book.
+# user_id is stored as an ObjectId, like book_id (see canonical_id).
+#
+# The status, rating and delete writes take an optional on_change callback,
+# called with (old entry, new entry) after a write that found the entry. The
+# old entry comes from the write itself (find_one_and_update/delete), so two
+# concurrent writes to the same entry each see the state they replaced.
 
 
 # user_id and book_id need to be verified
@@ -35,7 +47,7 @@ def create_user_bookshelf(
             return "Error: Invalid book_id."
 
         existing = user_bookshelf_collection.find_one(
-            {"user_id": user_id, "book_id": ObjectId(book_id)}
+            {"user_id": canonical_id(user_id), "book_id": ObjectId(book_id)}
         )
         if existing:
             return "Error: book already present in user bookshelf."
@@ -100,12 +112,14 @@ def create_user_bookshelf(
         return f"Error: {str(e)}"
 
 
-def update_user_bookshelf_status(user_id, book_id, new_status, date_finished=None):
+def update_user_bookshelf_status(
+    user_id, book_id, new_status, date_finished=None, on_change=None
+):
     try:
         # Validate user_id and book_id
-        if not is_valid_object_id("Users", user_id):
+        if not is_object_id(user_id):
             return "Error: Invalid user_id."
-        if not is_valid_object_id("Books", book_id):
+        if not is_object_id(book_id):
             return "Error: Invalid book_id."
 
         # Validate new_status
@@ -123,16 +137,20 @@ def update_user_bookshelf_status(user_id, book_id, new_status, date_finished=Non
         # If status is being set to "read", set date_finished to now
         update_fields = {"status": new_status}
 
-        # Only add date_finished if moving to "read"
+        # Only add date_finished if moving to "read". Stored as a date, like
+        # UserBookshelfSchema does, so the shelves sort on it correctly
         if new_status.lower() == "read":
-            current_datetime = datetime.now(central).isoformat()
-            update_fields["date_finished"] = current_datetime
+            update_fields["date_finished"] = datetime.now(central)
 
-        result = user_bookshelf_collection.update_one(
-            {"user_id": user_id, "book_id": ObjectId(book_id)}, {"$set": update_fields}
+        old_entry = user_bookshelf_collection.find_one_and_update(
+            {"user_id": canonical_id(user_id), "book_id": ObjectId(book_id)},
+            {"$set": update_fields},
+            return_document=ReturnDocument.BEFORE,
         )
 
-        if result.matched_count:
+        if old_entry:
+            if on_change:
+                on_change(old_entry, {**old_entry, **update_fields})
             return "UserBookshelf status updated successfully."
         else:
             return "UserBookshelf entry not found."
@@ -148,18 +166,37 @@ def retrieve_user_bookshelf(user_id):
     # if not is_valid_object_id("Users", user_id):
     #         return "Error: Invalid user_id."
 
-    books = list(user_bookshelf_collection.find({"user_id": user_id, "status": "read"}))
+    books = list(
+        user_bookshelf_collection.find(
+            {"user_id": canonical_id(user_id), "status": "read"}
+        )
+    )
     return books  # returns list of books
 
 
+def get_user_bookshelf_entry(user_id, book_id):
+    """Return the raw bookshelf entry for a user and book, or None."""
+    try:
+        return user_bookshelf_collection.find_one(
+            {"user_id": canonical_id(user_id), "book_id": ObjectId(book_id)}
+        )
+    except InvalidId:
+        return None
+
+
+def get_user_bookshelf(user_id):
+    """Return every bookshelf entry for a user, regardless of status."""
+    return list(user_bookshelf_collection.find({"user_id": canonical_id(user_id)}))
+
+
 def get_bookshelf_status(user_id, book_id):
     try:
 
-        if not is_valid_object_id("Books", book_id):
+        if not is_object_id(book_id):
             return "Error: Invalid book_id."
 
         book = user_bookshelf_collection.find_one(
-            {"user_id": user_id, "book_id": ObjectId(book_id)}
+            {"user_id": canonical_id(user_id), "book_id": ObjectId(book_id)}
         )
 
         if book:
@@ -179,7 +216,9 @@ def get_read_books(user_id):
 
         # Get all books read by the user
         books = list(
-            user_bookshelf_collection.find({"user_id": user_id, "status": "read"})
+            user_bookshelf_collection.find(
+                {"user_id": canonical_id(user_id), "status": "read"}
+            )
         )
         return books
 
@@ -195,7 +234,9 @@ def get_unread_books(user_id):
 
         # Get all books read by the user
         books = list(
-            user_bookshelf_collection.find({"user_id": user_id, "status": "to-read"})
+            user_bookshelf_collection.find(
+                {"user_id": canonical_id(user_id), "status": "to-read"}
+            )
         )
         return books
 
@@ -212,7 +253,7 @@ def get_currently_reading_books(user_id):
         # Get all books read by the user
         books = list(
             user_bookshelf_collection.find(
-                {"user_id": user_id, "status": "currently-reading"}
+                {"user_id": canonical_id(user_id), "status": "currently-reading"}
             )
         )
         if books:
@@ -222,37 +263,106 @@ def get_currently_reading_books(user_id):
         return f"Error: {str(e)}"
 
 
-def rate_book(user_id, book_id, new_rating):
+SHELF_STATUSES = ["read", "to-read", "currently-reading"]
+# Bookshelf entry fields merged into each joined book
+SHELF_ENTRY_FIELDS = [
+    "rating",
+    "page_number",
+    "date_added",
+    "date_started",
+    "date_finished",
+]
+
+
+def get_bookshelf_with_books(user_id, include_summary=False):
+    """
+    All three shelves of a user with each entry's book joined in, from one
+    aggregation ($match -> $sort -> $lookup -> $project). Books are trimmed
+    inside the $lookup, so the embedding (and the summary, unless asked for)
+    never leaves Mongo. Entries whose book no longer exists are dropped.
+
+    Returns {"read": [...], "to-read": [...], "currently-reading": [...]},
+    each book carrying its entry's rating, page_number and dates; read books
+    are most recently finished first.
+    """
     try:
-        # Validate user_id and book_id
+        # Validate user_id
         if not is_valid_object_id("Users", user_id):
             return "Error: Invalid user_id."
 
-        if not is_valid_object_id("Books", book_id):
-            return "Error: Invalid book_id."
+        book_projection = {"embedding": 0}
+        if not include_summary:
+            book_projection["summary"] = 0
 
-        if (
-            user_bookshelf_collection.count_documents(
-                {"user_id": user_id, "book_id": ObjectId(book_id), "status": "read"}
-            )
-            == 0
-        ):
-            return "Error: Book has not been read yet."
+        pipeline = [
+            {
+                "$match": {
+                    "user_id": canonical_id(user_id),
+                    "status": {"$in": SHELF_STATUSES},
+                }
+            },
+            {"$sort": {"date_finished": -1, "_id": -1}},
+            {
+                "$lookup": {
+                    "from": books_collection.name,
+                    "localField": "book_id",
+                    "foreignField": "_id",
+                    "pipeline": [{"$project": book_projection}],
+                    "as": "book",
+                }
+            },
+            {"$unwind": "$book"},
+            {
+                "$project": {
+                    "_id": 0,
+                    "status": 1,
+                    "book": {
+                        "$mergeObjects": [
+                            "$book",
+                            {field: f"${field}" for field in SHELF_ENTRY_FIELDS},
+                        ]
+                    },
+                }
+            },
+        ]
+        shelves = {status: [] for status in SHELF_STATUSES}
+        for entry in user_bookshelf_collection.aggregate(pipeline):
+            shelves[entry["status"]].append(entry["book"])
+        return shelves
+
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+def rate_book(user_id, book_id, new_rating, on_change=None):
+    try:
+        # Validate user_id and book_id
+        if not is_object_id(user_id):
+            return "Error: Invalid user_id."
+        if not is_object_id(book_id):
+            return "Error: Invalid book_id."
 
         # Validate new_rating
         if new_rating not in ["pos", "neg", "mid"]:
             return "Error: Invalid rating value."
 
-        # Update the rating
-        result = user_bookshelf_collection.update_one(
-            {"user_id": user_id, "book_id": ObjectId(book_id)},
+        # Only read books can be rated
+        old_entry = user_bookshelf_collection.find_one_and_update(
+            {
+                "user_id": canonical_id(user_id),
+                "book_id": ObjectId(book_id),
+                "status": "read",
+            },
             {"$set": {"rating": new_rating}},
+            return_document=ReturnDocument.BEFORE,
         )
 
-        if result.matched_count:
+        if old_entry:
+            if on_change:
+                on_change(old_entry, {**old_entry, "rating": new_rating})
             return "UserBookshelf rating updated successfully."
         else:
-            return "UserBookshelf entry not found."
+            return "Error: Book has not been read yet."
 
     except Exception as e:
         return f"Error: {str(e)}"
@@ -262,9 +372,9 @@ def rate_book(user_id, book_id, new_rating):
 def update_page_number(user_id, book_id, new_page_number):
     try:
         # Validate user_id and book_id
-        if not is_valid_object_id("Users", user_id):
+        if not is_object_id(user_id):
             return "Error: Invalid user_id."
-        if not is_valid_object_id("Books", book_id):
+        if not is_object_id(book_id):
             return "Error: Invalid book_id."
 
         # Validate new_page_number
@@ -291,7 +401,7 @@ def update_page_number(user_id, book_id, new_page_number):
         # Update the page number
         result = user_bookshelf_collection.update_one(
             {
-                "user_id": user_id,
+                "user_id": canonical_id(user_id),
                 "book_id": ObjectId(book_id),
                 "status": "currently-reading",
             },
@@ -317,16 +427,16 @@ def update_page_number(user_id, book_id, new_page_number):
 def get_page_number(user_id, book_id):
     try:
         # Validate user_id and book_id
-        if not is_valid_object_id("Users", user_id):
+        if not is_object_id(user_id):
             return "Error: Invalid user_id."
-        if not is_valid_object_id("Books", book_id):
+        if not is_object_id(book_id):
             return "Error: Invalid book_id."
         print("user id:", user_id)
         print("book_id:", book_id)
         # Retrieve the page number
         book_entry = user_bookshelf_collection.find_one(
             {
-                "user_id": user_id,
+                "user_id": canonical_id(user_id),
                 "book_id": ObjectId(book_id),
                 "status": "currently-reading",
             }
@@ -342,20 +452,21 @@ def get_page_number(user_id, book_id):
         return f"Error: {str(e)}"
 
 
-def delete_user_bookshelf(user_id, book_id):
+def delete_user_bookshelf(user_id, book_id, on_change=None):
     try:
         # Validate user_id and book_id
-        if not is_valid_object_id("Users", user_id):
+        if not is_object_id(user_id):
             return "Error: Invalid user_id."
-
-        if not is_valid_object_id("Books", book_id):
+        if not is_object_id(book_id):
             return "Error: Invalid book_id."
 
         # Delete the document
-        result = user_bookshelf_collection.delete_one(
-            {"user_id": user_id, "book_id": ObjectId(book_id)}
+        old_entry = user_bookshelf_collection.find_one_and_delete(
+            {"user_id": canonical_id(user_id), "book_id": ObjectId(book_id)}
         )
-        if result.deleted_count:
+        if old_entry:
+            if on_change:
+                on_change(old_entry, None)
             return "UserBookshelf entry deleted successfully."
         else:
             return "UserBookshelf entry not found."
@@ -5,13 +5,21 @@ from datetime import datetime, date
 from pydantic import ValidationError
 from schemas import UserSchema, OAuthSchema, DemographicSchema
 from database import collections
+from embedding_store import embedding_list, to_bson_embedding
+from mongo_id_utils import canonical_id, forget_object_id
+from cache import (
+    cache_user,
+    cache_user_id,
+    drop_cached_user,
+    read_cached_user,
+    read_cached_user_id,
+    user_generation,
+)
+from user_context import forget_request_user, remember_user, request_users
 
 users_collection = collections["Users"]
 
-# require username, email address, and refresh tokens to be unique
-# users_collection.create_index("username", unique=True)
-# users_collection.create_index("email_address", unique=True)
-# users_collection.create_index("refresh_token", unique=True)
+# username and email address are kept unique by the indexes in indexes.py
 
 
 def create_user(
@@ -72,6 +80,8 @@ def create_user(
                 )
         if not data.get("_id"):
             data.pop("_id", None)
+        # A versioned, empty profile: shelf events and onboarding build on it
+        data.update(profile_version=0, embedding_weight=0, genre_weights=dict())
         result = users_collection.insert_one(data)
         return str(result.inserted_id)
 
@@ -79,9 +89,56 @@ def create_user(
         return f"Schema Validation Error: {str(e)}"
 
 
+def load_user(user_id=None, email=None):
+    """
+    The raw user document for an id or email address, or None. Answered from
+    the current request's user table, then the shared Redis cache, then
+    Mongo, so a user is read from Mongo at most once per cache TTL. The
+    cache is only filled if no write to the user landed since the read.
+    """
+    users = request_users()
+    key = ("id", str(user_id)) if user_id is not None else ("email", email)
+    if users and key in users:
+        return users[key]
+
+    if user_id is not None:
+        user = read_cached_user(user_id)
+    else:
+        cached_id = read_cached_user_id(email)
+        user = read_cached_user(cached_id) if cached_id else None
+        if user and user.get("email_address") != email:
+            user = None
+
+    if user is None:
+        # Noted before the read: a write after it makes the fill a no-op
+        known_id = str(user_id) if user_id is not None else cached_id
+        generation = user_generation(known_id) if known_id else None
+        if user_id is not None:
+            user_oid = canonical_id(user_id)
+            user = users_collection.find_one({"_id": user_oid}) if user_oid else None
+        else:
+            user = users_collection.find_one({"email_address": email})
+        if user and str(user["_id"]) == known_id:
+            cache_user(user, generation)
+        elif user and user_id is None:
+            # Read by an email not cached yet; the next read knows the id
+            cache_user_id(email, user["_id"])
+
+    # Misses are not remembered: the user may be created later in the request
+    remember_user(user)
+    return user
+
+
+def forget_user(user_id):
+    """Drop a user from the request table and the shared cache after a write."""
+    forget_request_user(user_id)
+    drop_cached_user(user_id)
+
+
 def read_user(user_id):
     try:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
+        ObjectId(user_id)
+        user = load_user(user_id)
         return (
             UserSchema(**user).model_dump(by_alias=True) if user else "User not found."
         )
@@ -95,23 +152,31 @@ def read_user_by_username(username):
 
 
 def read_user_by_email(email):
-    user = users_collection.find_one({"email_address": email})
+    user = load_user(email=email)
     return UserSchema(**user).model_dump(by_alias=True) if user else "User not found."
 
 
-def update_user(user_id, **kwargs):
-    try:
-        existing_user = users_collection.find_one({"_id": ObjectId(user_id)})
-        if not existing_user:
-            return "Error: User not found."
+def _validated_fields(fields):
+    """
+    The given user fields checked against UserSchema, ready for $set. Only
+    these fields are validated and written, so no read of the stored
+    document is needed; a missing user shows up as matched_count == 0.
+    """
+    user = UserSchema(**fields)
+    return user.model_dump(
+        by_alias=True, include=set(fields) & set(UserSchema.model_fields)
+    )
 
-        updated_data = {**existing_user, **kwargs}
 
-        validated_data = UserSchema(**updated_data).model_dump(by_alias=True)
+def update_user(user_id, **kwargs):
+    try:
+        u_id = ObjectId(user_id)
+        validated_data = _validated_fields(kwargs)
 
-        users_collection.update_one(
-            {"_id": ObjectId(user_id)}, {"$set": validated_data}
-        )
+        result = users_collection.update_one({"_id": u_id}, {"$set": validated_data})
+        forget_user(user_id)
+        if result.matched_count == 0:
+            return "Error: User not found."
         return "User updated successfully."
 
     except ValidationError as e:
@@ -129,11 +194,6 @@ def update_user_settings(
         if isinstance(user_id, str):
             user_id = ObjectId(user_id)
 
-        # Find existing user
-        existing_user = users_collection.find_one({"_id": user_id})
-        if not existing_user:
-            return "Error: User not found."
-
         update_data = {}
 
         # Validate username uniqueness
@@ -156,11 +216,12 @@ def update_user_settings(
         if not update_data:
             return "Error: No update fields provided."
 
-        # Validate full document
-        new_document = {**existing_user, **update_data}
-        validated_document = UserSchema(**new_document).model_dump(by_alias=True)
+        validated_data = _validated_fields(update_data)
 
-        users_collection.update_one({"_id": user_id}, {"$set": validated_document})
+        result = users_collection.update_one({"_id": user_id}, {"$set": validated_data})
+        forget_user(user_id)
+        if result.matched_count == 0:
+            return "Error: User not found."
 
         return "User settings updated successfully."
 
@@ -176,10 +237,6 @@ def update_user_settings(
 def update_genre_weights(user_id, new_genre_weights):
     try:
         u_id = ObjectId(user_id)  # Ensure the user_id is an ObjectId
-        existing_user = users_collection.find_one({"_id": u_id})
-
-        if not existing_user:
-            return "Error: User not found."
 
         if not isinstance(new_genre_weights, dict):
             return "Error: Genre weights must be a dictionary."
@@ -194,7 +251,10 @@ def update_genre_weights(user_id, new_genre_weights):
         result = users_collection.update_one(
             {"_id": u_id}, {"$set": {"genre_weights": new_genre_weights}}
         )
+        forget_user(u_id)
 
+        if result.matched_count == 0:
+            return "Error: User not found."
         if result.modified_count == 0:
             return "Error: Genre weights were not updated, or no changes detected."
 
@@ -211,13 +271,11 @@ def retrieve_genre_weights(user_id):
     Retrieve the genre weight dictionary for a user.
     """
     try:
-        user = users_collection.find_one({"_id": user_id})
-        if not user:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
-        # print("USER:", user)
-        # print("Genre weights:", user["genre_weights"])
+        user = load_user(user_id)
         if user:
-            return user["genre_weights"] if user else dict()
+            # A copy: callers update it in place before writing it back
+            genre_weights = user.get("genre_weights")
+            return dict(genre_weights) if isinstance(genre_weights, dict) else dict()
         else:
             return "User not found"
     except (ValueError, InvalidId):
@@ -235,10 +293,6 @@ def update_embedding(user_id, new_embedding):
     except (ValueError, InvalidId):
         return "Error: Invalid ObjectId format."
 
-    existing_user = users_collection.find_one({"_id": u_id})
-    if not existing_user:
-        return "Error: User not found."
-
     if not isinstance(new_embedding, list) or not all(
         isinstance(x, (int, float)) for x in new_embedding
     ):
@@ -246,50 +300,124 @@ def update_embedding(user_id, new_embedding):
 
     result = users_collection.update_one(
         {"_id": u_id},
-        {"$set": {"embedding": new_embedding}},
+        {"$set": {"embedding": to_bson_embedding(new_embedding)}},
     )
+    forget_user(u_id)
+    if result.matched_count == 0:
+        return "Error: User not found."
 
     return result
 
 
 def retrieve_embedding(user_id):
     """
-    Retrieve the embedding vector for a user.
+    Retrieve the embedding vector for a user as a list of floats.
     """
-    user = users_collection.find_one({"_id": user_id})
+    user = load_user(user_id)
     if (
         user and "embedding" in user and user["embedding"]
     ):  # Check if "embedding" exists and is not empty
-        return user["embedding"]
+        return embedding_list(user["embedding"])
     else:
-        user = users_collection.find_one({"_id": ObjectId(user_id)})
-        if (
-            user and "embedding" in user and user["embedding"]
-        ):  # Check if "embedding" exists and is not empty
-            return user["embedding"]
-        else:
-            return None
+        return None
+
+
+PROFILE_FIELDS = {
+    "genre_weights": 1,
+    "embedding": 1,
+    "embedding_weight": 1,
+    "profile_version": 1,
+    "applied_shelf_events": 1,
+    "shelf_rebuilt_at": 1,
+}
+
+# Ids of the last shelf events folded into a profile, so a redelivered
+# event is not applied twice. Redelivery happens within minutes, well
+# before this many newer events arrive for one user.
+APPLIED_SHELF_EVENTS_KEPT = 500
+
+
+def retrieve_profile(user_id):
+    """
+    Retrieve the stored recommendation profile for a user in a single query.
+    profile_version is None for users whose profile predates versioning.
+    shelf_rebuilt_at is when the profile was last rebuilt from the whole
+    shelf (None if never). Returns None if the user does not exist.
+    """
+    user_id = canonical_id(user_id)
+    user = (
+        users_collection.find_one({"_id": user_id}, PROFILE_FIELDS) if user_id else None
+    )
+    if not user:
+        return None
+    return {
+        "_id": user["_id"],
+        "genre_weights": user.get("genre_weights") or dict(),
+        "embedding": embedding_list(user.get("embedding")),
+        "embedding_weight": user.get("embedding_weight", 0),
+        "profile_version": user.get("profile_version"),
+        "applied_shelf_events": user.get("applied_shelf_events") or [],
+        "shelf_rebuilt_at": user.get("shelf_rebuilt_at"),
+    }
+
+
+def save_profile(profile, applied_events=(), rebuilt_at=None):
+    """
+    Write a profile back only if its version has not changed since it was read.
+    applied_events are the ids of the shelf events folded in, recorded in the
+    same write. A rebuild from the whole shelf passes rebuilt_at instead.
+    Returns the new version number, or None if another writer got there first.
+    """
+    version = profile.get("profile_version")
+    fields = {
+        "genre_weights": profile["genre_weights"],
+        "embedding": to_bson_embedding(profile["embedding"]),
+        "embedding_weight": profile["embedding_weight"],
+    }
+    update = {"$set": fields, "$inc": {"profile_version": 1}}
+    if rebuilt_at is not None:
+        fields.update(shelf_rebuilt_at=rebuilt_at, applied_shelf_events=[])
+    elif applied_events:
+        update["$push"] = {
+            "applied_shelf_events": {
+                "$each": list(applied_events),
+                "$slice": -APPLIED_SHELF_EVENTS_KEPT,
+            }
+        }
+    result = users_collection.update_one(
+        {"_id": profile["_id"], "profile_version": version}, update
+    )
+    forget_user(profile["_id"])
+    if result.matched_count == 0:
+        return None
+    return (version or 0) + 1
 
 
 ### End of new update/retrieval functions
 
 
 def update_profile_image(user_id, new_image):
-    return users_collection.update_one(
+    result = users_collection.update_one(
         {"_id": ObjectId(user_id)}, {"$set": {"profile_image": new_image}}
     )
+    forget_user(user_id)
+    return result
 
 
 def add_interest(user_id, new_interest):
-    return users_collection.update_one(
+    result = users_collection.update_one(
         {"_id": ObjectId(user_id)}, {"$addToSet": {"interests": new_interest}}
     )
+    forget_user(user_id)
+    return result
 
 
 def remove_interest(user_id, interest):
-    return users_collection.update_one(
+    result = users_collection.update_one(
         {"_id": ObjectId(user_id)}, {"$pull": {"interests": interest}}
     )
+    forget_user(user_id)
+    return result
 
 
 def add_demographic(user_id, new_demographics):
@@ -309,9 +437,11 @@ def add_demographic(user_id, new_demographics):
         f"demographics.{key}": value for key, value in new_demographics.items()
     }
 
-    return users_collection.update_one(
+    result = users_collection.update_one(
         {"_id": ObjectId(user_id)}, {"$set": update_fields}
     )
+    forget_user(user_id)
+    return result
 
 
 def update_demographics(user_id, new_demographics):
@@ -331,9 +461,11 @@ def update_demographics(user_id, new_demographics):
         f"demographics.{key}": value for key, value in new_demographics.items()
     }
 
-    return users_collection.update_one(
+    result = users_collection.update_one(
         {"_id": ObjectId(user_id)}, {"$set": update_fields}
     )
+    forget_user(user_id)
+    return result
 
 
 def remove_demographic(user_id, demographic_field):
@@ -348,20 +480,17 @@ def remove_demographic(user_id, demographic_field):
     elif demographic_field == "birthday":
         default_value = None
 
-    return users_collection.update_one(
+    result = users_collection.update_one(
         {"_id": ObjectId(user_id)},
         {"$set": {f"demographics.{demographic_field}": default_value}},
     )
+    forget_user(user_id)
+    return result
 
 
 def delete_user(user_id):
     try:
         db = collections
-        db["Posts"].delete_many({"user_id": user_id})
-        db["Comments"].delete_many({"user_id": user_id})
-        db["Chat_Messages"].delete_many({"user_id": user_id})
-        db["User_Bookshelf"].delete_many({"user_id": user_id})
-
         user_id = ObjectId(user_id)
 
         if not users_collection.find_one({"_id": user_id}):
@@ -373,6 +502,8 @@ def delete_user(user_id):
         db["User_Bookshelf"].delete_many({"user_id": user_id})
 
         users_collection.delete_one({"_id": user_id})
+        forget_object_id("Users", user_id)
+        forget_user(user_id)
         return "User and related records deleted successfully."
 
     except (ValueError, InvalidId):
@@ -1,32 +1,91 @@
 # backend/objectid_utils.py
+import threading
+import time
+from collections import OrderedDict
 from bson.objectid import ObjectId
 from database import collections
-from bson.errors import InvalidId
+
+# Users and Books are checked on nearly every write but are rarely deleted,
+# so ids seen to exist are remembered for a short while. Only hits are
+# cached: an id that was just created is never reported missing.
+EXISTENCE_CACHED_COLLECTIONS = ("Users", "Books")
+EXISTENCE_TTL = 60  # seconds
+EXISTENCE_CACHE_SIZE = 10000
+
+_existing_ids = OrderedDict()  # (collection, id string) -> expiry time
+_existing_lock = threading.Lock()
+
+
+def is_object_id(obj_id):
+    """Whether obj_id is an ObjectId or a string that parses as one. No I/O."""
+    return isinstance(obj_id, ObjectId) or (
+        isinstance(obj_id, str) and ObjectId.is_valid(obj_id)
+    )
+
+
+def canonical_id(obj_id):
+    """
+    The ObjectId an id is stored as, or None if it is malformed. Users' _id
+    and every user_id reference are ObjectIds (migrate_user_ids.py converted
+    the strings older documents held), so one equality query finds them.
+    """
+    if isinstance(obj_id, ObjectId):
+        return obj_id
+    if isinstance(obj_id, str) and ObjectId.is_valid(obj_id):
+        return ObjectId(obj_id)
+    return None
+
+
+def _cached_exists(key):
+    with _existing_lock:
+        expires = _existing_ids.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del _existing_ids[key]
+            return False
+        _existing_ids.move_to_end(key)
+        return True
+
+
+def _remember_exists(key):
+    with _existing_lock:
+        _existing_ids[key] = time.monotonic() + EXISTENCE_TTL
+        _existing_ids.move_to_end(key)
+        while len(_existing_ids) > EXISTENCE_CACHE_SIZE:
+            _existing_ids.popitem(last=False)
+
+
+def forget_object_id(collection_name, obj_id):
+    """Drop a deleted id from the existence cache."""
+    with _existing_lock:
+        _existing_ids.pop((collection_name, str(obj_id)), None)
+
+
+def clear_existence_cache():
+    with _existing_lock:
+        _existing_ids.clear()
 
 
 def is_valid_object_id(collection_name, obj_id):
     """
     Check if the given ObjectId exists in the specified collection.
+    Malformed ids are rejected without a query, and Users and Books hits are
+    served from a short-lived cache.
     :param collection_name: The MongoDB collection name.
     :param obj_id: The ObjectId to be checked.
     :return: True if the ObjectId exists, False otherwise.
     """
-
-    try:
-        if collection_name not in collections:
-            return False
-        elif collection_name == "Users" or collection_name == "User_Bookshelf":
-            # check with both string and ObjectId
-            collection = collections[collection_name]
-            if (
-                collection.find_one({"_id": ObjectId(obj_id)}) is not None
-                or collection.find_one({"_id": obj_id}) is not None
-            ):
-                return True
-            else:
-                return collection.find_one({"_id": ObjectId(obj_id)}) is not None
-        else:
-            collection = collections[collection_name]
-            return collection.find_one({"_id": ObjectId(obj_id)}) is not None
-    except InvalidId:
+    if collection_name not in collections or not is_object_id(obj_id):
         return False
+
+    key = (collection_name, str(obj_id))
+    cached = collection_name in EXISTENCE_CACHED_COLLECTIONS
+    if cached and _cached_exists(key):
+        return True
+
+    query = {"_id": canonical_id(obj_id)}
+    exists = collections[collection_name].find_one(query, {"_id": 1}) is not None
+    if exists and cached:
+        _remember_exists(key)
+    return exists
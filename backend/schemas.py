@@ -6,6 +6,7 @@ from datetime import datetime, date
 from pydantic import GetCoreSchemaHandler
 from pydantic_core import core_schema
 import pytz
+from embedding_store import embedding_list
 
 
 class PyObjectId(ObjectId):
@@ -48,6 +49,11 @@ class BookSchema(BaseModel):
 
     model_config = ConfigDict(populate_by_name=True)
 
+    @field_validator("embedding", mode="before")
+    def decode_embedding(cls, v):
+        # Stored as float32 BSON Binary; older documents hold a list
+        return v if isinstance(v, list) else embedding_list(v)
+
     @field_validator("publication_date", mode="before")
     def ensure_date(cls, v):
         if isinstance(v, datetime):
@@ -98,13 +104,18 @@ class UserSchema(BaseModel):
 
     model_config = ConfigDict(populate_by_name=True)
 
+    @field_validator("embedding", mode="before")
+    def decode_embedding(cls, v):
+        # Stored as float32 BSON Binary; older documents hold a list
+        return v if isinstance(v, list) else embedding_list(v)
+
 
 # -----------------------------------------------
 # USER_BOOKSHELF SCHEMA (Junction Table)
 # -----------------------------------------------
 class UserBookshelfSchema(BaseModel):
     id: PyObjectId = Field(default_factory=PyObjectId, alias="_id")
-    user_id: str = Field(default="userid")
+    user_id: PyObjectId = Field(default_factory=PyObjectId)
     book_id: PyObjectId = Field(default_factory=PyObjectId)
     status: str = Field(
         default="to-read", pattern=r"(?i)^(to-read|currently-reading|read)$"
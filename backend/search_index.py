@@ -0,0 +1,502 @@
+# backend/search_index.py
+"""
+In-process search over the catalog cache for /api/books.
+
+Titles and authors go into an inverted index (token -> {book_id: term
+frequency}) ranked with BM25, title matches weighing more than author
+matches. The last query token is treated as a prefix while the user is
+still typing: a sorted vocabulary is bisected to find every indexed token
+starting with it. ISBN-10/13 are exact hash lookups, with a sorted array
+for partial ISBNs. In a type=any search only a full-length ISBN is ranked
+ahead of the text matches; a partial one (say "1984") is merged into the
+BM25 ranking as a weaker match.
+
+Query words that are not in the vocabulary are treated as typos: a trigram
+index over the vocabulary yields candidate words sharing enough trigrams,
+and a bounded Levenshtein distance keeps those within one or two edits.
+Titles are indexed through diversity.normalize_title, so edition and
+tie-in noise does not match.
+
+type=semantic ranks books by cosine similarity between the query's
+SentenceTransformer embedding (computed by the embedding worker, see
+embedding_service.py) and the book embeddings in book_index, and type=hybrid
+blends that with the BM25 score. Query embeddings are kept in an LRU cache,
+since the same few searches are typed over and over.
+
+The index is built from load_books' catalog cache on first use and follows
+its incremental updates, so a search never touches Mongo.
+"""
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from functools import lru_cache
+import numpy as np
+from ann_search import top_k_rows
+from diversity import normalize_title
+
+# BM25 parameters and per-field weights
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {"title": 2.0, "author": 1.0}
+# At most this many vocabulary tokens are searched for a prefix, the most
+# common first; a one-letter prefix would otherwise match most of the index
+MAX_PREFIX_TERMS = 50
+MIN_PREFIX_LENGTH = 2
+# Typo tolerance: words of at least FUZZY_MIN_LENGTH characters may be one
+# edit off, and two from FUZZY_TWO_EDITS_LENGTH; each edit scales the score
+FUZZY_MIN_LENGTH = 3
+FUZZY_TWO_EDITS_LENGTH = 6
+FUZZY_PENALTY = 0.6
+# Semantic search: cached query embeddings, neighbours ranked per query, and
+# the share of the BM25 score in a hybrid ranking
+QUERY_CACHE_SIZE = 1024
+SEMANTIC_RESULTS = 200
+HYBRID_LEXICAL_WEIGHT = 0.5
+# In a type=any search, a partial ISBN match scores this share of the best
+# text score
+ISBN_PREFIX_WEIGHT = 0.5
+ISBN_LENGTHS = (10, 13)
+
+_TOKEN = re.compile(r"\w+")
+_ISBN_CHARS = re.compile(r"[^0-9X]")
+
+
+def tokenize(text):
+    """Lowercased, accent-stripped word tokens."""
+    if not text:
+        return []
+    if not isinstance(text, str):
+        text = " ".join(t for t in text if isinstance(t, str))
+    text = text.lower()
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN.findall(text)
+
+
+def normalize_isbn(value):
+    """Digits (and a trailing X) of an ISBN, or "" for non-ISBN input."""
+    if not isinstance(value, str):
+        return ""
+    return _ISBN_CHARS.sub("", value.upper())
+
+
+def trigrams(term):
+    """Character trigrams of a word padded with a space on each side."""
+    padded = f" {term} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def bounded_levenshtein(a, b, bound):
+    """
+    Edit distance between a and b, or bound + 1 once it is certain to
+    exceed bound. Only the diagonal band of width 2 * bound is computed.
+    """
+    if abs(len(a) - len(b)) > bound:
+        return bound + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        low, high = max(1, i - bound), min(len(b), i + bound)
+        current = [i] + [bound + 1] * len(b)
+        for j in range(low, high + 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != b[j - 1]),
+            )
+        if min(current[low - 1 : high + 1]) > bound:
+            return bound + 1
+        previous = current
+    return min(previous[len(b)], bound + 1)
+
+
+class SortedTerms:
+    """A sorted list of strings with prefix ranges found by bisection."""
+
+    def __init__(self, terms=()):
+        self.terms = sorted(set(terms))
+
+    def __contains__(self, term):
+        i = bisect_left(self.terms, term)
+        return i < len(self.terms) and self.terms[i] == term
+
+    def add(self, term):
+        i = bisect_left(self.terms, term)
+        if i == len(self.terms) or self.terms[i] != term:
+            self.terms.insert(i, term)
+
+    def discard(self, term):
+        i = bisect_left(self.terms, term)
+        if i < len(self.terms) and self.terms[i] == term:
+            del self.terms[i]
+
+    def with_prefix(self, prefix):
+        start = bisect_left(self.terms, prefix)
+        # U+FFFF sorts after every character that can follow the prefix
+        end = bisect_left(self.terms, prefix + "\uffff", lo=start)
+        return self.terms[start:end]
+
+
+class SearchIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        # field -> token -> {book_id: term frequency}
+        self.postings = {field: {} for field in FIELD_WEIGHTS}
+        # field -> {book_id: token count}, and the running total per field
+        self.lengths = {field: {} for field in FIELD_WEIGHTS}
+        self.total_length = {field: 0 for field in FIELD_WEIGHTS}
+        self.vocabulary = SortedTerms()
+        # trigram -> vocabulary words containing it
+        self.trigrams = {}
+        # book_id -> {field: tokens}, so a book can be taken out again
+        self.book_tokens = {}
+        self.isbns = {}
+        self.isbn_terms = SortedTerms()
+        self.book_isbns = {}
+        self._new_terms = None
+
+    def __len__(self):
+        return len(self.book_tokens)
+
+    def build(self, books):
+        with self.lock:
+            self.__init__()
+            # Words are sorted once at the end rather than inserted one by one
+            self._new_terms = []
+            for book in books:
+                self._add(book)
+            self.vocabulary = SortedTerms(self._new_terms)
+            self._new_terms = None
+
+    def upsert(self, book):
+        with self.lock:
+            self._remove(book["_id"])
+            self._add(book)
+
+    def remove(self, book_id):
+        with self.lock:
+            self._remove(book_id)
+
+    def _add(self, book):
+        book_id = book["_id"]
+        self.book_tokens[book_id] = {}
+        for field in FIELD_WEIGHTS:
+            text = book.get(field)
+            if field == "title" and isinstance(text, str):
+                text = normalize_title(text)
+            counts = Counter(tokenize(text))
+            self.book_tokens[book_id][field] = list(counts)
+            postings = self.postings[field]
+            for token, count in counts.items():
+                if token not in postings:
+                    self._add_term(token)
+                    postings[token] = {}
+                postings[token][book_id] = count
+            length = sum(counts.values())
+            self.lengths[field][book_id] = length
+            self.total_length[field] += length
+
+        isbns = {normalize_isbn(book.get(k)) for k in ("isbn", "isbn13")} - {""}
+        for isbn in isbns:
+            if isbn not in self.isbns:
+                self.isbns[isbn] = set()
+                self.isbn_terms.add(isbn)
+            self.isbns[isbn].add(book_id)
+        self.book_isbns[book_id] = isbns
+
+    def _remove(self, book_id):
+        tokens = self.book_tokens.pop(book_id, None)
+        if tokens is None:
+            return
+        for field, field_tokens in tokens.items():
+            postings = self.postings[field]
+            for token in field_tokens:
+                del postings[token][book_id]
+                if not postings[token]:
+                    del postings[token]
+                    if not any(token in self.postings[f] for f in FIELD_WEIGHTS):
+                        self._discard_term(token)
+            self.total_length[field] -= self.lengths[field].pop(book_id)
+
+        for isbn in self.book_isbns.pop(book_id, ()):
+            self.isbns[isbn].discard(book_id)
+            if not self.isbns[isbn]:
+                del self.isbns[isbn]
+                self.isbn_terms.discard(isbn)
+
+    def _add_term(self, term):
+        if any(term in self.postings[f] for f in FIELD_WEIGHTS):
+            return  # already in the other field's vocabulary
+        if self._new_terms is not None:
+            self._new_terms.append(term)
+        else:
+            self.vocabulary.add(term)
+        for gram in trigrams(term):
+            self.trigrams.setdefault(gram, set()).add(term)
+
+    def _discard_term(self, term):
+        self.vocabulary.discard(term)
+        for gram in trigrams(term):
+            words = self.trigrams.get(gram)
+            if words is not None:
+                words.discard(term)
+                if not words:
+                    del self.trigrams[gram]
+
+    # Querying
+
+    def fuzzy_terms(self, token):
+        """
+        [(word, edits)] for vocabulary words within the allowed edit distance
+        of a word that is not in the vocabulary itself.
+        """
+        if len(token) < FUZZY_MIN_LENGTH:
+            return []
+        bound = 2 if len(token) >= FUZZY_TWO_EDITS_LENGTH else 1
+        grams = trigrams(token)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.trigrams.get(gram, ()))
+        # One edit changes at most three padded trigrams, so a word within
+        # `bound` edits shares at least this many with the query
+        needed = max(1, len(grams) - 3 * bound)
+        matches = []
+        for term, count in shared.items():
+            if count < needed:
+                continue
+            distance = bounded_levenshtein(token, term, bound)
+            if distance <= bound:
+                matches.append((term, distance))
+        return matches
+
+    def _expand(self, token, prefix):
+        """The indexed tokens a query token stands for."""
+        if not prefix or len(token) < MIN_PREFIX_LENGTH:
+            return [token]
+        terms = self.vocabulary.with_prefix(token)
+        if len(terms) > MAX_PREFIX_TERMS:
+            # An exact match sorts first in the range; always keep it
+            exact = terms[:1] if terms[0] == token else []
+            terms.sort(key=self._document_frequency, reverse=True)
+            terms = exact + [t for t in terms[:MAX_PREFIX_TERMS] if t != token]
+        return terms or [token]
+
+    def _document_frequency(self, term):
+        return sum(len(self.postings[f].get(term, ())) for f in FIELD_WEIGHTS)
+
+    def _bm25(self, field, term):
+        """{book_id: score} for one term in one field."""
+        docs = self.postings[field].get(term)
+        if not docs:
+            return {}
+        count = len(self.lengths[field])
+        average = self.total_length[field] / count if count else 0
+        idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+        lengths = self.lengths[field]
+        weight = FIELD_WEIGHTS[field] * idf
+        return {
+            book_id: weight
+            * tf
+            * (K1 + 1)
+            / (tf + K1 * (1 - B + B * lengths[book_id] / (average or 1)))
+            for book_id, tf in docs.items()
+        }
+
+    def text_scores(self, query, fields=tuple(FIELD_WEIGHTS)):
+        """{book_id: BM25 score} of every book matching the query text."""
+        with self.lock:
+            return self._text_scores(query, fields)
+
+    def _text_scores(self, query, fields):
+        tokens = tokenize(query)
+        if not tokens:
+            return {}
+        # The last token is still being typed unless the query ends in a space
+        still_typing = not query[-1:].isspace()
+        per_token = []
+        for i, token in enumerate(tokens):
+            scores = {}
+            prefix = still_typing and i == len(tokens) - 1
+            terms = [(term, 0) for term in self._expand(token, prefix)]
+            if len(terms) == 1 and terms[0][0] not in self.vocabulary:
+                terms = self.fuzzy_terms(token)  # unknown word: likely a typo
+            for term, edits in terms:
+                term_scores = {}
+                for field in fields:
+                    for book_id, score in self._bm25(field, term).items():
+                        term_scores[book_id] = term_scores.get(book_id, 0) + score
+                # A prefix or typo counts once per book, through its best match
+                penalty = FUZZY_PENALTY**edits
+                for book_id, score in term_scores.items():
+                    scores[book_id] = max(scores.get(book_id, 0), score * penalty)
+            per_token.append(scores)
+
+        # Every token has to match; fall back to any token if none match all
+        matched = set.intersection(*(set(s) for s in per_token))
+        if not matched:
+            matched = set().union(*per_token)
+        return {
+            book_id: sum(s.get(book_id, 0) for s in per_token) for book_id in matched
+        }
+
+    @staticmethod
+    def _isbn_query(query):
+        """The normalized ISBN if the query is ISBN-shaped, otherwise ""."""
+        isbn = normalize_isbn(query)
+        if len(isbn) < 3 or len(isbn) < len(re.sub(r"[\s-]", "", query)):
+            return ""
+        return isbn
+
+    def _isbn_matches(self, isbn):
+        if not isbn:
+            return []
+        if isbn in self.isbns:
+            return sorted(self.isbns[isbn])
+        matches = set()
+        for term in self.isbn_terms.with_prefix(isbn)[:MAX_PREFIX_TERMS]:
+            matches |= self.isbns[term]
+        return sorted(matches)
+
+    def search(self, query, search_type="any", offset=0, limit=50):
+        """
+        Return (total matches, book ids for the requested page), best first.
+        search_type is "title", "author", "isbn" or "any".
+        """
+        isbn = self._isbn_query(query) if search_type in ("isbn", "any") else ""
+        with self.lock:
+            ranked = []
+            if search_type == "isbn" or len(isbn) in ISBN_LENGTHS:
+                ranked = self._isbn_matches(isbn)
+                isbn = ""
+            if search_type in ("title", "author", "any"):
+                fields = list(FIELD_WEIGHTS) if search_type == "any" else [search_type]
+                scores = self._text_scores(query, fields)
+                partial = self._isbn_matches(isbn)
+                if partial:
+                    bonus = ISBN_PREFIX_WEIGHT * (max(scores.values(), default=0) or 1)
+                    for book_id in partial:
+                        scores[book_id] = scores.get(book_id, 0) + bonus
+                seen = set(ranked)
+                ranked += sorted(
+                    (book_id for book_id in scores if book_id not in seen),
+                    key=lambda book_id: (-scores[book_id], str(book_id)),
+                )
+            return len(ranked), ranked[offset : offset + limit]
+
+
+_search_index = None
+_search_index_lock = threading.Lock()
+
+
+def get_search_index():
+    """
+    The process-wide search index, built from the catalog cache on first use.
+    None when the catalog cache is not running (callers fall back to Mongo).
+    """
+    global _search_index
+    if _search_index is None:
+        from load_books import get_catalog
+
+        catalog = get_catalog()
+        if catalog is None or not catalog.documents:
+            return None
+        with _search_index_lock:
+            if _search_index is None:
+                search_index = SearchIndex()
+                search_index.build(catalog.get_books())
+                print(f"Search index built with {len(search_index)} books.")
+                _search_index = search_index
+    return _search_index
+
+
+def sync_search_index(book, deleted=False):
+    """Apply a catalog change to the search index, if it has been built."""
+    if _search_index is None:
+        return
+    if deleted:
+        _search_index.remove(book["_id"])
+    else:
+        _search_index.upsert(book)
+
+
+def reset_search_index():
+    """Drop the index after a full catalog reload; the next search rebuilds it."""
+    global _search_index
+    _search_index = None
+
+
+# Semantic and hybrid ranking
+
+
+@lru_cache(maxsize=QUERY_CACHE_SIZE)
+def _encode_query(query):
+    from embedding_service import encode_texts
+
+    # Raises EmbeddingUnavailable (a RuntimeError), which is not cached
+    vector = np.asarray(encode_texts([query])[0], dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    if norm:
+        vector /= norm
+    vector.flags.writeable = False  # shared between callers through the cache
+    return vector
+
+
+def encode_query(query):
+    """Unit-length embedding of a search query, or None if no worker answers."""
+    try:
+        return _encode_query(" ".join(query.lower().split()))
+    except (ImportError, RuntimeError) as e:
+        print(f"Could not encode search query: {e}")
+        return None
+
+
+def semantic_scores(book_index, vector, k=SEMANTIC_RESULTS):
+    """{book_id: cosine similarity} of the k books nearest to the query vector."""
+    # One lock across search and id lookup: a remove in between moves rows
+    with book_index.lock:
+        rows, similarities = book_index.candidates(vector)
+        best = top_k_rows(similarities, k)
+        return {
+            book_index.book_ids[rows[i]]: float(similarities[i])
+            for i in best
+            if similarities[i] > 0
+        }
+
+
+def _similarities_of(book_index, vector, book_ids):
+    """Cosine similarity of the query vector to each of book_ids (0 if unknown)."""
+    with book_index.lock:
+        known = [b for b in book_ids if b in book_index.positions]
+        rows = book_index.rows_for(known)
+        similarities = book_index.embeddings[rows] @ vector
+    return dict(zip(known, similarities.tolist()))
+
+
+def ranked_search(query, search_type, search_index=None, offset=0, limit=50):
+    """
+    (total, book ids for the page) for type=semantic or type=hybrid, or None
+    if the query cannot be embedded. Hybrid falls back to semantic ranking
+    when there is no lexical index.
+    """
+    vector = encode_query(query)
+    if vector is None:
+        return None
+    from book_index import get_book_index
+
+    book_index = get_book_index()
+    scores = semantic_scores(book_index, vector)
+    if search_type == "hybrid" and search_index is not None:
+        lexical = search_index.text_scores(query)
+        best = max(lexical.values(), default=0) or 1
+        missing = [b for b in lexical if b not in scores]
+        scores.update(_similarities_of(book_index, vector, missing))
+        scores = {
+            book_id: HYBRID_LEXICAL_WEIGHT * lexical.get(book_id, 0) / best
+            + (1 - HYBRID_LEXICAL_WEIGHT) * max(scores.get(book_id, 0), 0)
+            for book_id in scores.keys() | lexical.keys()
+        }
+    ranked = sorted(scores, key=lambda book_id: (-scores[book_id], str(book_id)))
+    return len(ranked), ranked[offset : offset + limit]
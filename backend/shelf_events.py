@@ -0,0 +1,270 @@
+# backend/shelf_events.py
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from bson import ObjectId
+from cache import bump_recs_version, redis_client
+from user_profile import apply_shelf_events
+
+STREAM_KEY = "shelf_events"
+CONSUMER_GROUP = "profile-workers"
+STREAM_MAXLEN = 100000
+BATCH_SIZE = 200
+BLOCK_MS = 1000
+# Events pending this long (failed here, or held by a consumer that died)
+# are claimed and retried
+CLAIM_IDLE_MS = 60000
+
+# Used when Redis is unreachable so that profile updates are not lost while
+# the process is alive.
+local_events = queue.Queue()
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _encode_entry(entry):
+    if entry is None:
+        return ""
+    return json.dumps(
+        {
+            key: str(value) if isinstance(value, ObjectId) else value
+            for key, value in entry.items()
+            if key in ("status", "rating")
+        }
+    )
+
+
+def _decode_entry(raw):
+    if isinstance(raw, bytes):
+        raw = raw.decode()
+    return json.loads(raw) if raw else None
+
+
+def encode_event(user_id, book_id, old_entry, new_entry):
+    """
+    Flatten a bookshelf change into string fields for a Redis stream. Each
+    event gets a unique id, recorded on the profile once applied, and the
+    time it was published, compared with the profile's last rebuild.
+    """
+    return {
+        "user_id": str(user_id),
+        "book_id": str(book_id),
+        "old": _encode_entry(old_entry),
+        "new": _encode_entry(new_entry),
+        "event_id": str(ObjectId()),
+        "published_at": repr(time.time()),
+    }
+
+
+def decode_event(fields):
+    """Inverse of encode_event for fields read back from Redis."""
+    fields = {(k.decode() if isinstance(k, bytes) else k): v for k, v in fields.items()}
+    fields = {k: (v.decode() if isinstance(v, bytes) else v) for k, v in fields.items()}
+    return {
+        "user_id": fields["user_id"],
+        "book_id": fields["book_id"],
+        "old": _decode_entry(fields.get("old")),
+        "new": _decode_entry(fields.get("new")),
+        # Events queued before ids were added have neither
+        "event_id": fields.get("event_id") or None,
+        "published_at": float(fields.get("published_at") or 0),
+    }
+
+
+def publish_shelf_event(user_id, book_id, old_entry, new_entry):
+    """
+    Queue a bookshelf change for the profile worker and return immediately.
+    Events go to a Redis stream, or to an in-process queue if Redis is down.
+    The user's cached recommendations are invalidated right away so the new
+    shelf contents are excluded even before the profile catches up.
+    """
+    bump_recs_version(user_id)
+    event = encode_event(user_id, book_id, old_entry, new_entry)
+    try:
+        redis_client.xadd(STREAM_KEY, event, maxlen=STREAM_MAXLEN, approximate=True)
+    except Exception as e:
+        print(f"Redis unavailable, queueing shelf event locally: {e}")
+        local_events.put(decode_event(event))
+    start_profile_worker()
+
+
+def group_by_user(events):
+    """Group events by user, keeping write order within each user."""
+    grouped = OrderedDict()
+    for event in events:
+        grouped.setdefault(event["user_id"], []).append(event)
+    return grouped
+
+
+def process_events(events):
+    """
+    Apply a batch of events with one profile update per user. Returns the
+    users whose update failed and should be retried.
+    """
+    failed = set()
+    for user_id, changes in group_by_user(events).items():
+        try:
+            result = apply_shelf_events(user_id, changes)
+        except Exception as e:
+            result = f"Error updating profile: {e}"
+        if "Error" in result:
+            print(f"Profile not updated for {user_id}: {result}")
+            # A missing user or book stays missing; anything else is retried
+            if "not found" not in result:
+                failed.add(user_id)
+    return failed
+
+
+class ProfileWorker(threading.Thread):
+    """
+    Background consumer that folds bookshelf events into user profiles.
+
+    Reads from the Redis stream through a consumer group, so several app
+    processes can share the load. Only applied events are acknowledged. The
+    rest stay pending and are retried once they have been idle for
+    CLAIM_IDLE_MS, by this consumer or another one if this process died.
+    Events queued locally while Redis was down are drained too, and put back
+    on the local queue if they fail.
+    """
+
+    def __init__(self, consumer_name=None):
+        super().__init__(daemon=True, name="profile-worker")
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self.stop_event = threading.Event()
+        self.group_ready = False
+        # Start by re-reading events this consumer received but never acked.
+        self.stream_cursor = "0"
+        self.claim_cursor = "0-0"
+        self.next_claim = 0.0
+
+    def ensure_group(self):
+        if self.group_ready:
+            return
+        try:
+            redis_client.xgroup_create(
+                STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True
+            )
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self.group_ready = True
+
+    def claim_stale(self):
+        """Take over up to BATCH_SIZE events pending for CLAIM_IDLE_MS."""
+        if time.monotonic() < self.next_claim:
+            return []
+        next_id, messages = redis_client.xautoclaim(
+            STREAM_KEY,
+            CONSUMER_GROUP,
+            self.consumer_name,
+            CLAIM_IDLE_MS,
+            start_id=self.claim_cursor,
+            count=BATCH_SIZE,
+        )[:2]
+        next_id = next_id.decode() if isinstance(next_id, bytes) else next_id
+        self.claim_cursor = next_id
+        if next_id == "0-0":
+            # Scanned the whole pending list; look again after another idle period
+            self.next_claim = time.monotonic() + CLAIM_IDLE_MS / 1000
+        return messages
+
+    def read_stream(self, block_ms):
+        """
+        Return (message_ids, events) from the Redis stream: stale pending
+        events first, otherwise new ones, waiting up to block_ms for them
+        (None returns at once).
+        """
+        self.ensure_group()
+        messages = self.claim_stale() if self.stream_cursor == ">" else []
+        if messages:
+            # Entries trimmed from the stream come back without fields
+            return [message_id for message_id, _ in messages], [
+                decode_event(fields) if fields else None for _, fields in messages
+            ]
+        response = redis_client.xreadgroup(
+            CONSUMER_GROUP,
+            self.consumer_name,
+            {STREAM_KEY: self.stream_cursor},
+            count=BATCH_SIZE,
+            block=block_ms if self.stream_cursor == ">" else None,
+        )
+        messages = response[0][1] if response else []
+        if self.stream_cursor == "0" and not messages:
+            self.stream_cursor = ">"
+        return [message_id for message_id, _ in messages], [
+            decode_event(fields) for _, fields in messages
+        ]
+
+    def drain_local(self):
+        events = []
+        while len(events) < BATCH_SIZE:
+            try:
+                events.append(local_events.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def run_once(self, block_ms=BLOCK_MS):
+        """Process one batch. Returns the number of events handled."""
+        local = self.drain_local()
+        message_ids, events = [], []
+        try:
+            message_ids, events = self.read_stream(None if local else block_ms)
+        except Exception as e:
+            self.group_ready = False
+            if not local:
+                print(f"Error reading shelf events: {e}")
+                self.stop_event.wait(block_ms / 1000)
+
+        failed = process_events(local + [event for event in events if event])
+        for event in local:
+            if event["user_id"] in failed:
+                local_events.put(event)
+        applied = [
+            message_id
+            for message_id, event in zip(message_ids, events)
+            if not event or event["user_id"] not in failed
+        ]
+        if applied:
+            try:
+                redis_client.xack(STREAM_KEY, CONSUMER_GROUP, *applied)
+            except Exception as e:
+                print(f"Error acknowledging shelf events: {e}")
+        if failed:
+            self.stop_event.wait(block_ms / 1000)
+        return len(local) + len(events)
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.run_once()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def start_profile_worker():
+    """
+    Start the background profile worker once per process. Set
+    SHELF_EVENT_WORKER=0 when a dedicated `python shelf_events.py` process
+    consumes the stream instead.
+    """
+    global _worker
+    if os.getenv("SHELF_EVENT_WORKER", "1") == "0":
+        return None
+    if _worker is not None and _worker.is_alive():
+        return _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = ProfileWorker()
+            _worker.start()
+    return _worker
+
+
+if __name__ == "__main__":
+    print("Consuming shelf events...")
+    ProfileWorker().run()
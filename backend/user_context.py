@@ -0,0 +1,46 @@
+# backend/user_context.py
+"""
+Request-scoped table of loaded user documents.
+
+begin_request runs before every request (see main.py) and gives it an empty
+table. models.users.load_user answers from the table first, then from the
+shared Redis cache, then from Mongo, and records what it loaded. However
+many model functions ask for the same user while a request is served (the
+endpoint resolving the token's email, then the recommender reading genre
+weights and the embedding), the user is fetched once.
+
+Outside a request (workers, scripts, tests calling models directly) there is
+no table and every call goes to the shared cache.
+"""
+from flask import g, has_request_context
+
+
+def begin_request():
+    g.users = {}
+
+
+def request_users():
+    """The current request's {key: user document} table, or None."""
+    if not has_request_context():
+        return None
+    if "users" not in g:
+        g.users = {}
+    return g.users
+
+
+def remember_user(user):
+    users = request_users()
+    if users is None or user is None:
+        return
+    users[("id", str(user["_id"]))] = user
+    if user.get("email_address"):
+        users[("email", user["email_address"])] = user
+
+
+def forget_request_user(user_id):
+    """Drop a user from the request's table after it was written."""
+    users = request_users()
+    if not users:
+        return
+    for key in [k for k, user in users.items() if str(user["_id"]) == str(user_id)]:
+        del users[key]
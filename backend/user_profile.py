@@ -0,0 +1,240 @@
+# backend/user_profile.py
+import time
+import numpy as np
+from bson import ObjectId
+from bson.errors import InvalidId
+from book_index import EMBEDDING_DIM
+from cache import bump_recs_version, redis_client
+from embedding_store import decode_embedding, encode_embedding
+from models.books import books_collection
+from models.users import retrieve_profile, save_profile
+from models.user_bookshelf import get_user_bookshelf
+
+# How much one shelf entry moves a user's genre weights and embedding.
+# A positively rated read book or a wishlisted book pulls the embedding
+# toward the book; negative and neutral ratings only touch genre weights.
+READ_GENRE_WEIGHTS = {"pos": 1, "neg": -1, "mid": 0}
+TO_READ_GENRE_WEIGHT = 0.5
+PROFILE_BOOK_FIELDS = {"genre_tags": 1, "embedding": 1}
+SAVE_RETRIES = 3
+
+
+def shelf_contribution(entry):
+    """
+    Return (genre_weight, embedding_weight) that one bookshelf entry adds to
+    a profile. Entries that are None or currently being read add nothing.
+    """
+    if not entry:
+        return 0, 0
+    status = entry.get("status", "").replace(" ", "-")
+    if status == "read":
+        rating = entry.get("rating")
+        return READ_GENRE_WEIGHTS.get(rating, 0), 1 if rating == "pos" else 0
+    if status == "to-read":
+        return TO_READ_GENRE_WEIGHT, 1
+    return 0, 0
+
+
+def book_vector(book):
+    """The book's embedding as a float64 vector, or None if it has none."""
+    embedding = decode_embedding(book.get("embedding")) if book else None
+    if embedding is None or len(embedding) != EMBEDDING_DIM:
+        return None
+    return embedding.astype(np.float64)
+
+
+def apply_entry_change(profile, book, old_entry, new_entry):
+    """
+    Fold one bookshelf change into a profile in place.
+
+    The profile stores genre weights as plain sums and the embedding as the
+    mean of contributing book embeddings (with its weight), so every change
+    can be applied or reverted without replaying the whole shelf.
+    """
+    old_genre, old_embed = shelf_contribution(old_entry)
+    new_genre, new_embed = shelf_contribution(new_entry)
+
+    genre_delta = new_genre - old_genre
+    if genre_delta:
+        weights = profile["genre_weights"]
+        for genre in book.get("genre_tags", []):
+            weights[genre] = weights.get(genre, 0) + genre_delta
+
+    embed_delta = new_embed - old_embed
+    vector = book_vector(book)
+    if embed_delta and vector is not None:
+        weight = profile["embedding_weight"]
+        if weight > 0 and len(profile["embedding"]) == EMBEDDING_DIM:
+            total = np.asarray(profile["embedding"], dtype=np.float64) * weight
+        else:
+            weight, total = 0, np.zeros(EMBEDDING_DIM)
+        total += embed_delta * vector
+        weight += embed_delta
+        if weight > 1e-9:
+            profile["embedding"] = (total / weight).tolist()
+            profile["embedding_weight"] = weight
+        else:
+            profile["embedding"] = []
+            profile["embedding_weight"] = 0
+
+
+def cache_profile_embedding(user_id, profile):
+    """
+    Keep the recommender's cached user embedding in step with a saved profile
+    and drop the user's cached recommendations.
+    """
+    bump_recs_version(user_id)
+    embedding = profile["embedding"] or np.zeros(EMBEDDING_DIM).tolist()
+    try:
+        redis_client.set(
+            f"user_embedding:{user_id}", encode_embedding(embedding), ex=3600
+        )
+    except Exception as e:
+        print(f"Error caching user embedding: {e}")
+
+
+def rebuild_user_profile(user_id):
+    """
+    Recompute a profile from the whole shelf with one batched book query.
+    Used once for users whose profile predates versioning. The time taken
+    just before reading the shelf is saved as shelf_rebuilt_at: the shelf
+    already holds every write published before it, so those events are
+    dropped rather than applied a second time.
+    """
+    profile = retrieve_profile(user_id)
+    if profile is None:
+        return "Error: User not found."
+
+    rebuilt_at = time.time()
+    entries = get_user_bookshelf(user_id)
+    book_ids = [entry["book_id"] for entry in entries]
+    books = {
+        book["_id"]: book
+        for book in books_collection.find(
+            {"_id": {"$in": book_ids}}, PROFILE_BOOK_FIELDS
+        )
+    }
+
+    expected_version = profile["profile_version"]
+    profile.update(genre_weights=dict(), embedding=[], embedding_weight=0)
+    for entry in entries:
+        book = books.get(entry["book_id"])
+        if book:
+            apply_entry_change(profile, book, None, entry)
+
+    profile["profile_version"] = expected_version
+    if save_profile(profile, rebuilt_at=rebuilt_at) is None:
+        return "Error: Profile changed during rebuild."
+    cache_profile_embedding(user_id, profile)
+    return "Profile rebuilt successfully."
+
+
+def pending_changes(profile, changes):
+    """
+    The changes not yet folded into the profile: neither applied before
+    (a redelivered event) nor published before the last rebuild.
+    """
+    applied = set(profile["applied_shelf_events"])
+    rebuilt_at = profile["shelf_rebuilt_at"]
+    return [
+        change
+        for change in changes
+        if change.get("event_id") not in applied
+        and (rebuilt_at is None or change.get("published_at", 0) >= rebuilt_at)
+    ]
+
+
+def apply_shelf_events(user_id, changes):
+    """
+    Fold a batch of bookshelf writes for one user into their stored profile.
+
+    changes is a list of dicts in write order with the book_id and the shelf
+    entry before ("old") and after ("new") the write (None when it did not
+    exist), plus the event_id and published_at of the event that carried it.
+    The books are fetched with a single query and the profile is saved once,
+    retrying on a version conflict. Applied event ids are recorded in the
+    same save, so an event delivered twice only counts once.
+    """
+    valid_changes = []
+    for change in changes:
+        try:
+            valid_changes.append({**change, "book_id": ObjectId(change["book_id"])})
+        except (InvalidId, TypeError):
+            print(f"Skipping profile change for invalid book_id {change['book_id']}")
+    book_ids = list({change["book_id"] for change in valid_changes})
+    books = {
+        book["_id"]: book
+        for book in books_collection.find(
+            {"_id": {"$in": book_ids}}, PROFILE_BOOK_FIELDS
+        )
+    }
+    if not books:
+        return "Error: Book not found."
+
+    for _ in range(SAVE_RETRIES):
+        profile = retrieve_profile(user_id)
+        if profile is None:
+            return "Error: User not found."
+        if profile["profile_version"] is None:
+            # The rebuild reads the shelf, which already holds these writes;
+            # the next pass drops the events published before it.
+            result = rebuild_user_profile(user_id)
+            if result == "Error: User not found.":
+                return result
+            continue
+
+        pending = pending_changes(profile, valid_changes)
+        if not pending:
+            return "Profile already up to date."
+        for change in pending:
+            book = books.get(change["book_id"])
+            if book:
+                apply_entry_change(profile, book, change["old"], change["new"])
+        applied_events = [
+            change["event_id"] for change in pending if change.get("event_id")
+        ]
+        if save_profile(profile, applied_events=applied_events) is not None:
+            cache_profile_embedding(user_id, profile)
+            return "Profile updated successfully."
+
+    return "Error: Profile update conflicted too many times."
+
+
+def add_genre_interests(user_id, genres):
+    """
+    Add one to the weight of each genre a user picked at onboarding. Saved
+    like a shelf change, so a profile update racing it is retried rather
+    than overwritten.
+    """
+    for _ in range(SAVE_RETRIES):
+        profile = retrieve_profile(user_id)
+        if profile is None:
+            return "Error: User not found."
+        if profile["profile_version"] is None:
+            result = rebuild_user_profile(user_id)
+            if result == "Error: User not found.":
+                return result
+            continue
+
+        weights = profile["genre_weights"]
+        for genre in genres:
+            weights[genre] = weights.get(genre, 0) + 1
+        if save_profile(profile) is not None:
+            cache_profile_embedding(user_id, profile)
+            return "Genre weights updated successfully."
+
+    return "Error: Profile update conflicted too many times."
+
+
+def apply_shelf_event(user_id, book_id, old_entry, new_entry):
+    """Update a user's stored profile after one bookshelf write."""
+    return apply_shelf_events(
+        user_id, [{"book_id": book_id, "old": old_entry, "new": new_entry}]
+    )
+
+
+def ensure_user_profile(user_id):
+    """Make sure a stored profile exists, building it once for legacy users."""
+    profile = retrieve_profile(user_id)
+    if profile is not None and profile["profile_version"] is None:
+        rebuild_user_profile(user_id)
@@ -68,36 +68,27 @@ const Home = () => {
       setLoadingBookshelf(true);
 
       try {
-        const endpoints = [
-          { key: 'currentRead', url: `books/currently-reading` },
-          { key: 'lastRead', url: `books/lastread` },
-          { key: 'toReadShelf', url: `books/to-read` },
-        ];
-        
-        for (const { key, url } of endpoints) {
-          const response = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/${url}`, {
-            headers: { 'Authorization': `Bearer ${token}` },
-          });
-    
-          if (response.ok) {
-            const data = await response.json();
-            
-            // Fetch current page number if it's the current read
-            if (key === "currentRead" && data) {
-              const pageResponse = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/bookshelf/${data._id}/current-page`);
-              if (pageResponse.ok) {
-                const pageData = await pageResponse.json();
-                // console.log("current page:", pageData.page_number)
+        // All three shelves, with their books, in one request
+        const response = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/bookshelf`, {
+          headers: { 'Authorization': `Bearer ${token}` },
+        });
+
+        if (response.ok) {
+          const shelves = await response.json();
+          const currentRead = shelves['currently-reading'][0] ?? null;
+
+          if (currentRead) {
+            currentRead.current_page = currentRead.page_number ?? 0;
+            setBookProgress(Math.round((currentRead.current_page / currentRead.page_count) * 100))
+          }
 
-                data.current_page = pageData.page_number; // Attach page info
-                // progress = data.current_page / data.page_count
-                console.log("book progress:", (data.current_page / data.page_count))
-                setBookProgress(Math.round((data.current_page / data.page_count) * 100))
-              }
-            }
-            
-            setBookshelf((prev) => ({ ...prev, [key]: data }));
-          } 
+          setBookshelf((prev) => ({
+            ...prev,
+            currentRead,
+            // Read books come most recently finished first
+            lastRead: shelves['read'].find((book) => book.date_finished) ?? null,
+            toReadShelf: shelves['to-read'],
+          }));
         }
       } catch (error) {
         console.error('Error fetching bookshelf data:', error);
@@ -43,27 +43,23 @@ const Profile = () => {
 
     const fetchBookshelfData = async (userId, token) => {
       try {
-        const endpoints = [
-          { key: 'currentRead', url: `books/currently-reading` },
-          { key: 'booksRead', url: `books/read` },
-          { key: 'toReadShelf', url: `books/to-read` },
-        ];
-        for (const { key, url } of endpoints) {
-          const response = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/${url}`, {
-            headers: { 'Authorization': `Bearer ${token}` },
-          });
-          if (response.ok) {
-            const data = await response.json();
-            if (key === "currentRead" && data) {
-              const pageRes = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/bookshelf/${data._id}/current-page`);
-              if (pageRes.ok) {
-                const pageData = await pageRes.json();
-                data.current_page = pageData.page_number;
-                data.progress = Math.round((pageData.page_number / data.page_count) * 100);
-              }
-            }
-            setBookshelf((prev) => ({ ...prev, [key]: data }));            
+        // All three shelves, with their books, in one request
+        const response = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/bookshelf`, {
+          headers: { 'Authorization': `Bearer ${token}` },
+        });
+        if (response.ok) {
+          const shelves = await response.json();
+          const currentRead = shelves['currently-reading'][0] ?? null;
+          if (currentRead) {
+            currentRead.current_page = currentRead.page_number ?? 0;
+            currentRead.progress = Math.round((currentRead.current_page / currentRead.page_count) * 100);
           }
+          setBookshelf((prev) => ({
+            ...prev,
+            currentRead,
+            booksRead: shelves['read'],
+            toReadShelf: shelves['to-read'],
+          }));
         }
       } catch (error) {
         console.error('Error fetching bookshelf data:', error);
@@ -96,27 +92,23 @@ const Profile = () => {
 
   const fetchBookshelfData = async (userId, token) => {
     try {
-      const endpoints = [
-        { key: 'currentRead', url: `books/currently-reading` },
-        { key: 'booksRead', url: `books/read` },
-        { key: 'toReadShelf', url: `books/to-read` },
-      ];
-      for (const { key, url } of endpoints) {
-        const response = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/${url}`, {
-          headers: { 'Authorization': `Bearer ${token}` },
-        });
-        if (response.ok) {
-          const data = await response.json();
-          if (key === "currentRead" && data) {
-            const pageRes = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/bookshelf/${data._id}/current-page`);
-            if (pageRes.ok) {
-              const pageData = await pageRes.json();
-              data.current_page = pageData.page_number;
-              data.progress = Math.round((pageData.page_number / data.page_count) * 100);
-            }
-          }
-          setBookshelf((prev) => ({ ...prev, [key]: data }));          
+      // All three shelves, with their books, in one request
+      const response = await fetch(`${BACKEND_URL}/shelf/api/user/${userId}/bookshelf`, {
+        headers: { 'Authorization': `Bearer ${token}` },
+      });
+      if (response.ok) {
+        const shelves = await response.json();
+        const currentRead = shelves['currently-reading'][0] ?? null;
+        if (currentRead) {
+          currentRead.current_page = currentRead.page_number ?? 0;
+          currentRead.progress = Math.round((currentRead.current_page / currentRead.page_count) * 100);
         }
+        setBookshelf((prev) => ({
+          ...prev,
+          currentRead,
+          booksRead: shelves['read'],
+          toReadShelf: shelves['to-read'],
+        }));
       }
     } catch (error) {
       console.error('Error fetching bookshelf data:', error);
@@ -1,3 +1,4 @@
+import time
 import uuid
 from flask.testing import FlaskClient
 from main import app
@@ -19,13 +20,14 @@ def test_oauth_user_create_update_delete():
         "email": email,
         "given_name": "System",
         "family_name": "Tester",
+        "exp": time.time() + 3600,
         "picture": "https://example.com/pfp.jpg",
     }
 
     try:
         # Step 1: Simulate OAuth-based user creation
-        with patch("requests.get") as mock_get:
-            mock_get.return_value.json.return_value = fake_token_info
+        with patch("auth.decode_token") as mock_decode:
+            mock_decode.return_value = fake_token_info
             headers = {"Authorization": f"Bearer {fake_token}"}
             res = client.get("/user/profile", headers=headers)
             assert res.status_code == 200
@@ -1,3 +1,4 @@
+import time
 import uuid
 from flask.testing import FlaskClient
 from main import app
@@ -7,8 +8,8 @@ from unittest.mock import patch
 from bson import ObjectId
 
 
-@patch("requests.get")
-def test_oauth_user_recommendation_flow(mock_get):
+@patch("auth.decode_token")
+def test_oauth_user_recommendation_flow(mock_decode):
     client: FlaskClient = app.test_client()
     unique = uuid.uuid4().hex
     email = f"rec_test_{unique}@example.com"
@@ -20,10 +21,11 @@ def test_oauth_user_recommendation_flow(mock_get):
         "email": email,
         "given_name": "Rec",
         "family_name": "Tester",
+        "exp": time.time() + 3600,
         "picture": "https://example.com/avatar.jpg",
     }
 
-    mock_get.return_value.json.return_value = fake_token_info
+    mock_decode.return_value = fake_token_info
     headers = {"Authorization": f"Bearer {token}"}
 
     try:
@@ -0,0 +1,111 @@
+import numpy as np
+from bson import ObjectId
+from ann_search import (
+    ExactSearch,
+    IVFSearch,
+    make_search_engine,
+    top_k_rows,
+)
+from book_index import BookIndex
+
+
+def clustered_embeddings(n=6000, dim=32, clusters=20, seed=1):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    labels = rng.integers(0, clusters, n)
+    vectors = centers[labels] + 0.3 * rng.normal(size=(n, dim))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+
+def test_top_k_rows_orders_and_breaks_ties():
+    scores = np.array([0.2, 0.9, 0.9, 0.1])
+    assert top_k_rows(scores, 2).tolist() == [1, 2]
+    assert top_k_rows(scores, 10).tolist() == [1, 2, 0, 3]
+
+
+def test_exact_search_returns_all_unexcluded_rows():
+    embeddings = clustered_embeddings(n=50)
+    engine = ExactSearch()
+    rows, sims = engine.candidates(embeddings, embeddings[0], np.array([0, 3]))
+    assert len(rows) == 48
+    assert 0 not in rows and 3 not in rows
+    assert np.allclose(sims, embeddings[rows] @ embeddings[0])
+
+
+def test_ivf_falls_back_to_exact_for_small_catalogs():
+    embeddings = clustered_embeddings(n=100)
+    engine = IVFSearch(min_size=1000)
+    engine.fit(embeddings, np.ones(100, dtype=bool))
+    assert engine.centroids is None
+    rows, _ = engine.candidates(embeddings, embeddings[0], np.zeros(0, dtype=int))
+    assert len(rows) == 100
+
+
+def test_ivf_recall_against_exact():
+    embeddings = clustered_embeddings()
+    engine = IVFSearch(nprobe=8, candidate_pool=200, min_size=100)
+    engine.fit(embeddings, np.ones(len(embeddings), dtype=bool))
+
+    hits = 0
+    queries = range(0, 6000, 300)
+    for q in queries:
+        exact = set(top_k_rows(embeddings @ embeddings[q], 10).tolist())
+        rows, _ = engine.candidates(embeddings, embeddings[q], np.zeros(0, dtype=int))
+        hits += len(exact & set(rows[:10].tolist()))
+    assert hits / (10 * len(queries)) >= 0.9
+
+
+def test_ivf_respects_exclusions_and_updates():
+    embeddings = clustered_embeddings()
+    engine = IVFSearch(nprobe=4, candidate_pool=50, min_size=100)
+    engine.fit(embeddings, np.ones(len(embeddings), dtype=bool))
+
+    rows, _ = engine.candidates(embeddings, embeddings[5], np.array([5]))
+    assert 5 not in rows
+
+    # Row 5 loses its embedding, then the last row is swapped into slot 7
+    engine.update(5, None)
+    assert all(5 not in members for members in engine.members)
+    last = len(embeddings) - 1
+    moved_cluster = engine.assignments[last]
+    engine.remove(7, last)
+    assert engine.assignments[7] == moved_cluster
+    assert engine.assignments[last] == -1
+    assert 7 in engine.members[moved_cluster]
+
+
+def test_ivf_refits_after_the_catalog_doubles():
+    embeddings = clustered_embeddings(n=400, dim=384)
+    books = [{"_id": ObjectId(), "embedding": v.tolist()} for v in embeddings]
+    engine = IVFSearch(nlist=8, candidate_pool=50, min_size=150)
+    book_index = BookIndex(search_engine=engine)
+
+    # Too small to cluster at first; clustered once it reaches min_size
+    book_index.build(books[:100])
+    assert engine.centroids is None
+    for book in books[100:150]:
+        book_index.upsert(book)
+    assert engine.fit_size == 150
+    centroids = engine.centroids
+
+    for book in books[150:299]:
+        book_index.upsert(book)
+    assert engine.centroids is centroids
+    book_index.upsert(books[299])
+    assert engine.fit_size == 300 and engine.centroids is not centroids
+    assert (engine.assignments[:300] >= 0).all()
+    assert not IVFSearch(refit_growth=0).needs_refit(10**6)
+
+
+def test_make_search_engine_from_env(monkeypatch):
+    monkeypatch.setenv("REC_SEARCH_ENGINE", "ivf")
+    monkeypatch.setenv("REC_IVF_NPROBE", "3")
+    monkeypatch.setenv("REC_IVF_REFIT_GROWTH", "0")
+    engine = make_search_engine()
+    assert isinstance(engine, IVFSearch)
+    assert engine.nprobe == 3
+    assert engine.refit_growth == 0
+
+    monkeypatch.setenv("REC_SEARCH_ENGINE", "bogus")
+    assert isinstance(make_search_engine(), ExactSearch)
@@ -41,3 +41,39 @@ def test_search_books_by_author(client):
     assert response.status_code == 200
     assert isinstance(response.get_json(), list)
     assert "J.K. Rowling" in response.get_json()[0]["author"]
+
+
+def test_search_books_pages_through_search_index(client):
+    from bson import ObjectId
+    from search_index import SearchIndex
+
+    books = {}
+    for i in range(3):
+        book_id = ObjectId()
+        books[book_id] = {"_id": book_id, "title": f"Dune {i}", "author": ["Herbert"]}
+    index = SearchIndex()
+    index.build(books.values())
+
+    with patch("api.books.get_search_index", return_value=index), patch(
+        "api.books.read_books_by_ids"
+    ) as read_books:
+        read_books.side_effect = lambda ids, projection: [dict(books[i]) for i in ids]
+        response = client.get("/api/books?query=dune&page=2&per_page=2")
+
+    assert response.status_code == 200
+    assert response.headers["X-Total-Count"] == "3"
+    assert len(response.get_json()) == 1
+    assert read_books.call_args[0][1] == "detail"
+
+
+def test_search_books_rejects_bad_page(client):
+    response = client.get("/api/books?query=dune&page=0")
+    assert response.status_code == 400
+
+
+def test_semantic_search_unavailable_without_model(client):
+    with patch("api.books.get_search_index", return_value=None), patch(
+        "api.books.ranked_search", return_value=None
+    ):
+        response = client.get("/api/books?query=desert planet&type=semantic")
+    assert response.status_code == 503
@@ -1,7 +1,7 @@
 from bson import ObjectId
 from api.bookshelf import parse_date, objectid_to_str
 from datetime import datetime
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 import pytest
 
 
@@ -36,16 +36,15 @@ def test_get_read_books(mock_get_read_books, client, user_and_book):
     mock_get_read_books.assert_called_once_with(uid)
 
 
-@patch("api.bookshelf.read_book_by_bookId")
+@patch("api.bookshelf.read_books_by_ids")
 @patch("api.bookshelf.get_unread_books")
 def test_get_unread_books(mock_get_unread_books, mock_read_book, client, user_and_book):
     uid, _ = user_and_book
 
     mock_get_unread_books.return_value = [{"book_id": "507f1f77bcf86cd799439013"}]
-    mock_read_book.return_value = {
-        "title": "Unread Book",
-        "book_id": "507f1f77bcf86cd799439013",
-    }
+    mock_read_book.return_value = [
+        {"title": "Unread Book", "book_id": "507f1f77bcf86cd799439013"}
+    ]
 
     res = client.get(f"/shelf/api/user/{uid}/books/to-read")
     assert res.status_code == 200
@@ -94,7 +93,7 @@ def test_parse_date_with_integer():
     assert result.replace(tzinfo=None) == datetime.min
 
 
-@patch("api.bookshelf.read_book_by_bookId")
+@patch("api.bookshelf.read_books_by_ids")
 @patch("api.bookshelf.get_read_books")
 def test_get_last_read_book_success(mock_get_books, mock_read_book, client):
     user_id = "507f1f77bcf86cd799439011"
@@ -109,10 +108,9 @@ def test_get_last_read_book_success(mock_get_books, mock_read_book, client):
             "rating": "pos",
         }
     ]
-    mock_read_book.return_value = {
-        "title": "Test Book",
-        "book_id": "507f1f77bcf86cd799439012",
-    }
+    mock_read_book.return_value = [
+        {"title": "Test Book", "book_id": "507f1f77bcf86cd799439012"}
+    ]
 
     res = client.get(f"/shelf/api/user/{user_id}/books/lastread")
     assert res.status_code == 200
@@ -141,7 +139,7 @@ def test_get_last_read_book_crashes(mock_get_books, client):
     assert "Crash" in res.get_json()["error"]
 
 
-@patch("api.bookshelf.read_book_by_bookId", return_value={})
+@patch("api.bookshelf.read_books_by_ids", return_value=[{}])
 @patch("api.bookshelf.get_read_books")
 def test_get_last_read_book_missing_fields(mock_get_books, mock_read_book, client):
     fake_oid = ObjectId()
@@ -157,14 +155,14 @@ def test_get_last_read_book_missing_fields(mock_get_books, mock_read_book, clien
     assert "rating" in res.get_json()
 
 
-@patch("api.bookshelf.read_book_by_bookId")
+@patch("api.bookshelf.read_books_by_ids")
 @patch("api.bookshelf.get_read_books")
 def test_get_read_books_success(mock_get_books, mock_read_book, client):
     uid = "507f1f77bcf86cd799439011"
     book_id = "507f1f77bcf86cd799439012"
 
     mock_get_books.return_value = [{"book_id": book_id, "rating": "pos"}]
-    mock_read_book.return_value = {"title": "Read Book", "book_id": book_id}
+    mock_read_book.return_value = [{"title": "Read Book", "book_id": book_id}]
 
     res = client.get(f"/shelf/api/user/{uid}/books/read")
     assert res.status_code == 200
@@ -174,14 +172,14 @@ def test_get_read_books_success(mock_get_books, mock_read_book, client):
     assert data[0]["title"] == "Read Book"
 
 
-@patch("api.bookshelf.read_book_by_bookId")
+@patch("api.bookshelf.read_books_by_ids")
 @patch("api.bookshelf.get_read_books")
 def test_get_read_books_skips_bad_books(mock_get_books, mock_read_book, client):
     uid = "507f1f77bcf86cd799439011"
     book_id = "507f1f77bcf86cd799439012"
 
     mock_get_books.return_value = [{"book_id": book_id, "rating": "pos"}]
-    mock_read_book.return_value = "Book not found"  # triggers skip
+    mock_read_book.return_value = [None]  # book not found: skipped
 
     res = client.get(f"/shelf/api/user/{uid}/books/read")
     assert res.status_code == 200
@@ -204,7 +202,7 @@ def test_get_read_books_exception(mock_get_books, client):
     assert "Unexpected failure" in res.get_json()["error"]
 
 
-@patch("api.bookshelf.read_book_by_bookId")
+@patch("api.bookshelf.read_books_by_ids")
 @patch("api.bookshelf.get_read_books")
 def test_get_read_books_partial_skip(mock_get_books, mock_read_book, client):
     uid = "507f1f77bcf86cd799439011"
@@ -216,19 +214,15 @@ def test_get_read_books_partial_skip(mock_get_books, mock_read_book, client):
         {"book_id": invalid_id, "rating": "mid"},
     ]
 
-    def read_book_side_effect(book_id):
-        if book_id == valid_id:
-            return {"title": "Valid Book", "book_id": valid_id}
-        else:
-            return "Error retrieving book"
-
-    mock_read_book.side_effect = read_book_side_effect
+    mock_read_book.return_value = [{"title": "Valid Book", "book_id": valid_id}, None]
 
     res = client.get(f"/shelf/api/user/{uid}/books/read")
     assert res.status_code == 200
     data = res.get_json()
     assert len(data) == 1
     assert data[0]["book_id"] == valid_id
+    # Both shelf entries are hydrated by one bulk read
+    mock_read_book.assert_called_once_with([valid_id, invalid_id], "card")
 
 
 @patch("api.bookshelf.get_unread_books", return_value="Error: no user found")
@@ -249,7 +243,7 @@ def test_get_unread_books_raises_exception(mock_get_books, client):
     assert "DB exploded" in res.get_json()["error"]
 
 
-@patch("api.bookshelf.read_book_by_bookId")
+@patch("api.bookshelf.read_books_by_ids")
 @patch("api.bookshelf.get_unread_books")
 def test_get_unread_books_with_objectid_conversion(
     mock_get_books, mock_read_book, client
@@ -257,7 +251,7 @@ def test_get_unread_books_with_objectid_conversion(
     uid = "507f1f77bcf86cd799439011"
     oid = ObjectId()
     mock_get_books.return_value = [{"book_id": "507f1f77bcf86cd799439012"}]
-    mock_read_book.return_value = {"_id": oid, "title": "ObjectId Book"}
+    mock_read_book.return_value = [{"_id": oid, "title": "ObjectId Book"}]
 
     res = client.get(f"/shelf/api/user/{uid}/books/to-read")
     assert res.status_code == 200
@@ -265,14 +259,14 @@ def test_get_unread_books_with_objectid_conversion(
     assert result[0]["_id"] == str(oid)
 
 
-@patch("api.bookshelf.read_book_by_bookId")
+@patch("api.bookshelf.read_books_by_ids")
 @patch("api.bookshelf.get_currently_reading_books")
 def test_get_currently_reading_book_success(mock_get_books, mock_read_book, client):
     uid = "507f1f77bcf86cd799439011"
     bid = "507f1f77bcf86cd799439012"
 
     mock_get_books.return_value = [{"book_id": bid}]
-    mock_read_book.return_value = {"book_id": bid, "title": "Reading Book"}
+    mock_read_book.return_value = [{"book_id": bid, "title": "Reading Book"}]
 
     res = client.get(f"/shelf/api/user/{uid}/books/currently-reading")
     assert res.status_code == 200
@@ -300,7 +294,7 @@ def test_get_currently_reading_book_crashes(mock_get_books, client):
     assert "Database down" in res.get_json()["error"]
 
 
-@patch("api.bookshelf.read_book_by_bookId")
+@patch("api.bookshelf.read_books_by_ids")
 @patch("api.bookshelf.get_currently_reading_books")
 def test_get_currently_reading_book_objectid_conversion(
     mock_get_books, mock_read_book, client
@@ -310,16 +304,17 @@ def test_get_currently_reading_book_objectid_conversion(
     oid = ObjectId()
 
     mock_get_books.return_value = [{"book_id": bid}]
-    mock_read_book.return_value = {"_id": oid, "title": "Reading Book"}
+    mock_read_book.return_value = [{"_id": oid, "title": "Reading Book"}]
 
     res = client.get(f"/shelf/api/user/{uid}/books/currently-reading")
     assert res.status_code == 200
     assert res.get_json()["_id"] == str(oid)
 
 
+@patch("api.bookshelf.publish_shelf_event")
 @patch("api.bookshelf.create_user_bookshelf", return_value="mock_id")
 @patch("api.bookshelf.get_currently_reading_books", return_value=[])
-def test_add_book_to_bookshelf_success(mock_get, mock_create, client):
+def test_add_book_to_bookshelf_success(mock_get, mock_create, mock_event, client):
     uid = "507f1f77bcf86cd799439011"
     bid = str(ObjectId())
 
@@ -331,6 +326,9 @@ def test_add_book_to_bookshelf_success(mock_get, mock_create, client):
     assert res.status_code == 201
     assert res.get_json()["message"] == "Book added to bookshelf"
     assert res.get_json()["id"] == "mock_id"
+    mock_event.assert_called_once_with(
+        uid, bid, None, {"status": "read", "rating": "pos"}
+    )
 
 
 @patch("api.bookshelf.create_user_bookshelf", return_value="Error: already exists")
@@ -348,11 +346,12 @@ def test_add_book_to_bookshelf_creation_error(mock_get, mock_create, client):
     assert "already exists" in res.get_json()["error"]
 
 
+@patch("api.bookshelf.publish_shelf_event")
 @patch("api.bookshelf.create_user_bookshelf", return_value="mock_id")
 @patch("api.bookshelf.delete_user_bookshelf")
 @patch("api.bookshelf.get_currently_reading_books")
 def test_add_currently_reading_replaces_existing(
-    mock_get, mock_delete, mock_create, client
+    mock_get, mock_delete, mock_create, mock_event, client
 ):
     uid = "507f1f77bcf86cd799439011"
     bid = str(ObjectId())
@@ -522,7 +521,9 @@ def test_update_bookshelf_status_success(mock_update, client):
 
     assert res.status_code == 200
     assert "Book status updated" in res.get_json()["message"]
-    mock_update.assert_called_once_with(uid, bid, "to-read", date_finished=None)
+    mock_update.assert_called_once_with(
+        uid, bid, "to-read", date_finished=None, on_change=ANY
+    )
 
 
 @patch(
@@ -572,7 +573,7 @@ def test_rate_book_success(mock_rate, client):
 
     assert res.status_code == 200
     assert res.get_json()["message"] == "Book rating updated."
-    mock_rate.assert_called_once_with(uid, bid, "pos")
+    mock_rate.assert_called_once_with(uid, bid, "pos", on_change=ANY)
 
 
 @patch("api.bookshelf.rate_book", return_value="Error: Invalid rating value.")
@@ -614,7 +615,7 @@ def test_delete_book_from_bookshelf_success(mock_delete, client):
     res = client.delete(f"/shelf/api/user/{uid}/bookshelf/{bid}")
     assert res.status_code == 200
     assert "deleted" in res.get_json()["message"]
-    mock_delete.assert_called_once_with(uid, bid)
+    mock_delete.assert_called_once_with(uid, bid, on_change=ANY)
 
 
 @patch("api.bookshelf.delete_user_bookshelf", return_value="Error: Invalid user_id.")
@@ -625,7 +626,7 @@ def test_delete_book_from_bookshelf_model_error(mock_delete, client):
     res = client.delete(f"/shelf/api/user/{uid}/bookshelf/{bid}")
     assert res.status_code == 400
     assert "Invalid user_id" in res.get_json()["error"]
-    mock_delete.assert_called_once_with(uid, bid)
+    mock_delete.assert_called_once_with(uid, bid, on_change=ANY)
 
 
 @patch("api.bookshelf.delete_user_bookshelf", side_effect=Exception("Delete exploded"))
@@ -670,3 +671,93 @@ def test_get_book_status_exception(mock_get_status, client):
     res = client.get(f"/shelf/api/user/{uid}/bookshelf/{bid}/status")
     assert res.status_code == 500
     assert "Status fetch error" in res.get_json()["error"]
+
+
+def write_replacing(old_entry, new_fields, result):
+    """A mocked bookshelf write that replaced old_entry, as the model reports it."""
+
+    def write(*args, on_change=None, **kwargs):
+        if on_change:
+            new_entry = None if new_fields is None else {**old_entry, **new_fields}
+            on_change(old_entry, new_entry)
+        return result
+
+    return write
+
+
+@patch("api.bookshelf.publish_shelf_event")
+@patch("api.bookshelf.rate_book")
+def test_rate_book_updates_profile(mock_rate, mock_event, client):
+    uid, bid = VALID_USER_ID, VALID_BOOK_ID
+    mock_rate.side_effect = write_replacing(
+        {"status": "read", "rating": "mid"},
+        {"rating": "pos"},
+        "UserBookshelf rating updated.",
+    )
+
+    res = client.put(
+        f"/shelf/api/user/{uid}/bookshelf/{bid}/rating", json={"rating": "pos"}
+    )
+
+    assert res.status_code == 200
+    mock_event.assert_called_once_with(
+        uid,
+        bid,
+        {"status": "read", "rating": "mid"},
+        {"status": "read", "rating": "pos"},
+    )
+
+
+@patch("api.bookshelf.publish_shelf_event", side_effect=Exception("profile down"))
+@patch("api.bookshelf.delete_user_bookshelf")
+def test_delete_book_profile_failure_does_not_fail_request(
+    mock_delete, mock_event, client
+):
+    uid, bid = VALID_USER_ID, VALID_BOOK_ID
+    mock_delete.side_effect = write_replacing(
+        {"status": "to-read", "rating": "mid"}, None, "Deleted successfully."
+    )
+
+    res = client.delete(f"/shelf/api/user/{uid}/bookshelf/{bid}")
+
+    assert res.status_code == 200
+    mock_event.assert_called_once_with(
+        uid, bid, {"status": "to-read", "rating": "mid"}, None
+    )
+
+
+@patch("api.bookshelf.publish_shelf_event")
+@patch("api.bookshelf.update_user_bookshelf_status", return_value="Error: bad")
+def test_failed_status_update_skips_profile(mock_update, mock_event, client):
+    uid, bid = VALID_USER_ID, VALID_BOOK_ID
+
+    res = client.put(
+        f"/shelf/api/user/{uid}/bookshelf/{bid}/status", json={"status": "read"}
+    )
+
+    assert res.status_code == 400
+    mock_event.assert_not_called()
+
+
+@patch("api.bookshelf.get_bookshelf_with_books")
+def test_get_bookshelf_returns_all_shelves(mock_shelves, client):
+    oid = ObjectId()
+    mock_shelves.return_value = {
+        "read": [{"_id": oid, "title": "Read Book", "rating": "pos"}],
+        "to-read": [],
+        "currently-reading": [],
+    }
+
+    res = client.get(f"/shelf/api/user/{VALID_USER_ID}/bookshelf?include=summary")
+
+    assert res.status_code == 200
+    assert res.get_json()["read"][0]["_id"] == str(oid)
+    assert res.get_json()["to-read"] == []
+    mock_shelves.assert_called_once_with(VALID_USER_ID, include_summary=True)
+
+
+@patch("api.bookshelf.get_bookshelf_with_books", return_value="Error: Invalid user_id.")
+def test_get_bookshelf_error_string(mock_shelves, client):
+    res = client.get(f"/shelf/api/user/{VALID_USER_ID}/bookshelf")
+    assert res.status_code == 400
+    mock_shelves.assert_called_once_with(VALID_USER_ID, include_summary=False)
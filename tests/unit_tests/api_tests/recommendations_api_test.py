@@ -60,9 +60,9 @@ def test_onboarding_missing_auth_header(client):
     assert response.get_json()["error"] == "Missing or invalid Authorization header"
 
 
-@patch("api.recommendations.requests.get")
-def test_onboarding_invalid_token(mock_get, client):
-    mock_get.return_value.json.return_value = {"invalid": "no_email"}
+@patch("api.recommendations.verify_google_token")
+def test_onboarding_invalid_token(mock_verify, client):
+    mock_verify.return_value = None
     headers = {"Authorization": "Bearer fake_token"}
     response = client.post("/recs/api/user/onboarding/recommendations", headers=headers)
     assert response.status_code == 401
@@ -70,9 +70,9 @@ def test_onboarding_invalid_token(mock_get, client):
 
 
 @patch("api.recommendations.read_user_by_email", return_value=None)
-@patch("api.recommendations.requests.get")
+@patch("api.recommendations.verify_google_token")
 def test_onboarding_user_not_found(mock_token, mock_user, client):
-    mock_token.return_value.json.return_value = {"email": "user@example.com"}
+    mock_token.return_value = {"email": "user@example.com"}
     headers = {"Authorization": "Bearer test_token"}
     response = client.post("/recs/api/user/onboarding/recommendations", headers=headers)
     assert response.status_code == 404
@@ -81,11 +81,11 @@ def test_onboarding_user_not_found(mock_token, mock_user, client):
 
 @patch("api.recommendations.onboarding_recommendations", return_value=True)
 @patch("api.recommendations.read_user_by_email")
-@patch("api.recommendations.requests.get")
+@patch("api.recommendations.verify_google_token")
 def test_onboarding_recommendations_success(
     mock_token, mock_user, mock_onboard, client
 ):
-    mock_token.return_value.json.return_value = {"email": "user@example.com"}
+    mock_token.return_value = {"email": "user@example.com"}
     mock_user.return_value = {"_id": str(ObjectId())}
     headers = {"Authorization": "Bearer test_token"}
     response = client.post(
@@ -97,8 +97,10 @@ def test_onboarding_recommendations_success(
     assert response.get_json()["genres_updated"] is True
 
 
-@patch("api.recommendations.requests.get", side_effect=Exception("OAuth failure"))
-def test_onboarding_recommendations_internal_error(mock_get, client):
+@patch(
+    "api.recommendations.verify_google_token", side_effect=Exception("OAuth failure")
+)
+def test_onboarding_recommendations_internal_error(mock_verify, client):
     headers = {"Authorization": "Bearer broken"}
     response = client.post(
         "/recs/api/user/onboarding/recommendations",
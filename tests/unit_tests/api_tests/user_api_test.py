@@ -2,7 +2,7 @@ import pytest
 import uuid
 from bson import ObjectId
 from main import app
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
 
 app.testing = True
 
@@ -138,7 +138,8 @@ def test_save_genres_missing_auth(client):
 
 def test_save_genres_invalid_payload(client):
     headers = {"Authorization": "Bearer fake_token"}
-    response = client.post("/user/save-genres", json={}, headers=headers)
+    with patch("api.user.verify_google_token", return_value=None):
+        response = client.post("/user/save-genres", json={}, headers=headers)
     assert response.status_code in [400, 401, 404]
 
 
@@ -162,11 +163,9 @@ def test_save_genres_success(client):
     mock_token_info = {"email": "testuser@example.com"}
     mock_user = {"_id": ObjectId(), "email_address": "testuser@example.com"}
 
-    with patch(
-        "api.user.requests.get", return_value=MagicMock(json=lambda: mock_token_info)
-    ), patch("api.user.read_user_by_email", return_value=mock_user), patch(
-        "api.user.add_interest"
-    ) as add_mock:
+    with patch("api.user.verify_google_token", return_value=mock_token_info), patch(
+        "api.user.read_user_by_email", return_value=mock_user
+    ), patch("api.user.add_interest") as add_mock:
 
         headers = {"Authorization": "Bearer faketoken"}
         payload = {"genres": ["fantasy", "sci-fi"]}
@@ -196,9 +195,9 @@ def test_get_user_profile_google_oauth_success(client):
         "created_at": "2023-01-01",
     }
 
-    with patch(
-        "api.user.requests.get", return_value=MagicMock(json=lambda: mock_token_info)
-    ), patch("api.user.read_user_by_email", return_value=mock_user):
+    with patch("api.user.verify_google_token", return_value=mock_token_info), patch(
+        "api.user.read_user_by_email", return_value=mock_user
+    ):
 
         headers = {"Authorization": "Bearer validtoken"}
         response = client.get("/user/profile", headers=headers)
@@ -210,19 +209,20 @@ def test_get_user_profile_google_oauth_success(client):
 
 
 def test_get_user_profile_missing_email_from_token(client):
-    with patch("api.user.requests.get", return_value=MagicMock(json=lambda: {})):
+    with patch("api.user.verify_google_token", return_value={}):
         headers = {"Authorization": "Bearer badtoken"}
         res = client.get("/user/profile", headers=headers)
-        assert res.status_code == 200  # returns token_info JSON directly
+        assert res.status_code == 401
+        assert res.get_json()["error"] == "Invalid token"
 
 
 def test_save_genres_invalid_format(client):
     mock_token_info = {"email": "t@example.com"}
     mock_user = {"_id": ObjectId(), "email_address": "t@example.com"}
 
-    with patch(
-        "api.user.requests.get", return_value=MagicMock(json=lambda: mock_token_info)
-    ), patch("api.user.read_user_by_email", return_value=mock_user):
+    with patch("api.user.verify_google_token", return_value=mock_token_info), patch(
+        "api.user.read_user_by_email", return_value=mock_user
+    ):
 
         headers = {"Authorization": "Bearer token"}
         res = client.post(
@@ -251,13 +251,9 @@ def test_get_user_profile_create_new_user(client):
         "created_at": "2024-01-01",
     }
 
-    with patch(
-        "api.user.requests.get", return_value=MagicMock(json=lambda: token_info)
-    ), patch(
+    with patch("api.user.verify_google_token", return_value=token_info), patch(
         "api.user.read_user_by_email", side_effect=["User not found.", new_user]
-    ), patch(
-        "api.user.create_user", return_value=new_user_id
-    ):
+    ), patch("api.user.create_user", return_value=new_user_id):
 
         headers = {"Authorization": "Bearer newusertoken"}
         res = client.get("/user/profile", headers=headers)
@@ -278,9 +274,9 @@ def test_get_user_profile_missing_auth(client):
 
 def test_save_genres_user_is_none(client):
     token_info = {"email": "nobody@example.com"}
-    with patch(
-        "api.user.requests.get", return_value=MagicMock(json=lambda: token_info)
-    ), patch("api.user.read_user_by_email", return_value=None):
+    with patch("api.user.verify_google_token", return_value=token_info), patch(
+        "api.user.read_user_by_email", return_value=None
+    ):
 
         headers = {"Authorization": "Bearer whatever"}
         response = client.post(
@@ -292,9 +288,9 @@ def test_save_genres_user_is_none(client):
 
 def test_save_genres_user_is_string(client):
     token_info = {"email": "nobody@example.com"}
-    with patch(
-        "api.user.requests.get", return_value=MagicMock(json=lambda: token_info)
-    ), patch("api.user.read_user_by_email", return_value="User not found."):
+    with patch("api.user.verify_google_token", return_value=token_info), patch(
+        "api.user.read_user_by_email", return_value="User not found."
+    ):
 
         headers = {"Authorization": "Bearer something"}
         response = client.post(
@@ -312,14 +308,10 @@ def test_get_user_profile_user_still_string(client):
         "picture": "http://image.url/fail.png",
     }
 
-    with patch(
-        "api.user.requests.get", return_value=MagicMock(json=lambda: token_info)
-    ), patch(
+    with patch("api.user.verify_google_token", return_value=token_info), patch(
         "api.user.read_user_by_email",
         side_effect=["User not found.", "User not found."],
-    ), patch(
-        "api.user.create_user", return_value=str(ObjectId())
-    ):
+    ), patch("api.user.create_user", return_value=str(ObjectId())):
 
         headers = {"Authorization": "Bearer failtoken"}
         res = client.get("/user/profile", headers=headers)
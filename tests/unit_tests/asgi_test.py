@@ -0,0 +1,158 @@
+import json
+import threading
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+import bson
+import pytest
+from bson import ObjectId
+from fastapi.testclient import TestClient
+import asgi
+from main import app as flask_app
+
+
+@pytest.fixture
+def client():
+    # No `with`: the lifespan (fetching Google's keys) is not run
+    return TestClient(asgi.app)
+
+
+@pytest.fixture
+def redis_client():
+    client = MagicMock()
+    client.get = AsyncMock(return_value=None)
+    client.mget = AsyncMock(return_value=[None, None, None])
+    client.set = AsyncMock()
+    client.eval = AsyncMock()
+    with patch("asgi.redis_client", client):
+        yield client
+
+
+@pytest.fixture
+def users_collection():
+    collection = MagicMock()
+    collection.find_one = AsyncMock(return_value=None)
+    with patch("asgi.users_collection", collection):
+        yield collection
+
+
+def test_cached_rankings_are_served_without_the_sync_path(client, redis_client):
+    book = {"_id": ObjectId(), "title": "Dune", "embedding": [0.1, 0.2]}
+    ranked = [[str(book["_id"]), 0.9]]
+    payload = json.dumps({"version": "3:7", "ranked": ranked})
+    redis_client.mget.return_value = [b"3", b"7", payload.encode()]
+    with patch("asgi.select_recs", return_value=[book]) as select, patch(
+        "asgi.recommend_books"
+    ) as recommend:
+        response = client.get("/recs/api/user/abc/recommendations?refresh_count=2")
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "user_id": "abc",
+        "recommendations": [{"_id": str(book["_id"]), "title": "Dune"}],
+    }
+    select.assert_called_once_with(ranked, count=2)
+    recommend.assert_not_called()
+
+
+def test_recommendations_match_the_flask_response(client, redis_client):
+    book = {
+        "_id": ObjectId(),
+        "title": "Dune",
+        "updated_at": datetime(2025, 4, 1, 12, 30),
+    }
+    with patch("asgi.recommend_books", return_value=[book]), patch(
+        "api.recommendations.recommend_books", return_value=[book]
+    ):
+        response = client.get("/recs/api/user/abc/recommendations")
+        flask_response = flask_app.test_client().get(
+            "/recs/api/user/abc/recommendations"
+        )
+
+    assert response.json() == flask_response.get_json()
+    updated_at = response.json()["recommendations"][0]["updated_at"]
+    assert updated_at == "Tue, 01 Apr 2025 12:30:00 GMT"
+
+
+def test_ranking_misses_fall_back_to_recommend_books(client, redis_client):
+    with patch("asgi.recommend_books", return_value=[]) as recommend:
+        response = client.get("/recs/api/user/abc/recommendations?refresh_count=x")
+    assert response.json() == {"user_id": "abc", "recommendations": []}
+    recommend.assert_called_once_with(user_id="abc", count=0)
+
+
+def test_profile_is_loaded_from_mongo_then_from_redis(
+    client, redis_client, users_collection
+):
+    user = {
+        "_id": ObjectId(),
+        "first_name": "Ada",
+        "last_name": "Reader",
+        "username": "ada",
+        "email_address": "ada@example.com",
+    }
+    users_collection.find_one.return_value = user
+    headers = {"Authorization": "Bearer token"}
+    claims = {"email": "ada@example.com"}
+    with patch("asgi.auth.verify_google_token", return_value=claims):
+        response = client.get("/user/profile", headers=headers)
+        assert response.status_code == 200
+        assert response.json()["id"] == str(user["_id"])
+        assert response.json()["name"] == "Ada Reader"
+        users_collection.find_one.assert_awaited_once_with(
+            {"email_address": "ada@example.com"}
+        )
+        # The id was not known before the read: only the email is cached
+        redis_client.set.assert_awaited_once_with(
+            "user_email:ada@example.com", str(user["_id"]), ex=asgi.USER_CACHE_TTL
+        )
+        redis_client.eval.assert_not_awaited()
+
+        # Pointer, document miss, generation 4
+        redis_client.get.side_effect = [str(user["_id"]).encode(), None, b"4"]
+        response = client.get("/user/profile", headers=headers)
+        assert response.json()["username"] == "ada"
+        keys = redis_client.eval.await_args[0][2:5]
+        assert keys == (
+            f"user_generation:{user['_id']}",
+            f"user:{user['_id']}",
+            "user_email:ada@example.com",
+        )
+        assert redis_client.eval.await_args[0][5] == 4
+
+        redis_client.get.side_effect = [str(user["_id"]).encode(), bson.encode(user)]
+        response = client.get("/user/profile", headers=headers)
+        assert response.json()["username"] == "ada"
+        assert users_collection.find_one.await_count == 2
+
+
+def test_profile_requires_a_valid_token(client):
+    response = client.get("/user/profile")
+    assert response.status_code == 401
+    with patch("asgi.auth.verify_google_token", return_value=None):
+        response = client.get("/user/profile", headers={"Authorization": "Bearer x"})
+    assert response.json() == {"error": "Invalid token"}
+
+
+def test_public_profile_by_id(client, redis_client, users_collection):
+    assert client.get("/user/profile/notanid").status_code == 404
+    user_id = ObjectId()
+    users_collection.find_one.return_value = {"_id": user_id, "first_name": "Ada"}
+    response = client.get(f"/user/profile/{user_id}")
+    assert response.json()["id"] == str(user_id)
+    users_collection.find_one.assert_awaited_once_with({"_id": user_id})
+
+
+def test_other_routes_are_served_by_flask(client):
+    response = client.get("/user/check-email-exists")
+    assert response.status_code == 400
+    assert response.json() == {"error": "Email parameter is required"}
+
+
+def test_startup_builds_the_book_index_off_the_event_loop():
+    threads = []
+    with patch("asgi.prefetch_google_keys", AsyncMock()), patch(
+        "asgi.get_book_index", side_effect=lambda: threads.append(threading.get_ident())
+    ), patch("asgi.redis_client", AsyncMock()), patch("asgi.mongo_client", AsyncMock()):
+        with TestClient(asgi.app) as client:
+            loop_thread = client.portal.call(threading.get_ident)
+    assert len(threads) == 1 and threads[0] != loop_thread
@@ -0,0 +1,149 @@
+import time
+from unittest.mock import MagicMock, patch
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+import auth
+from auth import GoogleKeys, StaticKeys, TokenError, decode_token, verify_google_token
+
+
+def make_rsa_key(kid="test-0"):
+    """A local RSA key pair as (jwk, private key)."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk.update(kid=kid, alg="RS256")
+    return jwk, private_key
+
+
+KEY, PRIVATE_KEY = make_rsa_key()
+
+
+def sign(claims, kid=KEY["kid"], key=PRIVATE_KEY, alg="RS256"):
+    return jwt.encode(claims, key, algorithm=alg, headers={"kid": kid})
+
+
+def public_numbers(key):
+    return key.public_numbers()
+
+
+def google_claims(**overrides):
+    claims = {
+        "iss": "https://accounts.google.com",
+        "aud": "client-id",
+        "email": "reader@example.com",
+        "iat": int(time.time()),
+        "exp": int(time.time()) + 3600,
+    }
+    claims.update(overrides)
+    return claims
+
+
+@pytest.fixture(autouse=True)
+def static_keys():
+    previous = auth._key_source
+    auth.use_key_source(StaticKeys({"keys": [KEY]}))
+    with patch("auth.GOOGLE_CLIENT_ID", "client-id"):
+        yield
+    auth.use_key_source(previous)
+
+
+def test_valid_token_verifies_locally():
+    claims = google_claims()
+    assert decode_token(sign(claims)) == claims
+
+
+@pytest.mark.parametrize(
+    "claims, message",
+    [
+        (google_claims(exp=int(time.time()) - 3600), "expired"),
+        (google_claims(iat=int(time.time()) + 3600), "future"),
+        (google_claims(iss="https://evil.example.com"), "issuer"),
+    ],
+)
+def test_claims_are_checked(claims, message):
+    with pytest.raises(TokenError, match=message):
+        decode_token(sign(claims))
+
+
+def test_tampered_and_foreign_tokens_are_rejected():
+    header, payload, signature = sign(google_claims()).split(".")
+    _, forged, _ = sign(google_claims(email="admin@example.com")).split(".")
+    with pytest.raises(TokenError, match="signature"):
+        decode_token(f"{header}.{forged}.{signature}")
+
+    _, other_key = make_rsa_key(kid="test-1")
+    with pytest.raises(TokenError, match="signature"):
+        decode_token(sign(google_claims(), key=other_key))
+    with pytest.raises(TokenError, match="signing key"):
+        decode_token(sign(google_claims(), kid="unknown"))
+    with pytest.raises(TokenError, match="algorithm"):
+        decode_token(sign(google_claims(), key="a" * 32, alg="HS256"))
+    with pytest.raises(TokenError, match="Malformed"):
+        decode_token("fake_token")
+
+
+def test_audience_is_checked():
+    with pytest.raises(TokenError, match="audience"):
+        decode_token(sign(google_claims(aud="another-app")))
+
+
+def test_nothing_verifies_without_a_client_id():
+    token = sign(google_claims())
+    with patch("auth.GOOGLE_CLIENT_ID", None):
+        with pytest.raises(TokenError, match="GOOGLE_CLIENT_ID"):
+            decode_token(token)
+        assert verify_google_token(token) is None
+
+
+def test_verified_claims_are_cached_until_expiry():
+    token = sign(google_claims())
+    with patch("auth.decode_token", wraps=decode_token) as decode:
+        first = verify_google_token(token)
+        assert verify_google_token(token) is first
+        assert decode.call_count == 1
+
+        # An expired cache entry is verified again
+        with patch("auth.time.time", return_value=first["exp"] + 3600):
+            verify_google_token(token)
+        assert decode.call_count == 2
+
+    assert verify_google_token("fake_token") is None
+    assert verify_google_token(None) is None
+
+
+def test_google_keys_refresh_in_the_background_near_expiry():
+    response = MagicMock(headers={"Cache-Control": "public, max-age=1000"})
+    response.json.return_value = {"keys": [KEY]}
+    keys = GoogleKeys()
+    with patch("auth.requests.get", return_value=response) as fetch, patch(
+        "auth.threading.Thread"
+    ) as thread:
+        assert public_numbers(keys.get(KEY["kid"])) == public_numbers(
+            PRIVATE_KEY.public_key()
+        )
+        assert fetch.call_count == 1
+        assert keys.get(KEY["kid"]) is not None
+        thread.assert_not_called()
+
+        keys.expires = time.monotonic() + auth.KEYS_REFRESH_AHEAD / 2
+        assert keys.get(KEY["kid"]) is not None
+        thread.assert_called_once()
+        assert fetch.call_count == 1
+
+        # Unknown kids refetch, but not more than once a minute
+        assert keys.get("rotated") is None
+        assert fetch.call_count == 1
+        keys.fetched -= auth.KEYS_MIN_REFETCH
+        assert keys.get("rotated") is None
+        assert fetch.call_count == 2
+
+
+def test_keys_fetched_elsewhere_can_be_installed():
+    keys = GoogleKeys()
+    with patch("auth._key_source", keys):
+        auth.load_google_keys({"keys": [KEY]}, {"Cache-Control": "max-age=1000"})
+    assert list(keys.keys) == [KEY["kid"]]
+    assert public_numbers(keys.keys[KEY["kid"]]) == public_numbers(
+        PRIVATE_KEY.public_key()
+    )
+    assert keys.expires > time.monotonic() + 900
@@ -0,0 +1,95 @@
+import json
+import numpy as np
+from unittest.mock import patch
+from bson import ObjectId
+import batch_recs
+from scipy import sparse
+from batch_recs import score_block
+from catalog_factories import unit
+
+
+def genre_matrix(n, genres):
+    return sparse.csr_matrix(
+        (np.ones(n), (np.arange(n), np.arange(n) % genres)), shape=(n, genres)
+    )
+
+
+def test_score_block_matches_per_user_scoring():
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(50, 8)).astype(np.float32)
+    genres = genre_matrix(50, 3)
+    users = rng.normal(size=(4, 8)).astype(np.float32)
+    weights = rng.normal(size=(4, 3)).astype(np.float32)
+
+    rows, scores = score_block(embeddings, genres, users, weights, [[], [0, 1]], 5)
+
+    for i in range(4):
+        expected = embeddings @ users[i] + 0.1 * (genres.toarray() @ weights[i])
+        assert np.allclose(scores[i], np.sort(expected)[::-1][:5], atol=1e-5)
+        assert np.allclose(expected[rows[i]], scores[i], atol=1e-5)
+    assert 0 not in rows[1] and 1 not in rows[1]
+
+
+def test_score_block_chunks_match_a_single_pass():
+    rng = np.random.default_rng(1)
+    embeddings = rng.normal(size=(103, 8)).astype(np.float32)
+    genres = genre_matrix(103, 4)
+    users = rng.normal(size=(5, 8)).astype(np.float32)
+    weights = rng.normal(size=(5, 4)).astype(np.float32)
+    shelves = [[], [3, 50, 102], [], [0], list(range(0, 103, 2))]
+
+    whole = score_block(embeddings, genres, users, weights, shelves, 20, 1000)
+    chunked = score_block(embeddings, genres, users, weights, shelves, 20, 7)
+
+    assert np.array_equal(whole[0], chunked[0])
+    assert np.allclose(whole[1], chunked[1])
+    assert not set(chunked[0][1]) & {3, 50, 102}
+
+
+def test_score_block_drops_excluded_when_shelf_is_large():
+    embeddings = np.eye(3, dtype=np.float32)
+    genres = sparse.csr_matrix((3, 1))
+    rows, scores = score_block(
+        embeddings, genres, embeddings[:1], np.zeros((1, 1)), [[0, 1]], 3
+    )
+    assert rows[0][0] == 2
+    assert np.isinf(scores[0][1:]).all()
+
+
+@patch("batch_recs.redis_client")
+@patch("batch_recs.user_bookshelf_collection")
+@patch("batch_recs.users_collection")
+@patch("batch_recs.books_collection")
+def test_run_writes_versioned_lists_to_redis(
+    mock_books, mock_users, mock_shelf, mock_redis
+):
+    books = [
+        {"_id": ObjectId(), "title": f"Book {i}", "genre_tags": ["Fantasy"]}
+        for i in range(3)
+    ]
+    for i, book in enumerate(books):
+        book["embedding"] = unit(i).tolist()
+    reader, legacy = ObjectId(), ObjectId()
+    mock_books.find.return_value = books
+    mock_users.find.return_value = [
+        {"_id": reader, "embedding": unit(0).tolist(), "genre_weights": {}},
+        {"_id": legacy, "embedding": []},
+    ]
+    mock_shelf.find.return_value = [
+        {"user_id": str(reader), "book_id": books[0]["_id"]}
+    ]
+    mock_redis.get.return_value = b"7"
+    mock_redis.scan_iter.return_value = [f"recs_version:{reader}".encode()]
+    mock_redis.mget.return_value = [b"2"]
+
+    stats = batch_recs.run(top_k=2, block_size=1, workers=1)
+
+    assert stats["users"] == 1 and stats["skipped"] == 1
+    key, value = mock_redis.pipeline.return_value.set.call_args[0]
+    payload = json.loads(value)
+    assert key == f"recs:{reader}"
+    assert payload["version"] == "2:7"
+    assert [book_id for book_id, _ in payload["ranked"]] == [
+        str(books[1]["_id"]),
+        str(books[2]["_id"]),
+    ]
@@ -0,0 +1,208 @@
+import numpy as np
+from unittest.mock import patch
+from bson import ObjectId
+import book_index
+from ann_search import ExactSearch
+from book_index import BookIndex, normalize_embedding
+from diversity import title_signature
+from catalog_factories import make_book, unit
+
+
+def test_normalize_embedding_rejects_invalid():
+    assert normalize_embedding(None) is None
+    assert normalize_embedding([]) is None
+    assert normalize_embedding([0.1] * 10) is None
+    assert normalize_embedding(["a"] * 384) is None
+    assert normalize_embedding([0.0] * 384) is None
+
+
+def test_normalize_embedding_unit_length():
+    vector = normalize_embedding([2.0] * 384)
+    assert vector.dtype == np.float32
+    assert np.isclose(np.linalg.norm(vector), 1.0)
+
+
+def test_build_strips_embeddings_and_tracks_missing():
+    books = [make_book(axis=0), make_book(), make_book(axis=1)]
+    index = BookIndex()
+    index.build(books)
+
+    assert index.size == 3
+    assert index.embedded_count == 2
+    assert index.embeddings.shape == (3, 384)
+    assert "embedding" not in index.books[0]
+    assert index.missing_embeddings == {books[1]["_id"]}
+
+
+def test_similarities_match_cosine():
+    books = [make_book(axis=0), make_book(axis=1)]
+    index = BookIndex()
+    index.build(books)
+
+    sims = index.similarities(unit(0) * 5)
+    assert np.allclose(sims, [1.0, 0.0])
+
+
+def test_top_k_excludes_and_orders():
+    books = [make_book(axis=i) for i in range(5)]
+    index = BookIndex()
+    index.build(books)
+
+    scores = np.array([0.1, 0.9, 0.5, 0.9, 0.3])
+    rows = index.top_k(scores, 3, exclude_ids={books[1]["_id"]})
+    assert rows.tolist() == [3, 2, 4]
+
+
+def test_upsert_and_remove_keep_rows_consistent():
+    books = [make_book(f"Book {i}", axis=i) for i in range(3)]
+    index = BookIndex()
+    index.build(books)
+
+    new_book = make_book("New", axis=7)
+    index.upsert(new_book)
+    assert index.size == 4
+    assert index.get_book(new_book["_id"])["title"] == "New"
+
+    assert index.remove(books[0]["_id"]) is True
+    assert index.size == 3
+    assert index.get_book(books[0]["_id"]) is None
+    for row, book_id in enumerate(index.book_ids):
+        assert index.positions[book_id] == row
+
+    new_row = index.positions[new_book["_id"]]
+    assert np.isclose(index.embeddings[new_row][7], 1.0)
+
+
+def test_missing_embeddings_are_requested_again_until_they_arrive():
+    books = [make_book(), make_book(), make_book(axis=0)]
+    books[0]["summary"] = "A desert planet."
+    index = BookIndex()
+    index.build(books)
+
+    # The book without a summary has nothing to encode
+    requested = index.embeddings_to_request(now=100.0)
+    assert [book["_id"] for book in requested] == [books[0]["_id"]]
+    assert index.embeddings_to_request(now=101.0) == []
+    retry = 100.0 + book_index.EMBEDDING_REQUEST_RETRY
+    assert len(index.embeddings_to_request(now=retry)) == 1
+
+    index.upsert({**books[0], "embedding": unit(1)})
+    assert index.missing_embeddings == {books[1]["_id"]}
+    assert index.embedding_requests == {}
+
+
+def test_missing_embeddings_are_read_back_when_the_catalog_changes():
+    books = [make_book(), make_book()]
+    index = BookIndex()
+    index.build(books)
+    embedded = {**books[0], "embedding": unit(2)}
+
+    with patch("book_index.books_collection.find", return_value=[embedded]) as find:
+        assert book_index.refresh_missing_embeddings(index, 4) == 1
+        query = find.call_args[0][0]
+        assert set(query["_id"]["$in"]) == {books[0]["_id"], books[1]["_id"]}
+        # Same version, or Redis down: Mongo is not asked again
+        assert book_index.refresh_missing_embeddings(index, 4) == 0
+        assert book_index.refresh_missing_embeddings(index, None) == 0
+        assert find.call_count == 1
+
+    assert index.missing_embeddings == {books[1]["_id"]}
+    assert index.embedded_count == 1
+
+
+def test_upsert_replaces_existing_embedding():
+    book = make_book()
+    index = BookIndex()
+    index.build([book])
+    assert index.embedded_count == 0
+
+    index.upsert({**book, "embedding": unit(3)})
+    assert index.size == 1
+    assert index.embedded_count == 1
+    assert not index.missing_embeddings
+
+
+def test_refresh_indexed_book_noop_before_build():
+    with patch.object(book_index, "_book_index", None), patch(
+        "book_index.books_collection.find_one"
+    ) as mock_find:
+        book_index.refresh_indexed_book(ObjectId())
+        mock_find.assert_not_called()
+
+
+def test_candidates_use_search_engine_and_exclusions():
+    books = [make_book(axis=i) for i in range(4)]
+    index = BookIndex(search_engine=ExactSearch())
+    index.build(books)
+
+    rows, sims = index.candidates(unit(2), exclude_ids={books[0]["_id"]})
+    assert rows.tolist() == [1, 2, 3]
+    assert np.allclose(sims, [0.0, 1.0, 0.0])
+
+
+def test_genre_scores_match_per_book_sum():
+    books = [
+        make_book(axis=0, genre_tags=["Fantasy", "Romance"]),
+        make_book(axis=1, genre_tags=["Romance", "Romance"]),
+        make_book(axis=2, genre_tags=["Horror"]),
+    ]
+    index = BookIndex()
+    index.build(books)
+    weights = {"Romance": 2, "Fantasy": -1, "Unknown": 5}
+
+    expected = [sum(weights.get(g, 0) for g in book["genre_tags"]) for book in books]
+    assert np.allclose(index.genre_scores(weights), expected)
+    assert np.allclose(index.genre_scores({}), [0, 0, 0])
+
+
+def test_genre_match_scores_use_substring_semantics():
+    books = [
+        make_book(genre_tags=["Science Fiction", "Historical Fiction"]),
+        make_book(genre_tags=["Fantasy"]),
+        make_book(genre_tags=["Dark Fantasy", "Horror"]),
+    ]
+    index = BookIndex()
+    index.build(books)
+    weights = {"fiction": 1.5, "Fantasy": 2, "horror": 1}
+
+    expected = [
+        sum(
+            w
+            for g, w in weights.items()
+            if any(g.lower() in tag.lower() for tag in book["genre_tags"])
+        )
+        for book in books
+    ]
+    assert np.allclose(index.genre_match_scores(weights), expected)
+    assert expected == [1.5, 2, 3]
+
+
+def test_genre_matrix_tracks_upsert_and_remove():
+    books = [make_book(axis=i, genre_tags=[f"G{i}"]) for i in range(3)]
+    index = BookIndex()
+    index.build(books)
+    assert index.genre_matrix.shape == (3, 3)
+
+    index.upsert({**books[1], "genre_tags": ["Thriller fiction"]})
+    index.remove(books[0]["_id"])
+    assert index.genre_matrix.shape == (2, 4)
+    assert np.allclose(index.genre_match_scores({"thriller": 1}), [0, 1])
+    assert np.allclose(index.genre_scores({"G2": 3}), [3, 0])
+
+
+def test_diversity_keys_follow_rows():
+    books = [
+        make_book("Dune", ["Frank Herbert"], axis=0),
+        make_book("Emma", "Austen, Jane", axis=1),
+        make_book("Persuasion", ["Jane Austen"], axis=2),
+    ]
+    index = BookIndex()
+    index.build(books)
+    assert index.author_ids[1][0] == index.author_ids[2][0]
+
+    index.remove(books[0]["_id"])
+    index.upsert(make_book("Dune", ["Brian Herbert"], axis=3))
+    row = index.positions[books[2]["_id"]]
+    assert np.array_equal(index.title_signatures[row], title_signature("Persuasion"))
+    assert index.author_ids[row][0] == index.author_vocab["austen jane"]
+    assert index.author_ids.shape == (3, 4)
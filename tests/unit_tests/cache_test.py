@@ -0,0 +1,92 @@
+import json
+from unittest.mock import patch
+import cache
+
+
+@patch("cache.redis_client")
+def test_read_ranked_recs_hit_and_stale(mock_redis):
+    payload = json.dumps({"version": "2:5", "ranked": [["abc", 0.9]]})
+
+    mock_redis.mget.return_value = [b"2", b"5", payload]
+    assert cache.read_ranked_recs("u1") == ("2:5", [["abc", 0.9]])
+
+    # The user wrote to their shelf since the ranking was cached
+    mock_redis.mget.return_value = [b"3", b"5", payload]
+    assert cache.read_ranked_recs("u1") == ("3:5", None)
+
+
+@patch("cache.redis_client")
+def test_read_ranked_recs_defaults_missing_counters(mock_redis):
+    mock_redis.mget.return_value = [None, None, None]
+    assert cache.read_ranked_recs("u1") == ("0:0", None)
+
+
+@patch("cache.redis_client")
+def test_redis_down_disables_caching(mock_redis):
+    mock_redis.mget.side_effect = ConnectionError("down")
+    version, ranked = cache.read_ranked_recs("u1")
+    assert version is None and ranked is None
+
+    cache.write_ranked_recs("u1", version, [["abc", 0.9]])
+    mock_redis.set.assert_not_called()
+
+
+@patch("cache.redis_client")
+def test_write_ranked_recs_stores_version(mock_redis):
+    cache.write_ranked_recs("u1", "1:1", [["abc", 0.5]])
+    key, value = mock_redis.set.call_args[0]
+    assert key == "recs:u1"
+    assert json.loads(value) == {"version": "1:1", "ranked": [["abc", 0.5]]}
+
+
+@patch("cache.redis_client")
+def test_cached_users_round_trip_as_bson(mock_redis):
+    from bson import Binary, ObjectId
+
+    user = {
+        "_id": ObjectId(),
+        "email_address": "reader@example.com",
+        "embedding": Binary(b"\x00" * 16),
+    }
+    cache.cache_user(user, 2)
+    script, count, *keys, generation, payload, ttl, user_id = mock_redis.eval.call_args[
+        0
+    ]
+    assert script == cache.CACHE_USER_SCRIPT and count == 3
+    assert keys == [
+        f"user_generation:{user['_id']}",
+        f"user:{user['_id']}",
+        "user_email:reader@example.com",
+    ]
+    assert (generation, ttl, user_id) == (2, cache.USER_CACHE_TTL, str(user["_id"]))
+
+    # Binary embeddings come back as bytes, the same as a read from Mongo
+    mock_redis.get.return_value = payload
+    assert cache.read_cached_user(str(user["_id"])) == {
+        **user,
+        "embedding": b"\x00" * 16,
+    }
+    mock_redis.get.return_value = str(user["_id"]).encode()
+    assert cache.read_cached_user_id("reader@example.com") == str(user["_id"])
+
+    mock_redis.get.side_effect = ConnectionError("down")
+    assert cache.read_cached_user(str(user["_id"])) is None
+
+
+@patch("cache.redis_client")
+def test_writes_bump_the_generation_reads_check(mock_redis):
+    mock_redis.get.return_value = b"3"
+    assert cache.user_generation("u1") == 3
+    mock_redis.get.return_value = None
+    assert cache.user_generation("u1") == 0
+
+    cache.drop_cached_user("u1")
+    pipe = mock_redis.pipeline.return_value
+    pipe.incr.assert_called_once_with("user_generation:u1")
+    pipe.delete.assert_called_once_with("user:u1")
+
+    # Without a generation (Redis was down) nothing is cached
+    mock_redis.get.side_effect = ConnectionError("down")
+    assert cache.user_generation("u1") is None
+    cache.cache_user({"_id": "u1"}, None)
+    mock_redis.eval.assert_not_called()
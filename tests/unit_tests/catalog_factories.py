@@ -0,0 +1,27 @@
+import numpy as np
+from bson import ObjectId
+from book_index import EMBEDDING_DIM
+
+
+def unit(*axes, dim=EMBEDDING_DIM):
+    """A unit-length float32 vector spread evenly over the given axes."""
+    vector = np.zeros(dim, dtype=np.float32)
+    vector[list(axes)] = 1.0
+    return vector / np.linalg.norm(vector)
+
+
+def make_book(title="Book", author=None, genre_tags=None, axis=None, **fields):
+    """
+    A Books document with a fresh _id. author defaults to ["Author"] and
+    genre_tags to ["Fiction"]. axis gives the book the embedding unit(axis);
+    other fields, including an explicit embedding, are passed as keywords.
+    """
+    book = {
+        "_id": ObjectId(),
+        "title": title,
+        "author": ["Author"] if author is None else author,
+        "genre_tags": ["Fiction"] if genre_tags is None else genre_tags,
+        "embedding": None if axis is None else unit(axis).tolist(),
+    }
+    book.update(fields)
+    return book
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+from unittest.mock import patch
+import catalog_snapshot
+from catalog_snapshot import CatalogSnapshot, build_snapshot, current_version
+from embedding_store import load_snapshot
+from load_books import BookCollection
+from catalog_factories import make_book, unit
+
+
+def test_build_and_attach_round_trip(tmp_path):
+    books = [
+        make_book("Dune", ["Frank Herbert"], ["Sci-Fi"], embedding=2 * unit(0)),
+        make_book("Emma", "Jane Austen", ["Romance", "Classic"]),
+        make_book("Ünïcode", [], []),
+    ]
+    assert build_snapshot(str(tmp_path), books) == "v000001"
+
+    snapshot = CatalogSnapshot.attach(str(tmp_path))
+    assert len(snapshot) == 3
+    assert snapshot[0]["_id"] == books[0]["_id"]
+    assert snapshot[0]["author"] == ["Frank Herbert"]
+    assert snapshot[1]["author"] == ["Jane Austen"]
+    assert snapshot[1]["genre_tags"] == ["Romance", "Classic"]
+    assert snapshot[2]["title"] == "Ünïcode"
+    assert snapshot[-1]["author"] == []
+
+    # Embeddings are unit length and shared read-only
+    assert np.isclose(snapshot[0]["embedding"][0], 1.0)
+    assert snapshot[1]["embedding"] == []
+    assert not snapshot.embeddings.flags.writeable
+
+
+def test_new_version_flips_current_and_prunes_old(tmp_path):
+    root = str(tmp_path)
+    for i in range(3):
+        build_snapshot(root, [make_book(f"Book {i}", ["A"], ["G"])])
+
+    assert current_version(root) == "v000003"
+    versions = sorted(e for e in os.listdir(root) if e.startswith("v"))
+    assert versions == ["v000002", "v000003"]
+
+
+def test_embedding_snapshot_follows_current(tmp_path):
+    books = [make_book("Dune", ["Frank Herbert"], ["Sci-Fi"], axis=1)]
+    build_snapshot(str(tmp_path), books)
+
+    ids, matrix, has_embedding = load_snapshot(str(tmp_path))
+    assert ids == [books[0]["_id"]]
+    assert np.isclose(matrix[0, 1], 1.0)
+    assert has_embedding.tolist() == [True]
+
+
+def test_build_skipped_while_another_process_holds_lock(tmp_path):
+    if catalog_snapshot.fcntl is None:
+        return
+    root = str(tmp_path)
+    with open(os.path.join(root, catalog_snapshot.LOCK_FILE), "a+") as lock:
+        catalog_snapshot.fcntl.flock(lock, catalog_snapshot.fcntl.LOCK_EX)
+        # flock locks belong to the open file, so a second open conflicts
+        assert build_snapshot(root, [make_book("Dune", [], [])]) is None
+    assert current_version(root) is None
+
+
+def test_book_collection_hot_swaps_snapshot(tmp_path):
+    root = str(tmp_path)
+    first = make_book("First", ["A"], ["G"])
+    with patch(
+        "load_books.build_snapshot", side_effect=lambda r: build_snapshot(r, [first])
+    ):
+        bc = BookCollection(cache_file="test_books_cache.json", snapshot_root=root)
+    assert [book["title"] for book in bc.get_books()] == ["First"]
+
+    build_snapshot(root, [first, make_book("Second", ["B"], ["G"])])
+    bc.check_snapshot()
+    assert [book["title"] for book in bc.get_books()] == ["First", "Second"]
+    assert bc.snapshot.version == 2
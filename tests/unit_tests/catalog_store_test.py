@@ -0,0 +1,150 @@
+import os
+from datetime import datetime
+from unittest.mock import patch
+import numpy as np
+from bson import Binary, ObjectId
+from catalog_store import CatalogStore, synthetic_books, write_store
+from embedding_store import to_bson_embedding
+from load_books import BookCollection
+from catalog_factories import make_book
+
+
+def stored_book(title, embedding=None):
+    return make_book(
+        title,
+        embedding=embedding,
+        isbn=title.lower(),
+        publication_date=datetime(2001, 2, 3),
+    )
+
+
+def test_round_trip_keeps_types_and_embeddings(tmp_path):
+    path = str(tmp_path / "books.bin")
+    books = [
+        stored_book("A", to_bson_embedding([0.5] * 384)),
+        stored_book("B"),
+        stored_book("C", [0.25] * 384),
+    ]
+    assert write_store(path, iter(books)) == 3
+
+    store = CatalogStore.open(path)
+    assert len(store) == 3
+    first = store[0]
+    assert first["_id"] == books[0]["_id"]
+    assert first["publication_date"] == datetime(2001, 2, 3)
+    assert first["embedding"].dtype == np.float32
+    assert np.allclose(first["embedding"], 0.5)
+    assert "embedding" not in store[1]
+    assert np.allclose(store[2]["embedding"], 0.25)
+    # Two embedded books, stored back to back in the block
+    assert store.embeddings.shape == (2, 384)
+
+
+def test_lookup_by_id_decodes_one_record(tmp_path):
+    path = str(tmp_path / "books.bin")
+    books = list(synthetic_books(50, dim=8))
+    write_store(path, books)
+
+    store = CatalogStore.open(path)
+    assert store.get(str(books[17]["_id"]))["title"] == books[17]["title"]
+    assert store.get(ObjectId()) is None
+    assert store.get("bad id") is None
+
+
+def test_incomplete_store_is_ignored(tmp_path):
+    path = str(tmp_path / "books.bin")
+    write_store(path, [stored_book("A")])
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 1)
+    assert CatalogStore.open(path) is None
+
+
+def test_rewriting_a_store_leaves_open_readers_on_the_old_one(tmp_path):
+    path = str(tmp_path / "books.bin")
+    old, new = stored_book("Old"), stored_book("New")
+    write_store(path, [old])
+    reader = CatalogStore.open(path)
+
+    write_store(path, [new])
+    assert reader.get(old["_id"])["title"] == "Old"
+    assert reader.get(new["_id"]) is None
+    assert CatalogStore.open(path).get(new["_id"])["title"] == "New"
+    assert os.listdir(tmp_path) == ["books.bin"]
+
+
+def test_book_collection_refreshes_into_store_and_reloads(tmp_path, capsys):
+    path = str(tmp_path / "books.bin")
+    books = [
+        stored_book("A", Binary(np.ones(384, np.float32).tobytes())),
+        stored_book("B"),
+    ]
+    with patch("load_books.books_collection.find", return_value=iter(books)):
+        bc = BookCollection(cache_file=path)
+    assert len(bc.get_books()) == 2
+    assert "Book collection updated (2 books)" in capsys.readouterr().out
+
+    reloaded = BookCollection(cache_file=path)
+    assert reloaded.get_book_by_isbn("b")["_id"] == books[1]["_id"]
+    assert np.allclose(reloaded.get_book(books[0]["_id"])["embedding"], 1.0)
+
+
+def make_store_catalog(path, books):
+    write_store(path, books)
+    return BookCollection(cache_file=path)
+
+
+def test_store_records_are_decoded_on_demand(tmp_path):
+    path = str(tmp_path / "books.bin")
+    books = [stored_book("A", [1.0] * 384), stored_book("B"), stored_book("C")]
+    decoded = []
+    decode = CatalogStore.__getitem__
+
+    def counting_decode(store, row):
+        decoded.append(row)
+        return decode(store, row)
+
+    with patch.object(CatalogStore, "__getitem__", counting_decode):
+        bc = make_store_catalog(path, books)
+        assert decoded == []
+        assert bc.get_book_by_isbn("c")["title"] == "C"
+        assert decoded == [2]
+    assert not bc.by_id
+    assert bc.last_id == max(book["_id"] for book in books)
+
+
+@patch("load_books.sync_indexed_book")
+def test_changes_are_kept_over_the_store_until_saved(mock_sync, tmp_path):
+    path = str(tmp_path / "books.bin")
+    a, b = stored_book("A"), stored_book("B")
+    bc = make_store_catalog(path, [a, b])
+
+    bc.apply_upsert({**a, "title": "A2", "isbn": "a2"})
+    bc.apply_delete(b["_id"])
+    added = stored_book("New")
+    bc.apply_upsert(added)
+    assert bc.get_book(a["_id"])["title"] == "A2"
+    assert bc.get_book_by_isbn("a") is None
+    assert bc.get_book_by_isbn("a2")["title"] == "A2"
+    assert bc.get_book(b["_id"]) is None
+    assert bc.get_book_by_isbn("b") is None
+    assert sorted(book["title"] for book in bc.get_books()) == ["A2", "New"]
+
+    bc.save_cache()
+    assert not bc.by_id and not bc.removed and not bc.dirty
+    assert bc.get_book_by_isbn("a2")["title"] == "A2"
+    reloaded = BookCollection(cache_file=path)
+    assert sorted(book["title"] for book in reloaded.get_books()) == ["A2", "New"]
+
+
+def test_damaged_records_are_skipped(tmp_path):
+    path = str(tmp_path / "books.bin")
+    a, b = stored_book("A"), stored_book("B")
+    bc = make_store_catalog(path, [a, b])
+    entry = bc.store.index[0]
+    start = int(entry["offset"])
+    with open(path, "r+b") as f:
+        f.seek(start + 4)
+        f.write(b"\xff" * (int(entry["length"]) - 4))
+
+    assert bc.get_book(a["_id"]) is None
+    assert [book["title"] for book in bc.get_books()] == ["B"]
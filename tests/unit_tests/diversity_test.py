@@ -0,0 +1,67 @@
+import numpy as np
+from diversity import (
+    author_names,
+    duplicate_mask,
+    mmr_select,
+    normalize_title,
+    title_signature,
+    title_similarity,
+)
+
+
+def signatures(*titles):
+    return np.stack([title_signature(title) for title in titles])
+
+
+def test_normalize_title_strips_editions():
+    assert normalize_title("Dune (Deluxe Edition)") == "dune"
+    assert normalize_title("It Special Edition") == "it"
+
+
+def test_author_names_are_order_and_punctuation_insensitive():
+    assert author_names(["Smith, John", "J.R.R. Tolkien"]) == [
+        "john smith",
+        "jrr tolkien",
+    ]
+    assert author_names("john smith") == ["john smith"]
+    assert author_names(None) == []
+
+
+def test_title_similarity_estimates():
+    sigs = signatures("The Hobbit (Anniversary)", "The Shining", "")
+    same = title_similarity(sigs, title_signature("the hobbit"))
+    assert same[0] == 1.0
+    assert same[1] < 0.4
+    assert same[2] == 0.0
+    assert title_similarity(sigs, title_signature("")).tolist() == [0, 0, 0]
+
+
+def test_duplicate_mask_checks_authors_and_titles():
+    sigs = signatures("Dune", "Dune Messiah", "Emma")
+    authors = np.array([[0, -1], [1, -1], [2, 3]], dtype=np.int32)
+
+    mask = duplicate_mask(sigs, authors, title_signature("Dune"), np.array([3, -1]))
+    assert mask.tolist() == [True, False, True]
+
+
+def test_mmr_select_prefers_relevant_and_diverse():
+    embeddings = np.array([[1, 0], [1, 0], [0, 1], [0.6, 0.8]], dtype=np.float32)
+    sigs = signatures("Alpha", "Bravo", "Charlie", "Delta")
+    authors = np.array([[0], [1], [2], [3]], dtype=np.int32)
+    relevance = [1.0, 0.95, 0.5, 0.0]
+
+    picks = mmr_select(relevance, embeddings, sigs, authors, 2, diversity=0.6, jitter=0)
+    assert picks == [0, 2]
+
+    picks = mmr_select(relevance, embeddings, sigs, authors, 2, diversity=0, jitter=0)
+    assert picks == [0, 1]
+
+
+def test_mmr_select_drops_duplicates_of_seeds_and_picks():
+    embeddings = np.zeros((4, 2), dtype=np.float32)
+    sigs = signatures("Dune", "Emma", "Emma (Collector's Edition)", "Persuasion")
+    authors = np.array([[0], [1], [2], [1]], dtype=np.int32)
+    seeds = [(np.zeros(2), title_signature("Dune"), np.array([9]))]
+
+    picks = mmr_select([4, 3, 2, 1], embeddings, sigs, authors, 4, seeds, jitter=0)
+    assert picks == [1]
@@ -0,0 +1,123 @@
+import json
+import time
+from unittest.mock import MagicMock, patch
+import numpy as np
+import pytest
+from bson import ObjectId
+from pymongo import UpdateOne
+import embedding_service
+from embedding_service import (
+    BOOK_QUEUE,
+    QUERY_QUEUE,
+    EmbeddingUnavailable,
+    EmbeddingWorker,
+    encode_texts,
+    request_book_embeddings,
+)
+from embedding_store import decode_embedding, encode_embedding
+
+
+@patch("embedding_service.redis_client")
+def test_encode_texts_waits_for_the_workers_replies(mock_redis):
+    vectors = [np.array([1.0, 0.0], dtype=np.float32), np.array([0.0, 1.0])]
+    mock_redis.blpop.side_effect = [
+        (b"key", encode_embedding(vector)) for vector in vectors
+    ]
+    result = encode_texts(["dune", "emma"])
+
+    assert [list(vector) for vector in result] == [[1.0, 0.0], [0.0, 1.0]]
+    queue_name, *payloads = mock_redis.rpush.call_args[0]
+    jobs = [json.loads(payload) for payload in payloads]
+    assert queue_name == QUERY_QUEUE
+    assert [job["text"] for job in jobs] == ["dune", "emma"]
+    assert mock_redis.blpop.call_args_list[0][0][0] == [
+        embedding_service.RESULT_PREFIX + jobs[0]["id"]
+    ]
+
+
+@patch("embedding_service.redis_client")
+def test_encode_texts_gives_up_without_a_worker(mock_redis):
+    mock_redis.blpop.return_value = None
+    with pytest.raises(EmbeddingUnavailable, match="in time"):
+        encode_texts(["dune"], timeout=0.01)
+
+    mock_redis.rpush.side_effect = ConnectionError("down")
+    with pytest.raises(EmbeddingUnavailable, match="down"):
+        encode_texts(["dune"])
+
+
+@patch("embedding_service.redis_client")
+def test_book_embeddings_are_queued_without_waiting(mock_redis):
+    book_ids = [ObjectId(), ObjectId()]
+    request_book_embeddings([{"_id": book_id} for book_id in book_ids])
+    mock_redis.rpush.assert_called_once_with(BOOK_QUEUE, *map(str, book_ids))
+    mock_redis.blpop.assert_not_called()
+
+    mock_redis.rpush.side_effect = ConnectionError("down")
+    request_book_embeddings([{"_id": book_ids[0]}])  # logged, not raised
+
+
+@patch("embedding_service.BATCH_SIZE", 4)
+@patch("embedding_service.redis_client")
+def test_batches_fill_up_to_their_size_queries_first(mock_redis):
+    mock_redis.blpop.return_value = (BOOK_QUEUE.encode(), b"book-1")
+    queued = {QUERY_QUEUE: [b"query-1", b"query-2"], BOOK_QUEUE: [b"book-2", b"3"]}
+    mock_redis.lpop.side_effect = lambda name, count: queued[name][:count]
+
+    jobs = EmbeddingWorker(model=None).next_batch()
+
+    assert jobs == [
+        (BOOK_QUEUE, "book-1"),
+        (QUERY_QUEUE, "query-1"),
+        (QUERY_QUEUE, "query-2"),
+        (BOOK_QUEUE, "book-2"),
+    ]
+    assert mock_redis.blpop.call_count == 1
+
+
+@patch("embedding_service.redis_client")
+def test_batches_close_when_the_wait_runs_out(mock_redis):
+    mock_redis.blpop.side_effect = [(QUERY_QUEUE.encode(), b"query-1"), None]
+    mock_redis.lpop.return_value = None
+    jobs = EmbeddingWorker(model=None).next_batch()
+    assert jobs == [(QUERY_QUEUE, "query-1")]
+    assert mock_redis.blpop.call_args[1]["timeout"] <= embedding_service.MAX_WAIT
+
+
+@patch("embedding_service.bump_catalog_version")
+@patch("embedding_service.books_collection")
+@patch("embedding_service.redis_client")
+def test_a_batch_is_encoded_with_one_model_call(mock_redis, mock_books, mock_bump):
+    book_id, embedded_id, blank_id = ObjectId(), ObjectId(), ObjectId()
+    mock_books.find.return_value = [
+        {"_id": book_id, "summary": "A desert planet."},
+        {"_id": embedded_id, "summary": "Done.", "embedding": b"\x00" * 8},
+        # Nothing to encode: no vector is stored for it
+        {"_id": blank_id, "summary": "  "},
+    ]
+    model = MagicMock()
+    model.encode.return_value = np.array([[1.0, 0.0], [0.0, 1.0]])
+    live = {"id": "live", "text": "dune", "deadline": time.time() + 10}
+    expired = {"id": "late", "text": "emma", "deadline": time.time() - 1}
+    jobs = [
+        (QUERY_QUEUE, json.dumps(live)),
+        (QUERY_QUEUE, json.dumps(expired)),
+        (BOOK_QUEUE, str(book_id)),
+        (BOOK_QUEUE, str(embedded_id)),
+        (BOOK_QUEUE, str(blank_id)),
+    ]
+
+    assert EmbeddingWorker(model).process(jobs) == (1, 1)
+
+    model.encode.assert_called_once_with(
+        ["dune", "A desert planet."], convert_to_numpy=True
+    )
+    pipe = mock_redis.pipeline.return_value
+    key, payload = pipe.rpush.call_args[0]
+    assert key == embedding_service.RESULT_PREFIX + "live"
+    assert list(decode_embedding(payload)) == [1.0, 0.0]
+    (update,) = mock_books.bulk_write.call_args[0][0]
+    assert isinstance(update, UpdateOne)
+    assert update._filter == {"_id": book_id}
+    assert list(decode_embedding(update._doc["$set"]["embedding"])) == [0.0, 1.0]
+    mock_bump.assert_called_once()
@@ -0,0 +1,94 @@
+import json
+import numpy as np
+from bson import Binary, ObjectId
+from book_index import BookIndex
+from embedding_store import (
+    decode_embedding,
+    embedding_list,
+    encode_embedding,
+    load_snapshot,
+    save_snapshot,
+    to_bson_embedding,
+)
+from schemas import BookSchema
+from catalog_factories import make_book, unit
+
+
+def test_binary_round_trip_is_float32():
+    vector = np.linspace(-1, 1, 384)
+    raw = encode_embedding(vector)
+    assert len(raw) == 384 * 4
+
+    decoded = decode_embedding(Binary(raw))
+    assert decoded.dtype == np.float32
+    assert np.allclose(decoded, vector, atol=1e-6)
+
+
+def test_decode_accepts_legacy_formats():
+    values = [0.5] * 384
+    for raw in (values, json.dumps(values), json.dumps(values).encode()):
+        assert np.allclose(decode_embedding(raw), values)
+
+
+def test_decode_rejects_missing_and_malformed():
+    assert decode_embedding(None) is None
+    assert decode_embedding([]) is None
+    assert decode_embedding(b"") is None
+    assert decode_embedding(b"abc") is None  # not a multiple of 4 bytes
+    assert decode_embedding("not json") is None
+    assert embedding_list(None) == []
+
+
+def test_empty_embedding_is_stored_as_empty_list():
+    assert to_bson_embedding([]) == []
+    assert to_bson_embedding(None) == []
+    assert isinstance(to_bson_embedding([0.1] * 384), Binary)
+
+
+def test_book_schema_decodes_binary_embedding():
+    book = BookSchema(embedding=to_bson_embedding([0.25] * 384))
+    assert isinstance(book.embedding, list)
+    assert np.allclose(book.embedding, 0.25)
+
+
+def test_snapshot_round_trip_with_headroom(tmp_path):
+    book_ids = [ObjectId(), ObjectId()]
+    embeddings = np.array([unit(0), unit(1)], dtype=np.float32)
+    directory = tmp_path / "snapshot"
+
+    save_snapshot(str(directory), book_ids, embeddings, np.array([True, False]))
+    ids, matrix, has_embedding = load_snapshot(str(directory))
+
+    assert ids == book_ids
+    assert matrix.shape[0] > len(book_ids)
+    assert np.array_equal(matrix[:2], embeddings)
+    assert has_embedding.tolist() == [True, False]
+
+
+def test_load_snapshot_missing_directory(tmp_path):
+    assert load_snapshot(str(tmp_path / "missing")) is None
+
+
+def test_build_from_snapshot_merges_catalog_changes(tmp_path):
+    kept, removed = make_book("Kept", axis=0), make_book("Removed", axis=1)
+    source = BookIndex()
+    source.build([kept, removed])
+    save_snapshot(
+        str(tmp_path), source.book_ids, source.embeddings, source.has_embedding
+    )
+
+    added = make_book("Added", axis=2)
+    catalog = [
+        {k: v for k, v in book.items() if k != "embedding"} for book in (kept, added)
+    ]
+    index = BookIndex()
+    new_ids = index.build(catalog, load_snapshot(str(tmp_path)))
+    assert new_ids == [added["_id"]]
+    assert set(index.positions) == {kept["_id"]}
+
+    index.upsert(added)
+    assert index.size == 2
+    assert index.books[index.positions[kept["_id"]]]["title"] == "Kept"
+    sims = index.similarities(unit(2))
+    assert np.allclose(sims[index.positions[added["_id"]]], 1.0)
+    assert np.allclose(sims[index.positions[kept["_id"]]], 0.0)
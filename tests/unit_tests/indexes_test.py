@@ -0,0 +1,81 @@
+from unittest.mock import MagicMock, patch
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+import indexes
+from indexes import ensure_indexes, explain_query, winning_index
+
+
+def test_ensure_indexes_builds_only_missing_ones():
+    collection = MagicMock()
+    collection.index_information.return_value = {
+        "_id_": {"key": [("_id", 1)]},
+        "book_id": {"key": [("book_id", 1)]},
+    }
+    models = [
+        IndexModel([("book_id", ASCENDING)], name="book_id"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+    ]
+    with patch.dict(indexes.collections, {"Posts": collection}):
+        results = ensure_indexes("Posts", models)
+
+    assert results == [("book_id", "exists"), ("user_id", "created")]
+    collection.create_indexes.assert_called_once_with([models[1]])
+
+
+def test_ensure_indexes_reports_conflicts_and_failures():
+    collection = MagicMock()
+    collection.index_information.return_value = {
+        "username_unique": {"key": [("username", 1)]},
+    }
+    collection.create_indexes.side_effect = OperationFailure("E11000 duplicate key")
+    models = [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ]
+    with patch.dict(indexes.collections, {"Users": collection}):
+        results = ensure_indexes("Users", models)
+
+    assert results[0] == ("username_unique", "conflict")
+    assert results[1][0] == "email_unique"
+    assert results[1][1].startswith("Error:")
+
+
+def test_every_declared_index_is_named():
+    for models in indexes.INDEXES.values():
+        names = [model.document["name"] for model in models]
+        assert all(names) and len(names) == len(set(names))
+
+
+def test_winning_index_walks_the_plan():
+    fetch = {
+        "stage": "FETCH",
+        "inputStage": {"stage": "IXSCAN", "indexName": "user_status_finished"},
+    }
+    assert winning_index(fetch) == "user_status_finished"
+    assert winning_index({"queryPlan": fetch}) == "user_status_finished"
+    assert winning_index({"stage": "COLLSCAN"}) == "COLLSCAN"
+
+    branches = {
+        "stage": "SUBPLAN",
+        "inputStage": {
+            "stage": "OR",
+            "inputStages": [
+                {"stage": "IXSCAN", "indexName": "username_unique"},
+                {"stage": "IXSCAN", "indexName": "email_address_unique"},
+            ],
+        },
+    }
+    assert winning_index(branches) == "username_unique+email_address_unique"
+
+
+def test_explain_query_applies_the_sort():
+    collection = MagicMock()
+    cursor = collection.find.return_value.sort.return_value
+    cursor.explain.return_value = {
+        "queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}
+    }
+    with patch.dict(indexes.collections, {"User_Bookshelf": collection}):
+        used = explain_query("User_Bookshelf", {"user_id": 1}, [("date_finished", -1)])
+
+    assert used == "COLLSCAN"
+    collection.find.return_value.sort.assert_called_once_with([("date_finished", -1)])
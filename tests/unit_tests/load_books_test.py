@@ -3,7 +3,6 @@ from unittest.mock import patch, mock_open
 from load_books import BookCollection
 from bson import ObjectId
 from datetime import datetime
-import threading
 
 
 @patch(
@@ -47,20 +46,85 @@ def test_get_books_returns_copy():
     assert books is not bc.books  # Ensure it's a copy
 
 
-@patch("load_books.BookCollection.refresh_books")
-@patch("time.sleep", side_effect=InterruptedError)  # Break the loop immediately
-def test_refresh_loop_triggers_refresh(mock_sleep, mock_refresh):
-    bc = BookCollection(cache_file="test_books_cache.json")
+def make_catalog(books):
+    with patch("load_books.books_collection.find", return_value=books), patch(
+        "os.path.exists", return_value=False
+    ):
+        return BookCollection(cache_file="test_books_cache.json")
+
+
+def test_lookups_by_id_and_isbn():
+    book = {"_id": ObjectId(), "title": "Dune", "isbn": "123", "isbn13": "9780123"}
+    bc = make_catalog([book])
+
+    assert bc.get_book(str(book["_id"]))["title"] == "Dune"
+    assert bc.get_book_by_isbn("123")["_id"] == book["_id"]
+    assert bc.get_book_by_isbn13("9780123")["_id"] == book["_id"]
+    assert bc.get_book("not-an-id") is None
+    assert bc.get_book_by_isbn("999") is None
+
+
+@patch("load_books.sync_indexed_book")
+def test_change_events_update_lookups_and_index(mock_sync):
+    book = {"_id": ObjectId(), "title": "Old", "isbn": "1"}
+    bc = make_catalog([book])
+
+    bc.apply_change(
+        {
+            "_id": {"_data": "token"},
+            "operationType": "update",
+            "documentKey": {"_id": book["_id"]},
+            "fullDocument": {**book, "title": "New", "isbn": "2"},
+        }
+    )
+    assert bc.get_book(book["_id"])["title"] == "New"
+    assert bc.get_book_by_isbn("1") is None
+    assert bc.get_book_by_isbn("2")["title"] == "New"
+    assert bc.resume_token == {"_data": "token"}
+
+    bc.apply_change({"operationType": "delete", "documentKey": {"_id": book["_id"]}})
+    assert bc.get_book(book["_id"]) is None
+    assert bc.get_book_by_isbn("2") is None
+    assert mock_sync.call_args_list[-1][1] == {"deleted": True}
+    assert bc.dirty
+
+
+@patch("load_books.sync_indexed_book")
+def test_poll_changes_uses_id_and_updated_at_watermarks(mock_sync):
+    stamp = datetime(2024, 1, 1)
+    book = {"_id": ObjectId(), "title": "A", "updated_at": stamp}
+    bc = make_catalog([book])
+
+    newer = {"_id": ObjectId(), "title": "B"}
+    with patch("load_books.books_collection.find", return_value=[newer]) as find:
+        assert bc.poll_changes() == 1
+
+    find.assert_called_once_with(
+        {"$or": [{"_id": {"$gt": book["_id"]}}, {"updated_at": {"$gt": stamp}}]}
+    )
+    assert bc.get_book(newer["_id"])["title"] == "B"
+    assert bc.last_id == newer["_id"]
+
+
+def test_change_loop_falls_back_to_polling():
+    from pymongo.errors import OperationFailure
+
+    bc = make_catalog([])
+    unsupported = OperationFailure("not a replica set", code=40573)
+    with patch.object(bc, "watch_changes", side_effect=unsupported), patch.object(
+        bc, "_poll_loop"
+    ) as poll_loop:
+        bc._change_loop()
+    poll_loop.assert_called_once()
+
 
-    # Run loop in a separate thread, catch the early break
-    def run_loop():
-        try:
-            bc._refresh_loop()
-        except InterruptedError:
-            pass
+@patch("load_books.sync_indexed_book")
+def test_full_refresh_drops_deleted_books_from_the_index(mock_sync):
+    kept, deleted = {"_id": ObjectId(), "title": "A"}, {"_id": ObjectId(), "title": "B"}
+    bc = make_catalog([kept, deleted])
 
-    thread = threading.Thread(target=run_loop)
-    thread.start()
-    thread.join(timeout=2)
+    with patch("load_books.books_collection.find", return_value=[kept]):
+        bc.refresh_books()
 
-    mock_sleep.assert_called_once_with(bc.refresh_interval)
+    assert bc.book_ids() == {kept["_id"]}
+    mock_sync.assert_called_once_with({"_id": deleted["_id"]}, deleted=True)
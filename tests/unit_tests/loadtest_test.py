@@ -0,0 +1,15 @@
+import math
+from loadtest import endpoints, summarize
+
+
+def test_summarize_reports_throughput_and_percentiles():
+    stats = summarize([i / 1000 for i in range(1, 101)], errors=3, elapsed=2.0)
+    assert stats["requests"] == 100 and stats["errors"] == 3
+    assert stats["rps"] == 50.0
+    assert (stats["p50"], stats["p95"], stats["p99"]) == (51.0, 96.0, 100.0)
+    assert math.isnan(summarize([], errors=1, elapsed=1.0)["p50"])
+
+
+def test_only_the_own_profile_needs_a_token():
+    needs_token = [name for name, _, token in endpoints("abc") if token]
+    assert needs_token == ["own profile"]
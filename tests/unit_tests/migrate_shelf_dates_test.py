@@ -0,0 +1,50 @@
+from datetime import datetime
+from unittest.mock import MagicMock, patch
+from bson import ObjectId
+from pymongo import UpdateOne
+import migrate_shelf_dates
+from migrate_shelf_dates import migrate_dates, parse_finished
+
+
+def test_strings_are_parsed_like_parse_date():
+    parsed = parse_finished("2025-04-22T12:00:00")
+    assert parsed.replace(tzinfo=None) == datetime(2025, 4, 22, 12)
+    assert parsed.utcoffset() is not None
+    assert parse_finished("2025-04-22T12:00:00+00:00").utcoffset().seconds == 0
+    assert parse_finished("last week") is None
+
+
+def test_string_dates_are_converted_in_batches():
+    first, second = ObjectId(), ObjectId()
+    shelf = MagicMock()
+    shelf.find.return_value.sort.return_value.limit.side_effect = [
+        [
+            {"_id": first, "date_finished": "2025-04-22T12:00:00-05:00"},
+            {"_id": second, "date_finished": "not a date"},
+        ],
+        [],
+    ]
+    shelf.bulk_write.return_value.modified_count = 1
+    with patch.dict(migrate_shelf_dates.collections, {"User_Bookshelf": shelf}):
+        stats = migrate_dates()
+
+    assert stats == {"converted": 1, "invalid": 1}
+    shelf.bulk_write.assert_called_once_with(
+        [
+            UpdateOne(
+                {"_id": first, "date_finished": "2025-04-22T12:00:00-05:00"},
+                {
+                    "$set": {
+                        "date_finished": parse_finished("2025-04-22T12:00:00-05:00")
+                    }
+                },
+            )
+        ],
+        ordered=False,
+    )
+    # The second query starts after the last entry read, so invalid strings
+    # are not read again
+    assert shelf.find.call_args_list[1][0][0] == {
+        "date_finished": {"$type": "string"},
+        "_id": {"$gt": second},
+    }
@@ -0,0 +1,118 @@
+from unittest.mock import MagicMock, call, patch
+from bson import ObjectId
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import BulkWriteError
+import migrate_user_ids
+from migrate_user_ids import migrate_references, migrate_users
+
+
+def fake_collection(*batches):
+    """A collection whose find(...).sort(...).limit(...) yields `batches`."""
+    collection = MagicMock()
+    collection.find.return_value.sort.return_value.limit.side_effect = list(batches)
+    return collection
+
+
+def fake_migrations(state=None):
+    migrations = MagicMock()
+    migrations.find_one.return_value = state
+    return migrations
+
+
+def saved_states(migrations):
+    return [args[1]["$set"] for args, _ in migrations.update_one.call_args_list]
+
+
+def test_references_are_converted_in_checkpointed_batches():
+    checkpoint, first, second = ObjectId(), ObjectId(), ObjectId()
+    user_id = str(ObjectId())
+    shelf = fake_collection(
+        [{"_id": first, "user_id": user_id}, {"_id": second, "user_id": "userid"}],
+        [],
+    )
+    shelf.bulk_write.return_value.modified_count = 1
+    migrations = fake_migrations({"checkpoints": {"User_Bookshelf": checkpoint}})
+    with patch.dict(
+        migrate_user_ids.collections,
+        {"User_Bookshelf": shelf, "Migrations": migrations},
+    ):
+        stats = migrate_references("User_Bookshelf")
+
+    assert stats == {"converted": 1, "duplicates": 0, "invalid": 1}
+    assert shelf.find.call_args_list[0][0][0] == {
+        "user_id": {"$type": "string"},
+        "_id": {"$gt": checkpoint},
+    }
+    shelf.bulk_write.assert_called_once_with(
+        [
+            UpdateOne(
+                {"_id": first, "user_id": user_id},
+                {"$set": {"user_id": ObjectId(user_id)}},
+            )
+        ],
+        ordered=False,
+    )
+    assert saved_states(migrations) == [{"checkpoints.User_Bookshelf": second}]
+
+
+def test_entries_already_stored_under_the_objectid_are_dropped():
+    entry_id, user_id = ObjectId(), str(ObjectId())
+    shelf = fake_collection([{"_id": entry_id, "user_id": user_id}], [])
+    duplicate = BulkWriteError(
+        {"writeErrors": [{"index": 0, "code": 11000}], "nModified": 0}
+    )
+    shelf.bulk_write.side_effect = [duplicate, MagicMock()]
+    with patch.dict(
+        migrate_user_ids.collections,
+        {"User_Bookshelf": shelf, "Migrations": fake_migrations()},
+    ):
+        stats = migrate_references("User_Bookshelf")
+
+    assert stats == {"converted": 0, "duplicates": 1, "invalid": 0}
+    assert shelf.bulk_write.call_args_list[1] == call(
+        [DeleteOne({"_id": entry_id, "user_id": user_id})], ordered=False
+    )
+
+
+def test_string_keyed_users_are_journaled_then_reinserted():
+    user = {"_id": str(ObjectId()), "username": "reader"}
+    users = fake_collection([user, {"_id": "legacy", "username": "old"}], [])
+    users.bulk_write.return_value.upserted_count = 1
+    migrations = fake_migrations()
+    with patch.dict(
+        migrate_user_ids.collections, {"Users": users, "Migrations": migrations}
+    ):
+        stats = migrate_users()
+
+    assert stats == {"converted": 1, "duplicates": 0, "invalid": 1}
+    assert saved_states(migrations) == [
+        {"pending_users": [user]},
+        {"pending_users": []},
+    ]
+    assert users.bulk_write.call_args_list == [
+        call([DeleteOne({"_id": user["_id"]})]),
+        call(
+            [
+                UpdateOne(
+                    {"_id": ObjectId(user["_id"])},
+                    {"$setOnInsert": {"username": "reader"}},
+                    upsert=True,
+                )
+            ]
+        ),
+    ]
+
+
+def test_an_interrupted_user_batch_is_replayed():
+    user = {"_id": str(ObjectId()), "username": "reader"}
+    users = fake_collection([])
+    users.bulk_write.return_value.upserted_count = 0  # inserted before the crash
+    migrations = fake_migrations({"pending_users": [user]})
+    with patch.dict(
+        migrate_user_ids.collections, {"Users": users, "Migrations": migrations}
+    ):
+        stats = migrate_users()
+
+    assert stats == {"converted": 0, "duplicates": 1, "invalid": 0}
+    assert users.bulk_write.call_count == 2
+    assert saved_states(migrations) == [{"pending_users": []}]
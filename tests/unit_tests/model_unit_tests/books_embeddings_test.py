@@ -12,21 +12,20 @@ def mock_books(monkeypatch):
     # Fake existing document
     fake_doc = {"_id": ObjectId(fake_id), "embedding": []}
 
-    # Patch find_one and update_one
+    # Patch find_one_and_update; like the guarded filter, it only matches
+    # when the embedding would change
     mock_collection = MagicMock()
-    mock_collection.find_one.side_effect = lambda query: (
-        fake_doc if query["_id"] == ObjectId(fake_id) else None
-    )
 
-    def mock_update_one(filter_, update_):
-        # Simulate a change
+    def mock_find_one_and_update(filter_, update_, **kwargs):
+        if filter_["_id"] != ObjectId(fake_id):
+            return None
         new_embedding = update_["$set"]["embedding"]
-        if new_embedding != fake_doc["embedding"]:
-            fake_doc["embedding"] = new_embedding
-            return MagicMock(modified_count=1)
-        return MagicMock(modified_count=0)
+        if new_embedding == fake_doc["embedding"]:
+            return None
+        fake_doc["embedding"] = new_embedding
+        return fake_doc
 
-    mock_collection.update_one.side_effect = mock_update_one
+    mock_collection.find_one_and_update.side_effect = mock_find_one_and_update
     monkeypatch.setattr(book_model, "books_collection", mock_collection)
 
     return fake_id
@@ -73,8 +72,7 @@ def test_book_not_found_valid_id(monkeypatch):
     fake_id = str(ObjectId())
 
     mock_collection = MagicMock()
-    mock_collection.find_one.return_value = None  # Book not found
-    mock_collection.update_one.return_value = MagicMock(modified_count=0)
+    mock_collection.find_one_and_update.return_value = None  # Book not found
 
     monkeypatch.setattr(book_model, "books_collection", mock_collection)
 
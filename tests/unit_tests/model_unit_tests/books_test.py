@@ -143,7 +143,9 @@ def test_read_book_field_schema_error(monkeypatch):
         "genre": "Fiction",
     }
     monkeypatch.setattr(
-        book_model, "books_collection", MagicMock(find_one=lambda q: incomplete_doc)
+        book_model,
+        "books_collection",
+        MagicMock(find_one=lambda q, *projection: incomplete_doc),
     )
     result = book_model.read_book_field(str(ObjectId()), "title")
     assert result == "Field not found"
@@ -170,7 +172,7 @@ def test_read_book_by_bookId_schema_error(monkeypatch):
         book_model,
         "books_collection",
         MagicMock(
-            find_one=lambda q: {
+            find_one=lambda q, *projection: {
                 "_id": ObjectId(),
                 "title": 123,
                 "publication_date": "not-a-date",
@@ -181,6 +183,72 @@ def test_read_book_by_bookId_schema_error(monkeypatch):
     assert result.startswith("Schema Validation Error:")
 
 
+def test_read_book_by_bookId_card_projection(mock_books_collection):
+    book = book_model.read_book_by_bookId(mock_books_collection, "card")
+    assert set(book) == {"_id", "title", "author", "cover_image", "page_count"} | {
+        "genre_tags"
+    }
+    projection = book_model.books_collection.find_one.call_args[0][1]
+    assert projection == book_model.BOOK_PROJECTIONS["card"]
+
+
+def test_read_book_by_bookId_detail_leaves_out_embedding(mock_books_collection):
+    book = book_model.read_book_by_bookId(mock_books_collection)
+    assert "embedding" not in book
+    assert book["summary"] == "Mock summary"
+
+
+def test_project_book_named_and_dict_projections():
+    book = {"_id": 1, "title": "T", "summary": "S", "embedding": [0.1]}
+    assert book_model.project_book(book, "detail") == {
+        "_id": 1,
+        "title": "T",
+        "summary": "S",
+    }
+    assert book_model.project_book(book, {"title": 1, "_id": 0}) == {"title": "T"}
+    assert book_model.project_book(book, None) == book
+
+
+def test_read_books_by_ids_one_query_in_order(monkeypatch):
+    first, second = ObjectId(), ObjectId()
+    mock_col = MagicMock()
+    mock_col.find.return_value = [
+        {"_id": second, "title": "Second"},
+        {"_id": first, "title": "First"},
+    ]
+    monkeypatch.setattr(book_model, "books_collection", mock_col)
+
+    books = book_model.read_books_by_ids(
+        [str(first), "bad id", second, ObjectId(), first], {"embedding": 0}
+    )
+
+    assert [b and b["title"] for b in books] == ["First", None, "Second", None, "First"]
+    assert books[0] is not books[4]
+    mock_col.find.assert_called_once()
+    query, projection = mock_col.find.call_args[0]
+    assert len(query["_id"]["$in"]) == 3
+    assert projection == {"embedding": 0}
+
+
+def test_read_books_by_ids_prefers_catalog(monkeypatch):
+    cached = {"_id": ObjectId(), "title": "Cached", "embedding": b"\x00" * 4}
+    catalog = MagicMock(documents=True)
+    catalog.get_book.side_effect = lambda i: (
+        dict(cached) if i == cached["_id"] else None
+    )
+    mock_col = MagicMock()
+    monkeypatch.setattr(book_model, "get_catalog", lambda: catalog)
+    monkeypatch.setattr(book_model, "books_collection", mock_col)
+
+    assert book_model.read_books_by_ids([cached["_id"]], {"embedding": 0}) == [
+        {"_id": cached["_id"], "title": "Cached"}
+    ]
+    assert book_model.read_books_by_ids([cached["_id"]], {"title": 1}) == [
+        {"_id": cached["_id"], "title": "Cached"}
+    ]
+    mock_col.find.assert_not_called()
+
+
 def test_read_book_by_identifier():
     assert book_model.read_book_by_identifier("mockisbn", "isbn") != "Book not found."
 
@@ -201,7 +269,7 @@ def test_read_book_by_identifier_schema_error(monkeypatch):
         book_model,
         "books_collection",
         MagicMock(
-            find_one=lambda q: {
+            find_one=lambda q, *projection: {
                 "_id": ObjectId(),
                 "title": 123,
                 "publication_date": "not-a-date",
@@ -342,17 +410,26 @@ def test_update_book_details_validation_error(monkeypatch):
 def test_add_book_author_success(monkeypatch):
     fake_id = str(ObjectId())
     mock_col = MagicMock()
-    mock_col.update_one.return_value.modified_count = 1
+    mock_col.find_one_and_update.return_value = {"_id": ObjectId(fake_id)}
     monkeypatch.setattr(book_model, "books_collection", mock_col)
 
     result = book_model.add_book_author(fake_id, "New Author")
     assert result == "Author added successfully."
 
+    # One write: only a book without the author matches, and updated_at is
+    # stamped alongside the change
+    (query, update), _ = mock_col.find_one_and_update.call_args
+    assert query == {"_id": ObjectId(fake_id), "author": {"$ne": "New Author"}}
+    assert update["$addToSet"] == {"author": "New Author"}
+    assert isinstance(update["$set"]["updated_at"], datetime)
+    mock_col.update_one.assert_not_called()
+    mock_col.find_one.assert_not_called()
+
 
 def test_add_book_author_already_exists(monkeypatch):
     fake_id = str(ObjectId())
     mock_col = MagicMock()
-    mock_col.update_one.return_value.modified_count = 0
+    mock_col.find_one_and_update.return_value = None
     monkeypatch.setattr(book_model, "books_collection", mock_col)
 
     result = book_model.add_book_author(fake_id, "Existing Author")
@@ -373,7 +450,7 @@ def test_add_book_author_empty_name():
 def test_add_book_tag_success(monkeypatch):
     fake_id = str(ObjectId())
     mock_col = MagicMock()
-    mock_col.update_one.return_value.modified_count = 1
+    mock_col.find_one_and_update.return_value = {"_id": ObjectId(fake_id)}
     monkeypatch.setattr(book_model, "books_collection", mock_col)
 
     result = book_model.add_book_tag(fake_id, "New Tag")
@@ -383,7 +460,7 @@ def test_add_book_tag_success(monkeypatch):
 def test_add_book_tag_already_exists(monkeypatch):
     fake_id = str(ObjectId())
     mock_col = MagicMock()
-    mock_col.update_one.return_value.modified_count = 0
+    mock_col.find_one_and_update.return_value = None
     monkeypatch.setattr(book_model, "books_collection", mock_col)
 
     result = book_model.add_book_tag(fake_id, "test")
@@ -404,7 +481,7 @@ def test_add_book_tag_empty_name():
 def test_remove_book_author_success(monkeypatch):
     fake_id = str(ObjectId())
     mock_col = MagicMock()
-    mock_col.update_one.return_value.modified_count = 1
+    mock_col.find_one_and_update.return_value = {"_id": ObjectId(fake_id)}
     monkeypatch.setattr(book_model, "books_collection", mock_col)
 
     res = book_model.remove_book_author(fake_id, "Author")
@@ -414,7 +491,7 @@ def test_remove_book_author_success(monkeypatch):
 def test_remove_book_author_not_found(monkeypatch):
     fake_id = str(ObjectId())
     mock_col = MagicMock()
-    mock_col.update_one.return_value.modified_count = 0
+    mock_col.find_one_and_update.return_value = None
     monkeypatch.setattr(book_model, "books_collection", mock_col)
 
     res = book_model.remove_book_author(fake_id, "Unknown Author")
@@ -435,7 +512,7 @@ def test_remove_book_author_empty_name():
 def test_remove_book_tag_success(monkeypatch):
     fake_id = str(ObjectId())
     mock_col = MagicMock()
-    mock_col.update_one.return_value.modified_count = 1
+    mock_col.find_one_and_update.return_value = {"_id": ObjectId(fake_id)}
     monkeypatch.setattr(book_model, "books_collection", mock_col)
 
     res = book_model.remove_book_tag(fake_id, "tag")
@@ -445,7 +522,7 @@ def test_remove_book_tag_success(monkeypatch):
 def test_remove_book_tag_not_found(monkeypatch):
     fake_id = str(ObjectId())
     mock_col = MagicMock()
-    mock_col.update_one.return_value.modified_count = 0
+    mock_col.find_one_and_update.return_value = None
     monkeypatch.setattr(book_model, "books_collection", mock_col)
 
     res = book_model.remove_book_tag(fake_id, "missing")
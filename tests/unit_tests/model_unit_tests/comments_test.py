@@ -190,7 +190,7 @@ def test_read_comment_not_found(monkeypatch):
     fake_id = str(ObjectId())
     monkeypatch.setattr(comment_model.comments_collection, "find_one", lambda q: None)
     result = read_comment(fake_id)
-    assert result == "Error: Invalid comment_id."
+    assert result == "Comment not found."
 
 
 def test_delete_comment_invalid_id():
@@ -204,7 +204,7 @@ def test_delete_comment_not_found(monkeypatch):
     mock_col.delete_one.return_value.deleted_count = 0
     monkeypatch.setattr(comment_model, "comments_collection", mock_col)
     result = delete_comment(fake_id)
-    assert result == "Error: Invalid comment_id."
+    assert result == "Comment not found."
 
 
 @patch("models.comments.comments_collection.find_one", side_effect=Exception("Crash"))
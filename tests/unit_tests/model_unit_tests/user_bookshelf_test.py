@@ -1,8 +1,8 @@
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 import pytest
 from bson.errors import InvalidId
 from bson import ObjectId
-from datetime import date
+from datetime import date, datetime
 from models.user_bookshelf import (
     create_user_bookshelf,
     update_user_bookshelf_status,
@@ -11,6 +11,7 @@ from models.user_bookshelf import (
     get_read_books,
     get_unread_books,
     get_currently_reading_books,
+    get_bookshelf_with_books,
     rate_book,
     update_page_number,
     get_page_number,
@@ -238,10 +239,23 @@ def test_get_read_books_exception(mock_valid, mock_collection):
 def test_rate_book_success(mock_valid, mock_collection):
     mock_valid.return_value = True
     mock_collection.count_documents.return_value = 1
-    mock_collection.update_one.return_value.matched_count = 1
-
-    result = rate_book(VALID_USER_ID, VALID_BOOK_ID, "pos")
+    mock_collection.find_one_and_update.return_value = {
+        "status": "read",
+        "rating": "mid",
+    }
+    changes = []
+
+    result = rate_book(
+        VALID_USER_ID,
+        VALID_BOOK_ID,
+        "pos",
+        on_change=lambda old, new: changes.append((old, new)),
+    )
     assert result == "UserBookshelf rating updated successfully."
+    # The old entry is the one the write replaced
+    assert changes == [
+        ({"status": "read", "rating": "mid"}, {"status": "read", "rating": "pos"})
+    ]
 
 
 @patch("models.user_bookshelf.user_bookshelf_collection")
@@ -266,10 +280,12 @@ def test_rate_book_invalid_book(mock_valid, mock_collection):
 @patch("models.user_bookshelf.is_valid_object_id")
 def test_rate_book_not_read(mock_valid, mock_collection):
     mock_valid.return_value = True
-    mock_collection.count_documents.return_value = 0
+    mock_collection.find_one_and_update.return_value = None
 
     result = rate_book(VALID_USER_ID, VALID_BOOK_ID, "pos")
     assert result == "Error: Book has not been read yet."
+    query = mock_collection.find_one_and_update.call_args[0][0]
+    assert query["status"] == "read"
 
 
 @patch("models.user_bookshelf.user_bookshelf_collection")
@@ -287,7 +303,7 @@ def test_rate_book_invalid_rating(mock_valid, mock_collection):
 def test_rate_book_update_exception(mock_valid, mock_collection):
     mock_valid.return_value = True
     mock_collection.count_documents.return_value = 1
-    mock_collection.update_one.side_effect = Exception(
+    mock_collection.find_one_and_update.side_effect = Exception(
         "Simulated rating update failure"
     )
 
@@ -508,17 +524,23 @@ def test_create_user_bookshelf_generic_exception(mock_valid, mock_collection):
 @patch("models.user_bookshelf.is_valid_object_id")
 def test_delete_user_bookshelf_success(mock_valid, mock_collection):
     mock_valid.return_value = True
-    mock_collection.delete_one.return_value.deleted_count = 1
+    mock_collection.find_one_and_delete.return_value = {"status": "to-read"}
+    changes = []
 
-    result = delete_user_bookshelf(VALID_USER_ID, VALID_BOOK_ID)
+    result = delete_user_bookshelf(
+        VALID_USER_ID,
+        VALID_BOOK_ID,
+        on_change=lambda old, new: changes.append((old, new)),
+    )
     assert result == "UserBookshelf entry deleted successfully."
+    assert changes == [({"status": "to-read"}, None)]
 
 
 @patch("models.user_bookshelf.user_bookshelf_collection")
 @patch("models.user_bookshelf.is_valid_object_id")
 def test_delete_user_bookshelf_not_found(mock_valid, mock_collection):
     mock_valid.return_value = True
-    mock_collection.delete_one.return_value.deleted_count = 0
+    mock_collection.find_one_and_delete.return_value = None
 
     result = delete_user_bookshelf(VALID_USER_ID, VALID_BOOK_ID)
     assert result == "UserBookshelf entry not found."
@@ -556,10 +578,13 @@ def test_delete_user_bookshelf_invalid_objectid(mock_oid, mock_valid, mock_colle
 @patch("models.user_bookshelf.is_valid_object_id")
 def test_update_user_bookshelf_status_success(mock_valid, mock_collection):
     mock_valid.return_value = True
-    mock_collection.update_one.return_value.matched_count = 1
+    mock_collection.find_one_and_update.return_value = {"status": "to-read"}
 
     result = update_user_bookshelf_status(VALID_USER_ID, VALID_BOOK_ID, "read")
     assert result == "UserBookshelf status updated successfully."
+    # A date, like entries created through the schema, so the shelf sorts on it
+    fields = mock_collection.find_one_and_update.call_args[0][1]["$set"]
+    assert isinstance(fields["date_finished"], datetime)
 
 
 @patch("models.user_bookshelf.user_bookshelf_collection")
@@ -593,17 +618,23 @@ def test_update_user_bookshelf_status_invalid_status_value(mock_valid, mock_coll
 @patch("models.user_bookshelf.is_valid_object_id")
 def test_update_user_bookshelf_status_not_found(mock_valid, mock_collection):
     mock_valid.return_value = True
-    mock_collection.update_one.return_value.matched_count = 0
+    mock_collection.find_one_and_update.return_value = None
+    on_change = MagicMock()
 
-    result = update_user_bookshelf_status(VALID_USER_ID, VALID_BOOK_ID, "read")
+    result = update_user_bookshelf_status(
+        VALID_USER_ID, VALID_BOOK_ID, "read", on_change=on_change
+    )
     assert result == "UserBookshelf entry not found."
+    on_change.assert_not_called()
 
 
 @patch("models.user_bookshelf.user_bookshelf_collection")
 @patch("models.user_bookshelf.is_valid_object_id")
 def test_update_user_bookshelf_status_exception(mock_valid, mock_collection):
     mock_valid.return_value = True
-    mock_collection.update_one.side_effect = Exception("Simulated update failure")
+    mock_collection.find_one_and_update.side_effect = Exception(
+        "Simulated update failure"
+    )
 
     result = update_user_bookshelf_status(VALID_USER_ID, VALID_BOOK_ID, "read")
     assert result.startswith("Error: Simulated update failure")
@@ -634,3 +665,45 @@ def test_create_user_bookshelf_with_date_conversion(mock_valid, mock_collection)
         VALID_USER_ID, VALID_BOOK_ID, status="read", date_started=d, date_finished=d
     )
     assert result == "mock_id"
+
+
+@patch("models.user_bookshelf.user_bookshelf_collection")
+@patch("models.user_bookshelf.is_valid_object_id", return_value=True)
+def test_get_bookshelf_with_books_groups_shelves(mock_valid, mock_collection):
+    mock_collection.aggregate.return_value = [
+        {"status": "read", "book": {"title": "Newest", "rating": "pos"}},
+        {"status": "read", "book": {"title": "Older", "rating": "neg"}},
+        {"status": "currently-reading", "book": {"title": "Now", "page_number": 7}},
+    ]
+
+    shelves = get_bookshelf_with_books(VALID_USER_ID)
+
+    assert [b["title"] for b in shelves["read"]] == ["Newest", "Older"]
+    assert shelves["currently-reading"][0]["page_number"] == 7
+    assert shelves["to-read"] == []
+    pipeline = mock_collection.aggregate.call_args[0][0]
+    assert [list(stage)[0] for stage in pipeline] == [
+        "$match",
+        "$sort",
+        "$lookup",
+        "$unwind",
+        "$project",
+    ]
+    assert pipeline[0]["$match"]["user_id"] == ObjectId(VALID_USER_ID)
+    assert pipeline[2]["$lookup"]["pipeline"] == [
+        {"$project": {"embedding": 0, "summary": 0}}
+    ]
+
+
+@patch("models.user_bookshelf.user_bookshelf_collection")
+@patch("models.user_bookshelf.is_valid_object_id", return_value=True)
+def test_get_bookshelf_with_books_can_include_summary(mock_valid, mock_collection):
+    mock_collection.aggregate.return_value = []
+    get_bookshelf_with_books(VALID_USER_ID, include_summary=True)
+    pipeline = mock_collection.aggregate.call_args[0][0]
+    assert pipeline[2]["$lookup"]["pipeline"] == [{"$project": {"embedding": 0}}]
+
+
+@patch("models.user_bookshelf.is_valid_object_id", return_value=False)
+def test_get_bookshelf_with_books_invalid_user(mock_valid):
+    assert get_bookshelf_with_books("bad") == "Error: Invalid user_id."
@@ -362,15 +362,10 @@ def test_retrieve_genre_weights_default_empty_and_not_found(monkeypatch):
 
     # 1st call: valid user with empty genre_weights
     # 2nd call: raise InvalidId
-    mock_collection.find_one.side_effect = [{"genre_weights": {}}, InvalidId("invalid")]
-
-    monkeypatch.setattr(
-        users,
-        "ObjectId",
-        lambda x: (
-            ObjectId(x) if x != "notavalidid" else (_ for _ in ()).throw(InvalidId())
-        ),
-    )
+    mock_collection.find_one.side_effect = [
+        {"_id": ObjectId(user_id), "genre_weights": {}},
+        InvalidId("invalid"),
+    ]
 
     assert users.retrieve_genre_weights(user_id) == {}
     assert users.retrieve_genre_weights("notavalidid") == "User not found"
@@ -419,7 +414,7 @@ def test_retrieve_embedding_default_and_after_update():
     with patch("models.users.ObjectId", side_effect=safe_objectid), patch(
         "models.users.users_collection.find_one",
         side_effect=[
-            {"embedding": None},  # retrieve
+            {"_id": real_id, "embedding": None},  # retrieve
             None,  # update fake
             {"embedding": None},  # invalid type
             {"embedding": None},  # invalid element
@@ -502,28 +497,11 @@ def test_update_user_settings_trim_and_multi_field_update(mock_valid_user):
 
     uid = mock_valid_user
 
-    mock_user = {
-        "_id": ObjectId(uid),
-        "first_name": "Old",
-        "last_name": "Name",
-        "username": "olduser",
-        "email_address": "old@example.com",
-        "oauth": {"access_token": "tok", "refresh_token": "tok"},
-        "profile_image": "old.jpg",
-        "interests": [],
-        "demographics": {},
-        "genre_weights": {},
-        "embedding": [],
-    }
-
     with patch("mongo_id_utils.is_valid_object_id", return_value=True), patch(
         "models.users.read_user_by_username", return_value=None
     ), patch(
         "models.users.users_collection.find_one",
-        side_effect=[
-            mock_user,  # for fetching the user by ID
-            None,  # for username uniqueness check (no conflict)
-        ],
+        return_value=None,  # username uniqueness check (no conflict)
     ), patch(
         "models.users.users_collection.update_one",
         return_value=MagicMock(matched_count=1),
@@ -543,25 +521,11 @@ def test_update_user_settings_invalid_field_types(monkeypatch):
 
     uid = str(ObjectId())
 
-    mock_user = {
-        "_id": ObjectId(uid),
-        "first_name": "X",
-        "last_name": "Y",
-        "username": "mockuser",
-        "email_address": "x@example.com",
-        "oauth": {"access_token": "t", "refresh_token": "t"},
-        "profile_image": "",
-        "interests": [],
-        "demographics": {},
-        "genre_weights": {},
-        "embedding": [],
-    }
-
     mock_collection = MagicMock()
     monkeypatch.setattr(users, "users_collection", mock_collection)
 
-    # First call = find user by ID, second call = uniqueness check (returns None to simulate unique)
-    mock_collection.find_one.side_effect = [mock_user, None]
+    # Uniqueness check returns None to simulate a unique username
+    mock_collection.find_one.return_value = None
 
     # Username passed as int, should fail with .strip() AttributeError
     result = users.update_user_settings(uid, username=12345)
@@ -655,22 +619,40 @@ def test_update_user_validation_error_on_demographics(monkeypatch):
     assert result.startswith("Schema Validation Error:")
 
 
-def test_update_user_user_not_found():
-    with patch("models.users.users_collection.find_one", return_value=None):
-        result = update_user(str(ObjectId()), first_name="Test")
-        assert result == "Error: User not found."
+def test_update_user_user_not_found(mock_users_collection):
+    mock_users_collection.update_one.return_value = MagicMock(matched_count=0)
+    result = update_user(str(ObjectId()), first_name="Test")
+    assert result == "Error: User not found."
+    mock_users_collection.find_one.assert_not_called()
 
 
-def test_update_user_settings_user_not_found():
-    with patch("models.users.users_collection.find_one", return_value=None):
-        result = update_user_settings(str(ObjectId()), first_name="Test")
-        assert result == "Error: User not found."
+def test_update_user_sets_only_the_given_fields(mock_users_collection):
+    mock_users_collection.update_one.return_value = MagicMock(matched_count=1)
+    result = update_user(str(ObjectId()), last_name="Smith", unknown="x")
+    assert result == "User updated successfully."
+    update = mock_users_collection.update_one.call_args[0][1]
+    assert update == {"$set": {"last_name": "Smith"}}
 
 
-def test_update_genre_weights_user_not_found():
-    with patch("models.users.users_collection.find_one", return_value=None):
-        result = update_genre_weights(str(ObjectId()), {"fiction": 1.0})
-        assert result == "Error: User not found."
+def test_update_user_settings_user_not_found(mock_users_collection):
+    mock_users_collection.update_one.return_value = MagicMock(matched_count=0)
+    result = update_user_settings(str(ObjectId()), first_name="Test")
+    assert result == "Error: User not found."
+    mock_users_collection.find_one.assert_not_called()
+
+
+def test_update_genre_weights_user_not_found(mock_users_collection):
+    mock_users_collection.update_one.return_value = MagicMock(matched_count=0)
+    result = update_genre_weights(str(ObjectId()), {"fiction": 1.0})
+    assert result == "Error: User not found."
+    mock_users_collection.find_one.assert_not_called()
+
+
+def test_update_embedding_user_not_found_by_match(mock_users_collection):
+    mock_users_collection.update_one.return_value = MagicMock(matched_count=0)
+    result = update_embedding(str(ObjectId()), [0.1, 0.2])
+    assert result == "Error: User not found."
+    mock_users_collection.find_one.assert_not_called()
 
 
 def test_retrieve_embedding_user_not_found():
@@ -681,7 +663,8 @@ def test_retrieve_embedding_user_not_found():
 
 def test_retrieve_embedding_empty():
     with patch(
-        "models.users.users_collection.find_one", return_value={"embedding": []}
+        "models.users.users_collection.find_one",
+        return_value={"_id": ObjectId(), "embedding": []},
     ):
         result = retrieve_embedding(str(ObjectId()))
         assert result is None
@@ -793,6 +776,10 @@ def test_create_user_with_birthday(monkeypatch):
     )
 
     assert result == str(fake_id)
+    inserted = mock_collection.insert_one.call_args[0][0]
+    assert inserted["profile_version"] == 0
+    assert inserted["embedding_weight"] == 0
+    assert inserted["genre_weights"] == {}
 
 
 def test_update_genre_weights_unexpected_exception(monkeypatch):
@@ -801,9 +788,147 @@ def test_update_genre_weights_unexpected_exception(monkeypatch):
     user_id = str(ObjectId())
     genre_weights = {"fantasy": 2.5}
 
-    # Simulate unexpected error during find_one
+    # Simulate unexpected error during update_one
     monkeypatch.setattr(users, "users_collection", MagicMock())
-    users.users_collection.find_one.side_effect = Exception("database crashed")
+    users.users_collection.update_one.side_effect = Exception("database crashed")
 
     result = users.update_genre_weights(user_id, genre_weights)
     assert result == "Error: database crashed"
+
+
+def user_cache_patches(cached=None):
+    """Patch the shared Redis user cache in models.users; `cached` is its
+    {user id: document} contents."""
+    cached = {} if cached is None else cached
+    emails = {user["email_address"]: key for key, user in cached.items()}
+    return (
+        patch("models.users.read_cached_user", side_effect=lambda i: cached.get(i)),
+        patch("models.users.read_cached_user_id", side_effect=emails.get),
+        patch("models.users.cache_user"),
+        patch("models.users.drop_cached_user"),
+        patch("models.users.cache_user_id"),
+        patch("models.users.user_generation", return_value=0),
+    )
+
+
+def test_load_user_reads_mongo_once_per_request(mock_users_collection):
+    from main import app
+    from models.users import load_user, read_user_by_email, retrieve_genre_weights
+
+    user = {
+        "_id": ObjectId(),
+        "email_address": "reader@example.com",
+        "genre_weights": {"Fantasy": 1.0},
+    }
+    mock_users_collection.find_one.return_value = user
+    patches = user_cache_patches()
+    with patches[0], patches[1], patches[3], patches[5]:
+        with patches[2] as cache_user, patches[4] as cache_user_id:
+            with app.test_request_context("/"):
+                app.preprocess_request()
+                assert read_user_by_email("reader@example.com") != "User not found."
+                weights = retrieve_genre_weights(str(user["_id"]))
+                weights["Fantasy"] = 5.0  # a copy: the loaded user is untouched
+                assert load_user(str(user["_id"]))["genre_weights"] == {"Fantasy": 1.0}
+
+    mock_users_collection.find_one.assert_called_once_with(
+        {"email_address": "reader@example.com"}
+    )
+    # Read by email before the id was known: only the pointer is cached
+    cache_user.assert_not_called()
+    cache_user_id.assert_called_once_with("reader@example.com", user["_id"])
+
+
+def test_load_user_fills_the_cache_only_for_its_generation(mock_users_collection):
+    from models.users import load_user
+
+    user_id = ObjectId()
+    user = {"_id": user_id, "email_address": "reader@example.com"}
+    generations = []
+
+    def find_one(query):
+        # A write lands while the document is being read
+        generations.append("read")
+        return user
+
+    mock_users_collection.find_one.side_effect = find_one
+    patches = user_cache_patches()
+    with patches[0], patches[1] as read_cached_user_id, patches[2] as cache_user:
+        with patches[3], patches[4], patch(
+            "models.users.user_generation",
+            side_effect=lambda i: generations.append(i) or 7,
+        ):
+            assert load_user(str(user_id)) == user
+            read_cached_user_id.side_effect = {"reader@example.com": str(user_id)}.get
+            assert load_user(email="reader@example.com") == user
+
+    # The generation is read before Mongo, and the fill is checked against it
+    assert generations == [str(user_id), "read", str(user_id), "read"]
+    assert cache_user.call_args_list == [((user, 7),), ((user, 7),)]
+
+
+def test_load_user_uses_the_shared_cache_and_writes_drop_it(mock_users_collection):
+    from main import app
+    from models.users import add_interest, load_user
+
+    user_id = ObjectId()
+    user = {"_id": user_id, "email_address": "reader@example.com"}
+    patches = user_cache_patches({str(user_id): user})
+    with patches[0], patches[1], patches[2], patches[3] as drop_cached_user, patches[5]:
+        with app.test_request_context("/"):
+            app.preprocess_request()
+            assert load_user(email="reader@example.com") == user
+            mock_users_collection.find_one.assert_not_called()
+
+            add_interest(str(user_id), "Poetry")
+            drop_cached_user.assert_called_once_with(str(user_id))
+            mock_users_collection.find_one.return_value = {**user, "interests": ["x"]}
+            # The request table no longer holds the stale document
+            with patch("models.users.read_cached_user", return_value=None):
+                assert load_user(str(user_id))["interests"] == ["x"]
+    query = mock_users_collection.find_one.call_args[0][0]
+    assert query == {"_id": user_id}
+
+
+def test_load_user_misses_are_not_remembered(mock_users_collection):
+    from models.users import load_user
+
+    mock_users_collection.find_one.side_effect = [None, {"_id": ObjectId()}]
+    patches = user_cache_patches()
+    with patches[0], patches[1], patches[2], patches[3], patches[4], patches[5]:
+        assert load_user(email="new@example.com") is None
+        assert load_user(email="new@example.com") is not None
+
+
+def test_save_profile_records_applied_events_in_the_versioned_write(
+    mock_users_collection,
+):
+    from models.users import APPLIED_SHELF_EVENTS_KEPT, save_profile
+
+    profile = {
+        "_id": ObjectId(),
+        "genre_weights": {"Drama": 1},
+        "embedding": [],
+        "embedding_weight": 0,
+        "profile_version": 4,
+    }
+    mock_users_collection.update_one.return_value.matched_count = 1
+    with patch("models.users.forget_user"):
+        assert save_profile(profile, applied_events=["e1"]) == 5
+        query, update = mock_users_collection.update_one.call_args[0]
+        assert query == {"_id": profile["_id"], "profile_version": 4}
+        assert update["$push"] == {
+            "applied_shelf_events": {
+                "$each": ["e1"],
+                "$slice": -APPLIED_SHELF_EVENTS_KEPT,
+            }
+        }
+
+        save_profile(profile, rebuilt_at=100.0)
+        update = mock_users_collection.update_one.call_args[0][1]
+        assert "$push" not in update
+        assert update["$set"]["shelf_rebuilt_at"] == 100.0
+        assert update["$set"]["applied_shelf_events"] == []
+
+        mock_users_collection.update_one.return_value.matched_count = 0
+        assert save_profile(profile) is None
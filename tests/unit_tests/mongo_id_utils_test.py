@@ -0,0 +1,87 @@
+from unittest.mock import MagicMock, patch
+from bson import ObjectId
+import mongo_id_utils
+from mongo_id_utils import (
+    canonical_id,
+    clear_existence_cache,
+    forget_object_id,
+    is_object_id,
+    is_valid_object_id,
+)
+
+
+def fake_collections(**found):
+    collections = {}
+    for name, document in found.items():
+        collection = MagicMock()
+        collection.find_one.return_value = document
+        collections[name] = collection
+    return collections
+
+
+def test_is_object_id_needs_no_query():
+    assert is_object_id(ObjectId())
+    assert is_object_id(str(ObjectId()))
+    assert not is_object_id("notanid")
+    assert not is_object_id(None)
+
+
+def test_malformed_ids_are_rejected_without_a_query():
+    collections = fake_collections(Users={"_id": 1})
+    with patch.dict(mongo_id_utils.collections, collections):
+        assert is_valid_object_id("Users", "notanid") is False
+    collections["Users"].find_one.assert_not_called()
+
+
+def test_canonical_id_is_the_stored_objectid():
+    oid = ObjectId()
+    assert canonical_id(oid) is oid
+    assert canonical_id(str(oid)) == oid
+    assert canonical_id("notanid") is None
+    assert canonical_id(None) is None
+
+
+def test_users_are_looked_up_by_their_objectid():
+    user_id = str(ObjectId())
+    collections = fake_collections(Users={"_id": ObjectId(user_id)})
+    clear_existence_cache()
+    with patch.dict(mongo_id_utils.collections, collections):
+        assert is_valid_object_id("Users", user_id) is True
+    query, projection = collections["Users"].find_one.call_args[0]
+    assert query == {"_id": ObjectId(user_id)}
+    assert projection == {"_id": 1}
+    clear_existence_cache()
+
+
+def test_hits_are_cached_until_they_expire_or_are_forgotten():
+    book_id = str(ObjectId())
+    collections = fake_collections(Books={"_id": ObjectId(book_id)})
+    clear_existence_cache()
+    with patch.dict(mongo_id_utils.collections, collections):
+        assert is_valid_object_id("Books", book_id)
+        assert is_valid_object_id("Books", ObjectId(book_id))
+        assert collections["Books"].find_one.call_count == 1
+
+        forget_object_id("Books", book_id)
+        collections["Books"].find_one.return_value = None
+        assert is_valid_object_id("Books", book_id) is False
+
+        collections["Books"].find_one.return_value = {"_id": ObjectId(book_id)}
+        assert is_valid_object_id("Books", book_id)
+        with patch("mongo_id_utils.time.monotonic", return_value=float("inf")):
+            assert is_valid_object_id("Books", book_id)
+        assert collections["Books"].find_one.call_count == 4
+    clear_existence_cache()
+
+
+def test_misses_and_other_collections_are_not_cached():
+    post_id = str(ObjectId())
+    collections = fake_collections(Posts={"_id": ObjectId(post_id)}, Users=None)
+    clear_existence_cache()
+    with patch.dict(mongo_id_utils.collections, collections):
+        assert is_valid_object_id("Posts", post_id)
+        assert is_valid_object_id("Posts", post_id)
+        assert not is_valid_object_id("Users", post_id)
+        assert not is_valid_object_id("Users", post_id)
+    assert collections["Posts"].find_one.call_count == 2
+    assert collections["Users"].find_one.call_count == 2
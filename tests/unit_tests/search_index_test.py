@@ -0,0 +1,222 @@
+from unittest.mock import patch
+import numpy as np
+import search_index
+from ann_search import ExactSearch
+from book_index import BookIndex
+from load_books import BookCollection
+from catalog_factories import make_book, unit
+from embedding_service import EmbeddingUnavailable
+from search_index import (
+    SearchIndex,
+    SortedTerms,
+    bounded_levenshtein,
+    encode_query,
+    ranked_search,
+    tokenize,
+)
+
+
+def build(*books):
+    index = SearchIndex()
+    index.build(books)
+    return index
+
+
+def test_tokenize_lowercases_and_strips_accents():
+    assert tokenize("Les Misérables, Vol. 1") == ["les", "miserables", "vol", "1"]
+    assert tokenize(["J.K. Rowling", None]) == ["j", "k", "rowling"]
+    assert tokenize(None) == []
+
+
+def test_sorted_terms_prefix_range():
+    terms = SortedTerms(["harry", "hare", "harbor", "potter", "har"])
+    assert terms.with_prefix("har") == ["har", "harbor", "hare", "harry"]
+    terms.discard("hare")
+    assert terms.with_prefix("hare") == []
+
+
+def test_title_matches_rank_above_author_matches():
+    by_title = make_book("Austen Country", ["Someone Else"])
+    by_author = make_book("Emma", ["Jane Austen"])
+    index = build(by_author, by_title)
+
+    total, ids = index.search("austen ")
+    assert total == 2
+    assert ids == [by_title["_id"], by_author["_id"]]
+    assert index.search("austen ", "author") == (1, [by_author["_id"]])
+
+
+def test_last_token_is_a_prefix_and_all_tokens_must_match():
+    stone = make_book("Harry Potter and the Philosopher's Stone", ["J.K. Rowling"])
+    chamber = make_book("Harry Potter and the Chamber of Secrets", ["J.K. Rowling"])
+    harbor = make_book("Harbor Lights", ["A. Writer"])
+    index = build(stone, chamber, harbor)
+
+    assert set(index.search("harry pot")[1]) == {stone["_id"], chamber["_id"]}
+    assert index.search("harry potter cham")[1] == [chamber["_id"]]
+    # A finished word is not expanded
+    assert index.search("har ")[0] == 0
+
+
+def test_isbn_lookup_exact_and_partial():
+    book = make_book(
+        "Dune", ["Frank Herbert"], isbn="0-441-17271-7", isbn13="978-0441172719"
+    )
+    index = build(book, make_book("Emma", ["Jane Austen"], isbn="0141439580"))
+
+    assert index.search("0441172717", "isbn") == (1, [book["_id"]])
+    assert index.search("9780441", "isbn") == (1, [book["_id"]])
+    assert index.search("978-0441172719") == (1, [book["_id"]])
+
+
+def test_partial_isbns_do_not_outrank_title_matches():
+    orwell = make_book("1984", ["George Orwell"], isbn="0451524934")
+    by_isbn = make_book("Some Novel", ["A. Writer"], isbn="1984801234")
+    index = build(by_isbn, orwell)
+
+    assert index.search("1984") == (2, [orwell["_id"], by_isbn["_id"]])
+    # A full-length ISBN still goes first
+    assert index.search("1984801234")[1] == [by_isbn["_id"]]
+
+
+def test_bounded_levenshtein_stops_past_the_bound():
+    assert bounded_levenshtein("potter", "poter", 2) == 1
+    assert bounded_levenshtein("kitten", "sitting", 3) == 3
+    assert bounded_levenshtein("kitten", "sitting", 1) == 2
+    assert bounded_levenshtein("dune", "dunes", 0) == 1
+
+
+def test_misspelled_words_match_through_trigrams():
+    stone = make_book("Harry Potter and the Philosopher's Stone", ["J.K. Rowling"])
+    pride = make_book("Pride and Prejudice", ["Jane Austen"])
+    index = build(stone, pride, make_book("Emma", ["Jane Austen"]))
+
+    assert index.search("hary poter ")[1] == [stone["_id"]]
+    assert index.search("prejudise")[1] == [pride["_id"]]
+    assert index.search("jane austin", "author")[0] == 2
+    # Short words allow one edit at most, and two-letter words none
+    assert index.search("emx ")[0] == 0
+    assert index.search("xm ")[0] == 0
+
+
+def test_exact_matches_outrank_typo_matches():
+    exact = make_book("Dune", ["Frank Herbert"])
+    near = make_book("Dunk", ["Someone"])
+    index = build(exact, near)
+    assert sorted(index.fuzzy_terms("dunx")) == [("dune", 1), ("dunk", 1)]
+    assert index.search("dune ")[1] == [exact["_id"]]
+
+
+def test_titles_are_indexed_without_edition_noise():
+    book = make_book("Dune (Deluxe Edition)", ["Frank Herbert"])
+    index = build(book)
+    assert "deluxe" not in index.vocabulary
+    assert index.search("dune") == (1, [book["_id"]])
+
+
+def test_pagination_slices_the_ranking():
+    books = [make_book(f"Saga part {i}", ["Author"]) for i in range(5)]
+    index = build(*books)
+    total, first = index.search("saga", offset=0, limit=2)
+    _, rest = index.search("saga", offset=2, limit=10)
+    assert total == 5
+    assert len(first) == 2 and len(rest) == 3
+    assert not set(first) & set(rest)
+
+
+def test_upsert_and_remove_keep_postings_consistent():
+    book = make_book("Old Title", ["Author"])
+    index = build(book)
+    index.upsert({**book, "title": "New Title"})
+
+    assert index.search("old ")[0] == 0
+    assert index.search("new ")[1] == [book["_id"]]
+    index.remove(book["_id"])
+    assert len(index) == 0
+    assert index.vocabulary.terms == []
+    assert index.total_length == {"title": 0, "author": 0}
+
+
+def test_catalog_changes_reach_the_built_index(tmp_path):
+    book = make_book("Dune", ["Frank Herbert"], isbn="0441172717")
+    with patch("load_books.books_collection.find", return_value=[book]):
+        catalog = BookCollection(cache_file=str(tmp_path / "books_cache.json"))
+    try:
+        with patch("load_books.get_catalog", return_value=catalog):
+            index = search_index.get_search_index()
+        assert index.search("dune") == (1, [book["_id"]])
+
+        added = make_book("Dune Messiah", ["Frank Herbert"])
+        catalog.apply_upsert(added)
+        assert index.search("messiah") == (1, [added["_id"]])
+        catalog.apply_delete(book["_id"])
+        assert index.search("0441172717")[0] == 0
+    finally:
+        search_index.reset_search_index()
+
+
+def test_query_embeddings_are_cached_and_read_only():
+    search_index._encode_query.cache_clear()
+    with patch("embedding_service.encode_texts") as encode_texts:
+        encode_texts.return_value = [np.array([3.0, 4.0], dtype=np.float32)]
+        first = encode_query("Space  Opera")
+        second = encode_query("space opera")
+    encode_texts.assert_called_once_with(["space opera"])
+    assert second is first
+    assert np.allclose(first, [0.6, 0.8])
+    assert not first.flags.writeable
+    search_index._encode_query.cache_clear()
+
+
+def test_queries_are_not_encoded_without_a_worker():
+    search_index._encode_query.cache_clear()
+    with patch(
+        "embedding_service.encode_texts",
+        side_effect=EmbeddingUnavailable("No embedding worker answered in time"),
+    ) as encode_texts:
+        assert encode_query("dune") is None
+        assert encode_query("dune") is None
+    # Failures are not cached, so a worker that comes back is used at once
+    assert encode_texts.call_count == 2
+
+
+def semantic_fixture(*books):
+    book_index = BookIndex(search_engine=ExactSearch())
+    book_index.build(books)
+    lexical = SearchIndex()
+    lexical.build(books)
+    return book_index, lexical
+
+
+def test_semantic_search_ranks_by_embedding_similarity():
+    space = make_book("Dune", ["Frank Herbert"], axis=0)
+    near = make_book("Hyperion", ["Dan Simmons"], axis=1)
+    far = make_book("Emma", ["Jane Austen"], axis=2)
+    book_index, _ = semantic_fixture(far, near, space)
+
+    with patch("search_index.encode_query", return_value=unit(0, 0, 1)), patch(
+        "book_index.get_book_index", return_value=book_index
+    ):
+        total, ids = ranked_search("desert planet", "semantic")
+    # Orthogonal books share nothing with the query and are left out
+    assert (total, ids) == (2, [space["_id"], near["_id"]])
+
+
+def test_hybrid_search_blends_lexical_and_semantic_scores():
+    semantic_only = make_book("Hyperion", ["Dan Simmons"], axis=0)
+    both = make_book("Dune Messiah", ["Frank Herbert"], axis=0)
+    lexical_only = make_book("Dune", ["Frank Herbert"])
+    book_index, lexical = semantic_fixture(semantic_only, both, lexical_only)
+
+    with patch("search_index.encode_query", return_value=unit(0)), patch(
+        "book_index.get_book_index", return_value=book_index
+    ):
+        total, ids = ranked_search("dune", "hybrid", lexical)
+    assert total == 3
+    assert ids[0] == both["_id"]
+    assert set(ids[1:]) == {semantic_only["_id"], lexical_only["_id"]}
+
+
+def test_ranked_search_without_a_model():
+    with patch("search_index.encode_query", return_value=None):
+        assert ranked_search("dune", "semantic") is None
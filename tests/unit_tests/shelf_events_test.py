@@ -0,0 +1,144 @@
+from unittest.mock import MagicMock, patch
+import shelf_events
+from shelf_events import (
+    ProfileWorker,
+    decode_event,
+    encode_event,
+    group_by_user,
+    publish_shelf_event,
+)
+
+
+def test_encode_decode_round_trip():
+    fields = encode_event(
+        "u1", "b1", None, {"status": "read", "rating": "pos", "page_number": 3}
+    )
+    raw = {k.encode(): v.encode() for k, v in fields.items()}
+
+    event = decode_event(raw)
+    assert event == {
+        "user_id": "u1",
+        "book_id": "b1",
+        "old": None,
+        "new": {"status": "read", "rating": "pos"},
+        "event_id": fields["event_id"],
+        "published_at": float(fields["published_at"]),
+    }
+    assert encode_event("u1", "b1", None, None)["event_id"] != fields["event_id"]
+
+
+def test_events_queued_before_ids_decode_without_them():
+    event = decode_event(
+        {b"user_id": b"u1", b"book_id": b"b1", b"old": b"", b"new": b""}
+    )
+    assert event["event_id"] is None
+    assert event["published_at"] == 0
+
+
+def test_group_by_user_keeps_write_order():
+    events = [
+        {"user_id": "a", "book_id": "1", "old": None, "new": {"status": "read"}},
+        {"user_id": "b", "book_id": "2", "old": None, "new": None},
+        {"user_id": "a", "book_id": "1", "old": {"status": "read"}, "new": None},
+    ]
+    grouped = group_by_user(events)
+    assert list(grouped) == ["a", "b"]
+    assert grouped["a"] == [events[0], events[2]]
+
+
+@patch("shelf_events.start_profile_worker")
+@patch("shelf_events.redis_client")
+def test_publish_falls_back_to_local_queue(mock_redis, mock_start):
+    mock_redis.xadd.side_effect = ConnectionError("down")
+    # A mock queue, so a worker thread left running by another test cannot
+    # take the event first
+    local = MagicMock()
+    local.get_nowait.side_effect = shelf_events.queue.Empty
+    with patch.object(shelf_events, "local_events", local):
+        publish_shelf_event("u1", "b1", None, {"status": "to-read"})
+    local.put.assert_called_once()
+    assert local.put.call_args[0][0]["new"] == {"status": "to-read"}
+    mock_start.assert_called_once()
+
+
+@patch("shelf_events.apply_shelf_events", return_value="Profile updated successfully.")
+@patch("shelf_events.redis_client")
+def test_worker_batches_by_user_and_acks(mock_redis, mock_apply):
+    messages = [
+        (b"1-0", encode_event("u1", "b1", None, {"status": "to-read"})),
+        (b"1-1", encode_event("u2", "b2", None, {"status": "to-read"})),
+        (b"1-2", encode_event("u1", "b3", None, {"status": "to-read"})),
+    ]
+    mock_redis.xreadgroup.return_value = [[b"shelf_events", messages]]
+
+    worker = ProfileWorker(consumer_name="test")
+    with patch.object(shelf_events, "local_events", shelf_events.queue.Queue()):
+        assert worker.run_once() == 3
+
+    assert mock_apply.call_count == 2
+    assert [len(c[0][1]) for c in mock_apply.call_args_list] == [2, 1]
+    mock_redis.xack.assert_called_once_with(
+        "shelf_events", "profile-workers", b"1-0", b"1-1", b"1-2"
+    )
+
+
+@patch("shelf_events.apply_shelf_events", return_value="Profile updated successfully.")
+@patch("shelf_events.redis_client")
+def test_worker_drains_local_queue_when_redis_is_down(mock_redis, mock_apply):
+    mock_redis.xgroup_create.side_effect = ConnectionError("down")
+    local = shelf_events.queue.Queue()
+    event = {"user_id": "u1", "book_id": "b1", "old": None, "new": None}
+    local.put(event)
+
+    worker = ProfileWorker(consumer_name="test")
+    with patch.object(shelf_events, "local_events", local):
+        assert worker.run_once(block_ms=0) == 1
+
+    mock_apply.assert_called_once_with("u1", [event])
+    mock_redis.xack.assert_not_called()
+
+
+@patch("shelf_events.apply_shelf_events")
+@patch("shelf_events.redis_client")
+def test_failed_updates_stay_pending(mock_redis, mock_apply):
+    results = {
+        "u1": "Error: Profile update conflicted too many times.",
+        "u2": "Profile updated successfully.",
+        "u3": "Error: User not found.",
+    }
+    mock_apply.side_effect = lambda user_id, changes: results[user_id]
+    messages = [
+        (b"1-0", encode_event("u1", "b1", None, {"status": "read"})),
+        (b"1-1", encode_event("u2", "b2", None, {"status": "read"})),
+        (b"1-2", encode_event("u3", "b3", None, {"status": "read"})),
+    ]
+    mock_redis.xreadgroup.return_value = [[b"shelf_events", messages]]
+
+    worker = ProfileWorker(consumer_name="test")
+    with patch.object(shelf_events, "local_events", shelf_events.queue.Queue()):
+        assert worker.run_once(block_ms=0) == 3
+
+    # u1 is retried later; u3 can never succeed, so it is dropped
+    mock_redis.xack.assert_called_once_with(
+        "shelf_events", "profile-workers", b"1-1", b"1-2"
+    )
+
+
+@patch("shelf_events.apply_shelf_events", return_value="Profile updated successfully.")
+@patch("shelf_events.redis_client")
+def test_stale_pending_events_are_claimed_and_retried(mock_redis, mock_apply):
+    claimed = [(b"1-0", encode_event("u1", "b1", None, {"status": "read"}))]
+    mock_redis.xautoclaim.return_value = [b"0-0", claimed, []]
+
+    worker = ProfileWorker(consumer_name="test")
+    worker.stream_cursor = ">"
+    with patch.object(shelf_events, "local_events", shelf_events.queue.Queue()):
+        assert worker.run_once(block_ms=0) == 1
+        mock_redis.xreadgroup.return_value = []
+        worker.run_once(block_ms=0)
+
+    mock_apply.assert_called_once_with("u1", [decode_event(claimed[0][1])])
+    mock_redis.xack.assert_called_once_with("shelf_events", "profile-workers", b"1-0")
+    # The pending list was scanned to the end, so the next read is a new one
+    assert mock_redis.xautoclaim.call_count == 1
+    mock_redis.xreadgroup.assert_called_once()
@@ -0,0 +1,236 @@
+import numpy as np
+from unittest.mock import patch
+from bson import ObjectId
+import user_profile
+from user_profile import apply_entry_change, shelf_contribution
+
+
+def empty_profile(version=1):
+    return {
+        "_id": ObjectId(),
+        "genre_weights": {},
+        "embedding": [],
+        "embedding_weight": 0,
+        "profile_version": version,
+        "applied_shelf_events": [],
+        "shelf_rebuilt_at": None,
+    }
+
+
+def change(book_id, old, new, event_id=None, published_at=0):
+    return {
+        "book_id": book_id,
+        "old": old,
+        "new": new,
+        "event_id": event_id,
+        "published_at": published_at,
+    }
+
+
+def book(genres, value):
+    return {"_id": ObjectId(), "genre_tags": genres, "embedding": [value] * 384}
+
+
+def test_shelf_contribution_by_status_and_rating():
+    assert shelf_contribution(None) == (0, 0)
+    assert shelf_contribution({"status": "read", "rating": "pos"}) == (1, 1)
+    assert shelf_contribution({"status": "read", "rating": "neg"}) == (-1, 0)
+    assert shelf_contribution({"status": "read", "rating": "mid"}) == (0, 0)
+    assert shelf_contribution({"status": "to read", "rating": "mid"}) == (0.5, 1)
+    assert shelf_contribution({"status": "currently-reading"}) == (0, 0)
+
+
+def test_add_then_delete_restores_profile():
+    profile = empty_profile()
+    fantasy = book(["Fantasy"], 0.2)
+    mystery = book(["Mystery"], 0.6)
+
+    apply_entry_change(profile, fantasy, None, {"status": "read", "rating": "pos"})
+    apply_entry_change(profile, mystery, None, {"status": "to-read"})
+    assert profile["genre_weights"] == {"Fantasy": 1, "Mystery": 0.5}
+    assert profile["embedding_weight"] == 2
+    assert np.allclose(profile["embedding"], [0.4] * 384)
+
+    apply_entry_change(profile, mystery, {"status": "to-read"}, None)
+    assert profile["genre_weights"] == {"Fantasy": 1, "Mystery": 0}
+    assert np.allclose(profile["embedding"], [0.2] * 384)
+
+    apply_entry_change(profile, fantasy, {"status": "read", "rating": "pos"}, None)
+    assert profile["embedding"] == []
+    assert profile["embedding_weight"] == 0
+
+
+def test_rating_change_applies_only_the_delta():
+    profile = empty_profile()
+    drama = book(["Drama"], 0.3)
+    read_pos = {"status": "read", "rating": "pos"}
+
+    apply_entry_change(profile, drama, None, read_pos)
+    apply_entry_change(profile, drama, read_pos, {**read_pos, "rating": "neg"})
+
+    assert profile["genre_weights"] == {"Drama": -1}
+    assert profile["embedding"] == []
+
+
+@patch("user_profile.cache_profile_embedding")
+@patch("user_profile.save_profile", side_effect=[None, 3])
+@patch("user_profile.retrieve_profile")
+@patch("user_profile.books_collection.find")
+def test_apply_shelf_event_retries_on_version_conflict(
+    mock_find, mock_profile, mock_save, mock_cache
+):
+    horror = book(["Horror"], 0.1)
+    mock_find.return_value = [horror]
+    mock_profile.side_effect = lambda uid: empty_profile(version=2)
+
+    result = user_profile.apply_shelf_event(
+        "user", str(horror["_id"]), None, {"status": "to-read"}
+    )
+
+    assert result == "Profile updated successfully."
+    assert mock_save.call_count == 2
+    saved = mock_save.call_args[0][0]
+    assert saved["genre_weights"] == {"Horror": 0.5}
+    mock_cache.assert_called_once()
+
+
+@patch("user_profile.cache_profile_embedding")
+@patch("user_profile.rebuild_user_profile", return_value="rebuilt")
+@patch("user_profile.save_profile", return_value=2)
+@patch("user_profile.retrieve_profile")
+@patch("user_profile.books_collection.find")
+def test_legacy_rebuild_drops_events_published_before_it(
+    mock_find, mock_profile, mock_save, mock_rebuild, mock_cache
+):
+    scifi = book(["Sci-Fi"], 0.1)
+    mock_find.return_value = [scifi]
+    rebuilt = {**empty_profile(version=1), "shelf_rebuilt_at": 100.0}
+    mock_profile.side_effect = [empty_profile(version=None), rebuilt]
+
+    result = user_profile.apply_shelf_events(
+        "user",
+        [
+            change(str(scifi["_id"]), None, {"status": "to-read"}, "e1", 99.0),
+            change(str(scifi["_id"]), {"status": "to-read"}, None, "e2", 101.0),
+        ],
+    )
+
+    mock_rebuild.assert_called_once_with("user")
+    assert result == "Profile updated successfully."
+    # Only the removal published after the rebuild is applied
+    saved = mock_save.call_args[0][0]
+    assert saved["genre_weights"] == {"Sci-Fi": -0.5}
+    assert mock_save.call_args[1] == {"applied_events": ["e2"]}
+
+    mock_profile.side_effect = [empty_profile(version=None), rebuilt]
+    mock_save.reset_mock()
+    result = user_profile.apply_shelf_events(
+        "user", [change(str(scifi["_id"]), None, {"status": "read"}, "e1", 99.0)]
+    )
+    assert result == "Profile already up to date."
+    mock_save.assert_not_called()
+
+
+@patch("user_profile.cache_profile_embedding")
+@patch("user_profile.save_profile", return_value=3)
+@patch("user_profile.retrieve_profile")
+@patch("user_profile.books_collection.find")
+def test_redelivered_events_are_applied_once(
+    mock_find, mock_profile, mock_save, mock_cache
+):
+    horror = book(["Horror"], 0.1)
+    mock_find.return_value = [horror]
+    mock_profile.return_value = {
+        **empty_profile(version=2),
+        "applied_shelf_events": ["e1"],
+    }
+
+    result = user_profile.apply_shelf_events(
+        "user",
+        [
+            change(str(horror["_id"]), None, {"status": "to-read"}, "e1"),
+            change(str(horror["_id"]), {"status": "to-read"}, None, "e2"),
+        ],
+    )
+
+    assert result == "Profile updated successfully."
+    assert mock_save.call_args[0][0]["genre_weights"] == {"Horror": -0.5}
+    assert mock_save.call_args[1] == {"applied_events": ["e2"]}
+
+
+@patch("user_profile.cache_profile_embedding")
+@patch("user_profile.save_profile", return_value=1)
+@patch("user_profile.books_collection.find")
+@patch("user_profile.get_user_bookshelf")
+@patch("user_profile.retrieve_profile")
+def test_rebuild_user_profile_uses_one_book_query(
+    mock_profile, mock_shelf, mock_find, mock_save, mock_cache
+):
+    fantasy, romance = book(["Fantasy"], 0.2), book(["Romance"], 0.4)
+    mock_profile.return_value = {
+        **empty_profile(version=None),
+        "genre_weights": {"Stale": 5},
+    }
+    mock_shelf.return_value = [
+        {"book_id": fantasy["_id"], "status": "read", "rating": "pos"},
+        {"book_id": romance["_id"], "status": "read", "rating": "neg"},
+    ]
+    mock_find.return_value = [fantasy, romance]
+
+    assert user_profile.rebuild_user_profile("user") == "Profile rebuilt successfully."
+
+    mock_find.assert_called_once()
+    saved = mock_save.call_args[0][0]
+    assert saved["profile_version"] is None
+    assert mock_save.call_args[1]["rebuilt_at"] is not None
+    assert saved["genre_weights"] == {"Fantasy": 1, "Romance": -1}
+    assert np.allclose(saved["embedding"], [0.2] * 384)
+
+
+@patch("user_profile.cache_profile_embedding")
+@patch("user_profile.save_profile", return_value=4)
+@patch("user_profile.retrieve_profile", side_effect=lambda uid: empty_profile(3))
+@patch("user_profile.books_collection.find")
+def test_apply_shelf_events_saves_batch_once(
+    mock_find, mock_profile, mock_save, mock_cache
+):
+    fantasy, mystery = book(["Fantasy"], 0.2), book(["Mystery"], 0.6)
+    mock_find.return_value = [fantasy, mystery]
+    read_pos = {"status": "read", "rating": "pos"}
+
+    result = user_profile.apply_shelf_events(
+        "user",
+        [
+            change(str(fantasy["_id"]), None, {"status": "to-read"}, "e1"),
+            change(str(mystery["_id"]), None, read_pos, "e2"),
+            change(str(fantasy["_id"]), {"status": "to-read"}, read_pos, "e3"),
+            change("not-an-id", None, read_pos, "e4"),
+        ],
+    )
+
+    assert result == "Profile updated successfully."
+    mock_find.assert_called_once()
+    mock_save.assert_called_once()
+    saved = mock_save.call_args[0][0]
+    assert saved["genre_weights"] == {"Fantasy": 1, "Mystery": 1}
+    assert np.allclose(saved["embedding"], [0.4] * 384)
+    assert mock_save.call_args[1] == {"applied_events": ["e1", "e2", "e3"]}
+
+
+@patch("user_profile.cache_profile_embedding")
+@patch("user_profile.save_profile", side_effect=[None, 2])
+@patch("user_profile.retrieve_profile")
+def test_add_genre_interests_retries_on_conflict(mock_profile, mock_save, mock_cache):
+    mock_profile.side_effect = [
+        {**empty_profile(0), "genre_weights": {"Fantasy": 1}},
+        {**empty_profile(1), "genre_weights": {"Fantasy": 1, "Drama": -1}},
+    ]
+
+    result = user_profile.add_genre_interests("user", ["Fantasy", "Sci-Fi"])
+
+    assert result == "Genre weights updated successfully."
+    assert mock_save.call_count == 2
+    saved = mock_save.call_args[0][0]
+    assert saved["profile_version"] == 1
+    assert saved["genre_weights"] == {"Fantasy": 2, "Drama": -1, "Sci-Fi": 1}
+    mock_cache.assert_called_once()